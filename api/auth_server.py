@@ -5,6 +5,7 @@ import urllib.parse
 import requests
 import webbrowser
 from api import config
+from api.token_store import build_token_store, TokenState
 
 APP_ID = config.APP_ID
 APP_SECRET = config.APP_SECRET
@@ -58,8 +59,9 @@ async def callback(request: Request):
             refresh_token = token_data.get("refresh_token")
             
             # Save the refresh_token for later use
-            with open("refresh_token.txt", "w") as f:
-                f.write(refresh_token)
+            store = build_token_store()
+            with store.lock():
+                store.save(TokenState(refresh_token))
             
             # Return the success HTML page
             with open("auth_success.html", "r", encoding="utf-8") as f:
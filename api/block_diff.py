@@ -0,0 +1,139 @@
+import difflib
+import hashlib
+import json
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from .markdown_render import TEXT_KEYS
+
+# Text element style keys that carry content-relevant formatting
+_INLINE_STYLE_KEYS = ('bold', 'italic', 'strikethrough', 'underline', 'inline_code', 'link')
+
+# Max requests per batch_update call
+MAX_BATCH_UPDATE_REQUESTS = 200
+
+
+def _normalize_elements(elements: List[Dict]) -> List:
+    normalized = []
+    for element in elements:
+        if 'text_run' in element:
+            run = element['text_run']
+            style = run.get('text_element_style') or {}
+            normalized.append(('t', run.get('content', ''),
+                               tuple((k, json.dumps(style[k], sort_keys=True)) for k in _INLINE_STYLE_KEYS if style.get(k))))
+        else:
+            # mentions, equations, ...: compare everything but volatile ids
+            kind, value = next(iter(element.items()))
+            normalized.append((kind, json.dumps(value, sort_keys=True)))
+    return normalized
+
+
+def _normalize_style(style: Optional[Dict]) -> str:
+    # Drop defaults (falsy values and left alignment) so converted and stored blocks agree
+    style = {k: v for k, v in (style or {}).items() if v and not (k == 'align' and v == 1)}
+    return json.dumps(style, sort_keys=True)
+
+
+def block_content(block: Dict) -> Tuple:
+    """The parts of a block that describe what it shows, without ids or tree links."""
+    bt = block.get('block_type')
+    key = TEXT_KEYS.get(bt)
+    if key is not None:
+        payload = block.get(key, {})
+        return (bt, _normalize_style(payload.get('style')), tuple(_normalize_elements(payload.get('elements', []))))
+    payload = {k: v for k, v in block.items() if k not in ('block_id', 'parent_id', 'children', 'comment_ids')}
+    return (bt, json.dumps(payload, sort_keys=True))
+
+
+def block_fingerprint(block: Dict, block_map: Optional[Mapping[str, Dict]] = None) -> str:
+    """
+    Content hash of a block. With `block_map`, the hash also covers every descendant
+    (computed iteratively, so deep trees are fine).
+    """
+    if not block_map or not block.get('children'):
+        return hashlib.sha1(repr(block_content(block)).encode('utf-8')).hexdigest()
+
+    # Post-order walk: a block's hash needs its children's hashes first
+    hashes: Dict[str, str] = {}
+    stack = [(block, False)]
+    while stack:
+        current, expanded = stack.pop()
+        children = [block_map[c] for c in current.get('children', []) if c in block_map]
+        if not expanded and children:
+            stack.append((current, True))
+            stack.extend((child, False) for child in children)
+            continue
+        child_hashes = [hashes[child['block_id']] for child in children]
+        hashes[current['block_id']] = hashlib.sha1(
+            repr((block_content(current), child_hashes)).encode('utf-8')).hexdigest()
+    return hashes[block['block_id']]
+
+
+class DiffOp(NamedTuple):
+    # 'delete', 'insert' or 'update'
+    kind: str
+    # child index range in the existing sequence, relative to the first compared block
+    start: int
+    end: int
+    # top-level blocks to insert (with their subtrees), or (block_id, new_block) pairs for updates
+    blocks: List
+
+
+def _updatable(old: Dict, new: Dict) -> bool:
+    """True when only the text elements differ, which batch_update can patch in place."""
+    if old.get('block_type') != new.get('block_type') or old.get('children') or new.get('children'):
+        return False
+    key = TEXT_KEYS.get(old.get('block_type'))
+    if key is None:
+        return False
+    return _normalize_style(old.get(key, {}).get('style')) == _normalize_style(new.get(key, {}).get('style'))
+
+
+def plan_diff(old_blocks: List[Dict], new_blocks: List[Dict], block_map: Optional[Mapping[str, Dict]] = None,
+              new_block_map: Optional[Mapping[str, Dict]] = None) -> List[DiffOp]:
+    """
+    Compute the minimal operations that turn the `old_blocks` sequence into `new_blocks`.
+
+    Both sequences are compared by content hash with a sequence diff. `block_map` and
+    `new_block_map` resolve the children of the old and new blocks, so each hash covers
+    the block's whole subtree and an unchanged nested list compares equal. Replaced runs of
+    equal length whose blocks only differ in text become in-place updates; everything
+    else becomes a delete and/or insert. Delete/insert ops are returned last-position
+    first, so applying them in order never shifts the index of an op still to come.
+    Returns an empty list when the sequences are identical.
+    """
+    old_hashes = [block_fingerprint(b, block_map) for b in old_blocks]
+    new_hashes = [block_fingerprint(b, new_block_map) for b in new_blocks]
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+
+    updates = []
+    structural = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        if tag == 'replace' and i2 - i1 == j2 - j1 and all(
+                _updatable(o, n) for o, n in zip(old_blocks[i1:i2], new_blocks[j1:j2])):
+            updates.extend((o['block_id'], n) for o, n in zip(old_blocks[i1:i2], new_blocks[j1:j2]))
+            continue
+        if tag in ('replace', 'delete'):
+            structural.append(DiffOp('delete', i1, i2, []))
+        if tag in ('replace', 'insert'):
+            structural.append(DiffOp('insert', i1, i1, new_blocks[j1:j2]))
+
+    # Reverse by position; at the same position the delete must run before the insert
+    structural.sort(key=lambda op: (op.start, op.kind == 'delete'), reverse=True)
+    ops = structural
+    if updates:
+        ops.append(DiffOp('update', 0, 0, updates))
+    return ops
+
+
+def update_requests(updates: List[Tuple[str, Dict]]) -> List[Dict]:
+    """batch_update request bodies that replace each block's text elements."""
+    requests = []
+    for block_id, new_block in updates:
+        key = TEXT_KEYS[new_block['block_type']]
+        requests.append({
+            "block_id": block_id,
+            "update_text_elements": {"elements": new_block.get(key, {}).get('elements', [])},
+        })
+    return requests
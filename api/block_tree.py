@@ -0,0 +1,261 @@
+import json
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Keys stored in the tree's arrays rather than per block
+_TREE_KEYS = frozenset(('block_id', 'block_type', 'parent_id', 'children'))
+
+# block_type of a block that is only known as someone's child so far
+_UNSEEN = -1
+
+
+class Block(Mapping):
+    """
+    Read-only view of one block in a BlockTree, shaped like the block dicts of the
+    `/blocks` API (block_id, block_type, parent_id, children, payload keys), so the
+    renderer and the diff code take either. Views are created on access and hold
+    nothing but the tree and an index.
+    """
+    __slots__ = ('_tree', '_i')
+
+    def __init__(self, tree: "BlockTree", i: int):
+        self._tree = tree
+        self._i = i
+
+    def get(self, key, default=None):
+        tree, i = self._tree, self._i
+        if key not in _TREE_KEYS:
+            extras = tree._extras[i]
+            if extras is None:
+                return default
+            if type(extras) is tuple:
+                return extras[1] if extras[0] == key else default
+            return extras.get(key, default)
+        if key == 'block_type':
+            return tree._types[i]
+        if key == 'block_id':
+            return tree._ids[i]
+        if key == 'children':
+            return tree.child_ids(i) if tree._child_counts[i] else default
+        parent = tree._parents[i]
+        return tree._ids[parent] if parent >= 0 else ''
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        yield 'block_id'
+        yield 'block_type'
+        yield 'parent_id'
+        if self._tree._child_counts[self._i]:
+            yield 'children'
+        extras = self._tree._extras[self._i]
+        if type(extras) is tuple:
+            yield extras[0]
+        elif extras:
+            yield from extras
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    @property
+    def index(self) -> int:
+        return self._i
+
+    def __repr__(self) -> str:
+        return f"Block({dict(self)!r})"
+
+
+_missing = object()
+
+
+class BlockTree(Mapping):
+    """
+    Compact in-memory form of a document's blocks, mapping block_id -> Block view.
+
+    Tree links live in flat integer arrays: each block's type and parent index, and
+    its children as a slice of one shared array of indexes. Block ids are stored once
+    (parent_id and children entries point at them), text element and paragraph style
+    dicts are interned so equal styles share one object, and element lists become
+    tuples. Built page by page with `extend`, so the raw API pages can be dropped as
+    soon as they are read.
+    """
+
+    def __init__(self):
+        self._ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._types = array('h')
+        self._parents = array('i')
+        self._child_starts = array('i')
+        self._child_counts = array('i')
+        self._links = array('i')
+        # Payload keys: None, a single (key, value) pair, or a dict
+        self._extras: List = []
+        # Indexes of received blocks, in the order they arrived
+        self._order = array('i')
+        self._styles: Dict = {}
+
+    @classmethod
+    def from_blocks(cls, blocks: Iterable[Dict]) -> "BlockTree":
+        tree = cls()
+        tree.extend(blocks)
+        return tree
+
+    def _slot(self, block_id: str) -> int:
+        i = len(self._ids)
+        self._ids.append(block_id)
+        self._index[block_id] = i
+        self._types.append(_UNSEEN)
+        self._parents.append(-1)
+        self._child_starts.append(0)
+        self._child_counts.append(0)
+        self._extras.append(None)
+        return i
+
+    def extend(self, blocks: Iterable[Dict]):
+        """Add a page of blocks (API dicts)."""
+        for block in blocks:
+            self.add(block)
+
+    def add(self, block: Dict) -> int:
+        index = self._index
+        block_id = block['block_id']
+        i = index.get(block_id)
+        if i is None:
+            i = self._slot(block_id)
+        if self._types[i] == _UNSEEN:
+            self._order.append(i)
+        self._types[i] = block.get('block_type') or 0
+        parent_id = block.get('parent_id')
+        if parent_id:
+            parent = index.get(parent_id)
+            self._parents[i] = self._slot(parent_id) if parent is None else parent
+        else:
+            self._parents[i] = -1
+        children = block.get('children')
+        if children:
+            self._child_starts[i] = len(self._links)
+            self._child_counts[i] = len(children)
+            self._links.extend([index[c] if c in index else self._slot(c) for c in children])
+        extras = None
+        for key, value in block.items():
+            if key in _TREE_KEYS:
+                continue
+            if type(value) is dict and ('elements' in value or 'style' in value):
+                value = self._compact(value)
+            if extras is None:
+                extras = (key, value)
+            elif type(extras) is tuple:
+                extras = {extras[0]: extras[1], key: value}
+            else:
+                extras[key] = value
+        self._extras[i] = extras
+        return i
+
+    # --- interning ---
+    def _intern_style(self, style):
+        if not style or not isinstance(style, dict):
+            return style
+        try:
+            key = frozenset(style.items())
+        except TypeError:  # nested values, e.g. a link
+            key = json.dumps(style, sort_keys=True)
+        return self._styles.setdefault(key, style)
+
+    def _compact_element(self, element: Dict) -> Dict:
+        run = element.get('text_run')
+        if run is None or 'text_element_style' not in run:
+            return element
+        run = dict(run, text_element_style=self._intern_style(run['text_element_style']))
+        return {'text_run': run} if len(element) == 1 else dict(element, text_run=run)
+
+    def _compact(self, value):
+        """Payload of a text-like block type (text, heading1, code, ...), with styles interned."""
+        value = dict(value)
+        if 'style' in value:
+            value['style'] = self._intern_style(value['style'])
+        if 'elements' in value:
+            value['elements'] = tuple(self._compact_element(element) for element in value['elements'])
+        return value
+
+    # --- Mapping ---
+    def __getitem__(self, block_id: str) -> Block:
+        i = self._index.get(block_id)
+        if i is None or self._types[i] == _UNSEEN:
+            raise KeyError(block_id)
+        return Block(self, i)
+
+    def __contains__(self, block_id) -> bool:
+        i = self._index.get(block_id)
+        return i is not None and self._types[i] != _UNSEEN
+
+    def __iter__(self) -> Iterator[str]:
+        ids = self._ids
+        return (ids[i] for i in self._order)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    # --- traversal ---
+    def blocks(self) -> Iterator[Block]:
+        """Every block, in the order received."""
+        return (Block(self, i) for i in self._order)
+
+    def child_ids(self, i: int) -> List[str]:
+        start = self._child_starts[i]
+        ids = self._ids
+        return [ids[j] for j in self._links[start:start + self._child_counts[i]]]
+
+    def children(self, block_id: str) -> List[str]:
+        """Child ids of a block, in document order ([] for unknown blocks)."""
+        i = self._index.get(block_id)
+        return self.child_ids(i) if i is not None else []
+
+    def child_position(self, parent_id: str, child_id: str) -> Optional[int]:
+        """Position of `child_id` among the children of `parent_id`, or None."""
+        parent, child = self._index.get(parent_id), self._index.get(child_id)
+        if parent is None or child is None:
+            return None
+        start = self._child_starts[parent]
+        try:
+            return self._links[start:start + self._child_counts[parent]].index(child)
+        except ValueError:
+            return None
+
+    def first_of_type(self, block_type: int) -> Optional[str]:
+        """Id of the first received block of `block_type`."""
+        types = self._types
+        for i in self._order:
+            if types[i] == block_type:
+                return self._ids[i]
+        return None
+
+    def preorder(self, roots: Optional[Iterable[str]] = None) -> Iterator[Block]:
+        """
+        Blocks in document order, each exactly once, without recursion. By default the
+        walk starts at the root(s) and blocks not reachable from one come last, in
+        arrival order; with `roots` only those subtrees are walked, in the order given.
+        """
+        types, links, starts, counts = self._types, self._links, self._child_starts, self._child_counts
+        seen = bytearray(len(self._ids))
+        if roots is None:
+            stack = [i for i in reversed(self._order) if self._parents[i] < 0]
+        else:
+            index = self._index
+            stack = [index[block_id] for block_id in reversed(list(roots)) if block_id in index]
+        while stack:
+            i = stack.pop()
+            if seen[i] or types[i] == _UNSEEN:
+                continue
+            seen[i] = 1
+            yield Block(self, i)
+            start = starts[i]
+            stack.extend(reversed(links[start:start + counts[i]]))
+        if roots is None:
+            for i in self._order:
+                if not seen[i]:
+                    yield Block(self, i)
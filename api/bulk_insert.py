@@ -0,0 +1,134 @@
+import random
+import uuid
+from typing import Dict, List, Mapping, NamedTuple, Optional
+
+# The children API accepts at most 50 blocks per request
+MAX_CHILDREN_PER_REQUEST = 50
+
+# The descendant API creates at most 1000 blocks (all levels) per request
+MAX_DESCENDANTS_PER_REQUEST = 1000
+
+# Feishu error codes worth retrying: request frequency limit
+RETRYABLE_CODES = {99991400}
+
+
+class InsertBatch(NamedTuple):
+    parent_id: str
+    index: int
+    children: List[Dict]
+    # Sent as client_token so a retried batch that actually landed is not inserted twice
+    client_token: str
+    # Every block of the `children` subtrees when sent with the descendant API;
+    # None for the children API
+    descendants: Optional[List[Dict]] = None
+
+
+class RetryableInsertError(Exception):
+    """A batch failed in a way that is safe to retry (throttled, 5xx, transient API error)."""
+
+
+def plan_batches(parent_id: str, blocks: List[Dict], start_index: Optional[int] = None,
+                 batch_size: int = MAX_CHILDREN_PER_REQUEST) -> List[InsertBatch]:
+    """
+    Split `blocks` into batches that fit the per-request child limit.
+
+    With `start_index` every batch gets the explicit position it must land at
+    (start_index, start_index + batch_size, ...), so document order is kept.
+    Without it, every batch appends (index -1).
+    """
+    batch_size = max(1, min(batch_size, MAX_CHILDREN_PER_REQUEST))
+    batches = []
+    for offset in range(0, len(blocks), batch_size):
+        index = -1 if start_index is None else start_index + offset
+        batches.append(InsertBatch(parent_id, index, blocks[offset:offset + batch_size], str(uuid.uuid4())))
+    return batches
+
+
+def _subtree(block: Dict, block_map: Mapping[str, Dict]) -> List[Dict]:
+    """`block` and its descendants in pre-order, ready for the descendant API."""
+    subtree = []
+    stack = [block]
+    while stack:
+        current = dict(stack.pop())
+        current.pop('parent_id', None)
+        if 'table' in current and 'merge_info' in current['table'].get('property', {}):
+            # Read-only; the descendant API rejects table blocks that carry it
+            table = dict(current['table'], property=dict(current['table']['property']))
+            del table['property']['merge_info']
+            current['table'] = table
+        subtree.append(current)
+        stack.extend(block_map[c] for c in reversed(current.get('children', [])) if c in block_map)
+    return subtree
+
+
+def plan_descendant_batches(parent_id: str, blocks: List[Dict], block_map: Mapping[str, Dict],
+                            start_index: Optional[int] = None,
+                            batch_size: int = MAX_CHILDREN_PER_REQUEST) -> List[InsertBatch]:
+    """
+    Like plan_batches, for blocks that have children: each of `blocks` is sent with its
+    whole subtree (looked up in `block_map`) through the descendant API, so nesting is
+    kept. A batch holds at most `batch_size` top-level blocks and, unless a single
+    subtree is bigger, at most MAX_DESCENDANTS_PER_REQUEST blocks in total.
+    """
+    batch_size = max(1, min(batch_size, MAX_CHILDREN_PER_REQUEST))
+    batches = []
+    children: List[Dict] = []
+    descendants: List[Dict] = []
+    offset = 0
+
+    def flush():
+        index = -1 if start_index is None else start_index + offset
+        batches.append(InsertBatch(parent_id, index, children, str(uuid.uuid4()), descendants))
+
+    for block in blocks:
+        subtree = _subtree(block, block_map)
+        if children and (len(children) >= batch_size or len(descendants) + len(subtree) > MAX_DESCENDANTS_PER_REQUEST):
+            flush()
+            offset += len(children)
+            children, descendants = [], []
+        children.append(block)
+        descendants.extend(subtree)
+    if children:
+        flush()
+    return batches
+
+
+def batch_path(batch: InsertBatch) -> str:
+    """Last path segment of the create API the batch is sent to."""
+    return "children" if batch.descendants is None else "descendant"
+
+
+def batch_payload(batch: InsertBatch) -> Dict:
+    if batch.descendants is not None:
+        return {
+            "children_id": [block['block_id'] for block in batch.children],
+            "index": batch.index,
+            "descendants": batch.descendants,
+        }
+    return {"children": batch.children, "index": batch.index}
+
+
+def batch_params(batch: InsertBatch) -> Dict:
+    return {"document_revision_id": -1, "client_token": batch.client_token}
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def merge_results(results: List[Optional[Dict]]) -> Dict:
+    """Combine per-batch responses into one result shaped like a single insert response."""
+    children = []
+    revision_id = None
+    # The descendant API answers with every created block under "children"
+    for data in results:
+        if not data:
+            continue
+        children.extend(data.get("children", []))
+        revision_id = data.get("document_revision_id", revision_id)
+    return {"children": children, "document_revision_id": revision_id}
@@ -1,6 +1,7 @@
 import requests
 from typing import Optional, List
 from . import config
+from .http_session import build_session
 from pydantic import BaseModel, Field
 
 # --- Pydantic Models for Create MR Response ---
@@ -98,6 +99,15 @@ class CreateMergeRequestResponse(BaseModel):
 
 # --- Function Definition ---
 
+# The MR API previously went through the environment proxy, so keep trusting it here
+_session: Optional[requests.Session] = None
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        _session = build_session(trust_env=True)
+    return _session
+
 def create_mr(
     title: str,
     description: str,
@@ -139,6 +149,6 @@ def create_mr(
         "Draft": False
     }
 
-    response = requests.post(url, headers=headers, json=data)
+    response = _get_session().post(url, headers=headers, json=data)
     response.raise_for_status()
     return response.json()
\ No newline at end of file
@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from . import config
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class DocumentCache:
+    """
+    Rendered-document cache keyed by (document_id, revision_id, format).
+
+    Feishu bumps `revision_id` on every edit, so an entry never goes stale: a new
+    revision simply misses and the old one ages out of the LRU.
+
+    - Memory tier: LRU bounded by the total size of the cached Markdown in bytes.
+    - Disk tier (optional): one file per key under `disk_dir`, used to warm the
+      memory tier after a restart.
+
+    It also remembers the latest revision_id read for each document. With
+    `latest_ttl` > 0 that revision is trusted for that many seconds, so a cached
+    read needs no revision check; meant for when change events invalidate it.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, disk_dir: Optional[str] = None, latest_ttl: float = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.latest_ttl = latest_ttl
+        # document_id -> (revision_id, monotonic time it was read)
+        self._latest: Dict[str, Tuple[object, float]] = {}
+        self._entries: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_dir and not os.path.exists(disk_dir):
+            os.makedirs(disk_dir)
+
+    @staticmethod
+    def _entry_size(content: str) -> int:
+        return len(content.encode("utf-8"))
+
+    def _disk_path(self, key: Tuple[str, str, str]) -> str:
+        document_id, revision_id, fmt = key
+        # document ids are alphanumeric, the format string is hashed to keep the name safe
+        fmt_tag = hashlib.sha1(fmt.encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.disk_dir, f"{document_id}_{revision_id}_{fmt_tag}.md")
+
+    def get(self, document_id: str, revision_id, fmt: str = "blocks") -> Optional[str]:
+        key = (document_id, str(revision_id), fmt)
+        content = self._get_memory(key)
+        return content if content is not None else self._get_disk(key)
+
+    async def get_async(self, document_id: str, revision_id, fmt: str = "blocks") -> Optional[str]:
+        """`get` for async callers: memory hits return at once, the disk tier is read in a worker thread."""
+        key = (document_id, str(revision_id), fmt)
+        content = self._get_memory(key)
+        if content is not None:
+            return content
+        if not self.disk_dir:
+            return self._get_disk(key)  # just counts the miss
+        return await asyncio.to_thread(self._get_disk, key)
+
+    def _get_memory(self, key: Tuple[str, str, str]) -> Optional[str]:
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return content
+
+    def _get_disk(self, key: Tuple[str, str, str]) -> Optional[str]:
+        """Read a key from the disk tier into memory; counts the miss when it isn't there either."""
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    content = f.read()
+                self._put_memory(key, content)
+                with self._lock:
+                    self.hits += 1
+                return content
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, document_id: str, revision_id, content: str, fmt: str = "blocks"):
+        key = (document_id, str(revision_id), fmt)
+        self._put_memory(key, content)
+        if self.disk_dir:
+            self._put_disk(key, content)
+
+    async def put_async(self, document_id: str, revision_id, content: str, fmt: str = "blocks"):
+        """`put` for async callers: the disk tier is written in a worker thread."""
+        key = (document_id, str(revision_id), fmt)
+        self._put_memory(key, content)
+        if self.disk_dir:
+            await asyncio.to_thread(self._put_disk, key, content)
+
+    def _put_disk(self, key: Tuple[str, str, str], content: str):
+        path = self._disk_path(key)
+        # Unique per write: puts of the same key may run in parallel worker threads
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _put_memory(self, key: Tuple[str, str, str], content: str):
+        size = self._entry_size(content)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= self._entry_size(old)
+            self._entries[key] = content
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._entry_size(evicted)
+
+    def set_latest(self, document_id: str, revision_id):
+        self._latest[document_id] = (revision_id, time.monotonic())
+
+    def latest(self, document_id: str):
+        """The document's last read revision_id while it is trusted (see `latest_ttl`), else None."""
+        entry = self._latest.get(document_id)
+        if entry is None or time.monotonic() - entry[1] >= self.latest_ttl:
+            return None
+        return entry[0]
+
+    def invalidate(self, document_id: str):
+        """Drop every cached revision of a document from both tiers."""
+        self._latest.pop(document_id, None)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == document_id]:
+                self._size -= self._entry_size(self._entries.pop(key))
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.startswith(f"{document_id}_"):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def build_document_cache() -> DocumentCache:
+    """
+    Build a DocumentCache from the optional DOC_CACHE_* settings in api/config.py.
+    Only set DOC_CACHE_LATEST_TTL when the change-event webhook (/feishu/events) is set up.
+    """
+    return DocumentCache(
+        max_bytes=getattr(config, "DOC_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES),
+        disk_dir=getattr(config, "DOC_CACHE_DIR", None),
+        latest_ttl=getattr(config, "DOC_CACHE_LATEST_TTL", 0),
+    )
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from . import config
+from .block_tree import BlockTree
+from .markdown_render import HEADING1, HEADING9, TEXT_KEYS, render_elements
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+class DocumentOutline:
+    """
+    The heading structure of a document at one revision.
+
+    Built from the page block's direct children (the top-level blocks, read with the
+    children API without descendants), so nested content such as table cells or list
+    items is never downloaded for it. A heading's section is the heading plus the
+    top-level blocks up to the next heading of the same or a higher level; those
+    blocks are kept here so a section fetch only has to download their descendants.
+    """
+
+    def __init__(self, document_id: str, revision_id: Optional[int], title: Optional[str], blocks: BlockTree):
+        self.document_id = document_id
+        self.revision_id = revision_id
+        self.title = title
+        self.blocks = blocks
+        # Top-level block ids, in document order
+        self.block_ids: List[str] = list(blocks)
+        # (position in block_ids, level, block_id, text) per heading
+        self.headings: List[Tuple[int, int, str, str]] = []
+        for position, block_id in enumerate(self.block_ids):
+            block = blocks[block_id]
+            block_type = block.get('block_type')
+            if HEADING1 <= block_type <= HEADING9:
+                text = render_elements(block.get(TEXT_KEYS[block_type], {}).get('elements', []), plain=True)
+                self.headings.append((position, block_type - HEADING1 + 1, block_id, text.strip()))
+        # heading block_id -> (start, end) of its section
+        self._spans: Dict[str, Tuple[int, int]] = {}
+        open_headings: List[Tuple[int, int, str]] = []
+        for position, level, block_id, _text in self.headings:
+            while open_headings and open_headings[-1][0] >= level:
+                _level, start, closed_id = open_headings.pop()
+                self._spans[closed_id] = (start, position)
+            open_headings.append((level, position, block_id))
+        for _level, start, block_id in open_headings:
+            self._spans[block_id] = (start, len(self.block_ids))
+
+    def section_span(self, block_id: str) -> Tuple[int, int]:
+        """[start, end) positions in `block_ids` of the section under heading `block_id`."""
+        span = self._spans.get(block_id)
+        if span is None:
+            raise KeyError(f"{block_id} is not a top-level heading of document {self.document_id}")
+        return span
+
+    def heading_text(self, block_id: str) -> Optional[str]:
+        return next((text for _p, _l, heading_id, text in self.headings if heading_id == block_id), None)
+
+    def to_dict(self) -> Dict:
+        """The heading tree: each heading with its level, text, section size and sub-headings."""
+        root: Dict = {"children": []}
+        stack = [(0, root)]
+        for start, level, block_id, text in self.headings:
+            _start, end = self._spans[block_id]
+            node = {"block_id": block_id, "level": level, "text": text, "blocks": end - start, "children": []}
+            while stack[-1][0] >= level:
+                stack.pop()
+            stack[-1][1]["children"].append(node)
+            stack.append((level, node))
+        return {
+            "document_id": self.document_id,
+            "revision_id": self.revision_id,
+            "title": self.title,
+            "headings": root["children"],
+        }
+
+
+class OutlineCache:
+    """
+    DocumentOutline LRU keyed by (document_id, revision_id), bounded by entry count.
+    Like the document cache, entries never go stale: an edit bumps the revision.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], DocumentOutline]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, document_id: str, revision_id) -> Optional[DocumentOutline]:
+        key = (document_id, str(revision_id))
+        with self._lock:
+            outline = self._entries.get(key)
+            if outline is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return outline
+
+    def put(self, outline: DocumentOutline):
+        with self._lock:
+            key = (outline.document_id, str(outline.revision_id))
+            self._entries[key] = outline
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def build_outline_cache() -> OutlineCache:
+    """Build an OutlineCache from the optional OUTLINE_CACHE_MAX_ENTRIES setting in api/config.py."""
+    return OutlineCache(max_entries=getattr(config, "OUTLINE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
@@ -0,0 +1,353 @@
+import asyncio
+import logging
+import re
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .markdown_render import MarkdownRenderer, render_blocks_to_md
+from .feishu_async import AsyncFeishuDocAPI
+from .doc_cache import DocumentCache
+from .doc_store import DocumentStore
+from .doc_outline import DocumentOutline, OutlineCache
+from .block_tree import BlockTree
+from .snapshot import DocumentSnapshot
+from .block_diff import plan_diff, update_requests, block_fingerprint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOC_DOMAIN = "bytedance.larkoffice.com"
+DEFAULT_FETCH_CONCURRENCY = 8
+
+async def doc_file_path(api_client: AsyncFeishuDocAPI, store: DocumentStore, url: str, format: Optional[str] = None) -> str:
+    """Path of the doc/ export of `url`; the same file for every URL of a document."""
+    _type, document_id = await api_client.resolve_document(url)
+    return store.path(document_id, 'markdown' if format == 'markdown' else 'blocks')
+
+
+def document_url(doc_url: Optional[str], document_id: str) -> str:
+    """URL of a docx document, on the same domain as `doc_url` when one was given."""
+    domain = DEFAULT_DOC_DOMAIN
+    if doc_url:
+        match = re.search(r'https://([^/]+)', doc_url)
+        if match:
+            domain = match.group(1)
+    return f"https://{domain}/docx/{document_id}"
+
+
+async def render_document_markdown(api_client: AsyncFeishuDocAPI, document_id: str) -> str:
+    """Render a document page by page, so only one page of blocks is in memory at a time."""
+    renderer = MarkdownRenderer()
+    segments = []
+    async for page in api_client.iter_block_pages(document_id):
+        segments.extend(renderer.feed(page))
+    segments.extend(renderer.finish())
+    return '\n\n'.join(segments)
+
+
+def _read_current(store: DocumentStore, document_id: str, revision_id, fmt: str) -> Optional[str]:
+    """The stored export if it is `revision_id`, else None. Blocking; run it in a worker thread."""
+    return store.read(document_id, fmt) if store.is_current(document_id, revision_id, fmt) else None
+
+
+async def _cached_markdown(api_client: AsyncFeishuDocAPI, cache: Optional[DocumentCache], store: DocumentStore,
+                           url: str, fmt: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Look up the current revision of a document in the cache, then in the doc/ store.
+    Returns (document_id, revision_id, cached_markdown); revision_id is None when the
+    cache is disabled or the revision can't be read, cached_markdown None on a miss.
+    """
+    _type, document_id = await api_client.resolve_document(url)
+    revision_id = None
+    if cache is not None and _type == 'docx':
+        revision_id = cache.latest(document_id)
+        if revision_id is not None and not await asyncio.to_thread(store.is_current, document_id, revision_id, fmt):
+            # A change event may have been handled by another worker sharing the store
+            revision_id = None
+        if revision_id is None:
+            doc_info = await api_client.get_document_info(document_id)
+            revision_id = doc_info.get('revision_id')
+            if revision_id is not None:
+                cache.set_latest(document_id, revision_id)
+    if revision_id is None:
+        return document_id, None, None
+    md_content = await cache.get_async(document_id, revision_id, fmt)
+    if md_content is None:
+        # Exported earlier, possibly by another worker or before a restart
+        md_content = await asyncio.to_thread(_read_current, store, document_id, revision_id, fmt)
+        if md_content is not None:
+            await cache.put_async(document_id, revision_id, md_content, fmt)
+    return document_id, revision_id, md_content
+
+
+async def fetch_doc_markdown(api_client: AsyncFeishuDocAPI, cache: Optional[DocumentCache], store: DocumentStore,
+                             url: str, format: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Fetch a document as Markdown and export it to the doc/ store. Shared by the HTTP and MCP servers.
+
+    When a cache is given, one `get_document_info` call is made to read the current
+    revision_id; if that revision is cached, the block download and rendering are skipped.
+    Concurrent fetches of the same document and format share one load.
+    Returns (markdown_content, file_path).
+    """
+    fmt = 'markdown' if format == 'markdown' else 'blocks'
+
+    _type, document_id = await api_client.resolve_document(url)
+    md_content, revision_id = await api_client.flights.do(
+        ("markdown", document_id, fmt), lambda: _load_markdown(api_client, cache, store, url, fmt))
+    filepath = await asyncio.to_thread(store.save, document_id, md_content, revision_id, fmt)
+    return md_content, filepath
+
+
+async def _load_markdown(api_client: AsyncFeishuDocAPI, cache: Optional[DocumentCache], store: DocumentStore,
+                         url: str, fmt: str) -> Tuple[str, Optional[str]]:
+    """(markdown, revision_id); revision_id is None when it isn't known."""
+    document_id, revision_id, md_content = await _cached_markdown(api_client, cache, store, url, fmt)
+    if md_content is not None:
+        return md_content, revision_id
+
+    if fmt == 'markdown':
+        md_content = await api_client.get_content_as_markdown(url)
+    else:
+        md_content = await render_document_markdown(api_client, document_id)
+
+    if revision_id is not None:
+        await cache.put_async(document_id, revision_id, md_content, fmt)
+    return md_content, revision_id
+
+
+async def warm_document(api_client: AsyncFeishuDocAPI, cache: DocumentCache, store: DocumentStore,
+                        document_id: str, revision_id, fmt: str = 'blocks'):
+    """
+    Put `revision_id` of a docx document into the cache and the doc/ store, reading it
+    back from the store when it was exported before. Shares the load with concurrent
+    fetches of the same document, so the revision actually loaded is returned.
+    """
+    async def load() -> Tuple[str, Optional[str]]:
+        md_content = await asyncio.to_thread(_read_current, store, document_id, revision_id, fmt)
+        if md_content is None:
+            md_content = await render_document_markdown(api_client, document_id)
+        await cache.put_async(document_id, revision_id, md_content, fmt)
+        return md_content, revision_id
+
+    md_content, loaded_revision = await api_client.flights.do(("markdown", document_id, fmt), load)
+    await asyncio.to_thread(store.save, document_id, md_content, loaded_revision, fmt)
+    if loaded_revision is not None:
+        cache.set_latest(document_id, loaded_revision)
+    return loaded_revision
+
+
+async def _append_segments(pending, segments: List[str], collected: Optional[List[str]]) -> str:
+    text = '\n\n'.join(segments)
+    await asyncio.to_thread(pending.write, text)
+    if collected is not None:
+        collected.append(text)
+    return text
+
+
+async def stream_doc_markdown(api_client: AsyncFeishuDocAPI, cache: Optional[DocumentCache], store: DocumentStore,
+                              url: str, format: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Async generator yielding Markdown segments as soon as each `/blocks` page is rendered.
+
+    The doc/ export is written alongside, segment by segment, into a temp file that
+    replaces the previous export once the last page is in (unless nothing changed).
+    Cache hits and the raw 'markdown' format come out as a single segment.
+    """
+    fmt = 'markdown' if format == 'markdown' else 'blocks'
+
+    document_id, revision_id, md_content = await _cached_markdown(api_client, cache, store, url, fmt)
+    if md_content is not None:
+        await asyncio.to_thread(store.save, document_id, md_content, revision_id, fmt)
+        yield md_content
+        return
+
+    if fmt == 'markdown':
+        md_content = await api_client.get_content_as_markdown(url)
+        await asyncio.to_thread(store.save, document_id, md_content, revision_id, fmt)
+        if revision_id is not None:
+            await cache.put_async(document_id, revision_id, md_content, fmt)
+        yield md_content
+        return
+
+    pending = await asyncio.to_thread(store.writer, document_id, revision_id, fmt)
+    # Only kept when the result goes into the cache
+    collected: Optional[List[str]] = [] if revision_id is not None else None
+    renderer = MarkdownRenderer()
+    committed = False
+    try:
+        async for page in api_client.iter_block_pages(document_id):
+            segments = renderer.feed(page)
+            if segments:
+                yield await _append_segments(pending, segments, collected)
+        segments = renderer.finish()
+        if segments:
+            yield await _append_segments(pending, segments, collected)
+        await asyncio.to_thread(pending.commit)
+        committed = True
+    finally:
+        if not committed:
+            # Plain call: awaiting here could be interrupted again while the generator closes
+            pending.abort()
+
+    if collected is not None:
+        await cache.put_async(document_id, revision_id, '\n\n'.join(collected), fmt)
+
+
+async def fetch_docs_markdown(api_client: AsyncFeishuDocAPI, cache: Optional[DocumentCache], store: DocumentStore,
+                              urls: List[str], format: Optional[str] = None, max_concurrency: int = DEFAULT_FETCH_CONCURRENCY) -> List[Dict]:
+    """
+    Fetch several documents concurrently, at most `max_concurrency` at a time.
+
+    All fetches share the client's access token and connection pool. One result is
+    returned per URL, in input order; a failing document yields an error entry
+    instead of failing the whole batch.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def fetch_one(url: str) -> Dict:
+        async with semaphore:
+            try:
+                md_content, filepath = await fetch_doc_markdown(api_client, cache, store, url, format)
+            except Exception as e:
+                return {"url": url, "success": False, "error": str(e)}
+        return {"url": url, "success": True, "markdown_content": md_content, "file_path": filepath}
+
+    return await asyncio.gather(*(fetch_one(url) for url in urls))
+
+
+async def get_document_outline(api_client: AsyncFeishuDocAPI, outlines: OutlineCache, url: str) -> DocumentOutline:
+    """
+    The heading outline of a docx document, cached by revision: one `get_document_info`
+    call reads the current revision_id, and the page block's children are listed only
+    when that revision isn't cached yet. Concurrent requests share one load.
+    """
+    _type, document_id = await api_client.resolve_document(url)
+    if _type != 'docx':
+        raise Exception(f"[get_document_outline] Outlines need a docx document, {url} is a {_type}")
+    doc_info = await api_client.get_document_info(document_id)
+    revision_id = doc_info.get('revision_id')
+    outline = outlines.get(document_id, revision_id) if revision_id is not None else None
+    if outline is not None:
+        return outline
+
+    async def load() -> DocumentOutline:
+        blocks = BlockTree()
+        async for page in api_client.iter_children_pages(document_id, document_id, revision_id=revision_id):
+            blocks.extend(page)
+        loaded = DocumentOutline(document_id, revision_id, doc_info.get('title'), blocks)
+        if revision_id is not None:
+            outlines.put(loaded)
+        return loaded
+
+    return await api_client.flights.do(("outline", document_id, revision_id), load)
+
+
+async def fetch_section_markdown(api_client: AsyncFeishuDocAPI, cache: Optional[DocumentCache], outlines: OutlineCache,
+                                 url: str, block_id: str, max_concurrency: int = DEFAULT_FETCH_CONCURRENCY) -> Dict:
+    """
+    Markdown of one section: the heading `block_id` (from the outline) and everything
+    up to the next heading of the same or a higher level.
+
+    The section's top-level blocks come from the cached outline; only those with
+    children are expanded, each with one children-API listing of its descendants (at
+    most `max_concurrency` listings at a time), so the cost follows the section's size
+    rather than the document's. The result is cached per revision next to the document's own Markdown.
+    Raises KeyError when `block_id` isn't a top-level heading.
+    """
+    outline = await get_document_outline(api_client, outlines, url)
+    document_id, revision_id = outline.document_id, outline.revision_id
+    start, end = outline.section_span(block_id)
+    result = {"document_id": document_id, "revision_id": revision_id, "block_id": block_id,
+              "heading": outline.heading_text(block_id)}
+
+    fmt = f"section:{block_id}"
+    md_content = await cache.get_async(document_id, revision_id, fmt) if cache is not None and revision_id is not None else None
+    if md_content is not None:
+        return dict(result, markdown_content=md_content)
+
+    block_ids = outline.block_ids[start:end]
+    section = BlockTree.from_blocks(outline.blocks[i] for i in block_ids)
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def descendants(parent_id: str) -> List[List[Dict]]:
+        async with semaphore:
+            return [page async for page in api_client.iter_children_pages(
+                document_id, parent_id, revision_id=revision_id, with_descendants=True)]
+
+    nested = [i for i in block_ids if outline.blocks.children(i)]
+    for pages in await asyncio.gather(*(descendants(i) for i in nested)):
+        for page in pages:
+            section.extend(page)
+
+    md_content = render_blocks_to_md(section.preorder(block_ids))
+    if cache is not None and revision_id is not None:
+        await cache.put_async(document_id, revision_id, md_content, fmt)
+    logger.debug("Section %s of %s: %d top-level blocks, %d expanded", block_id, document_id, len(block_ids), len(nested))
+    return dict(result, markdown_content=md_content)
+
+
+async def insert_markdown(api_client: AsyncFeishuDocAPI, document_id: str, markdown_content: str,
+                          index: Optional[int] = None) -> int:
+    """
+    Convert `markdown_content` and insert it under the document root (appended, or at
+    `index`), each top-level block with its descendants, the same way the diff update
+    inserts. Returns the number of blocks written.
+    """
+    converted = await api_client.convert_markdown(markdown_content)
+    block_map = {block['block_id']: block for block in converted["blocks"]}
+    top_level = [block_map[block_id] for block_id in converted["first_level_block_ids"] if block_id in block_map]
+    if top_level:
+        await api_client.insert_block_tree(document_id, top_level, block_map, index=index)
+    return len(converted["blocks"])
+
+
+async def update_document_diff(api_client: AsyncFeishuDocAPI, document_id: str, markdown_content: str,
+                               snapshot: Optional[DocumentSnapshot] = None) -> Dict:
+    """
+    Incrementally update a document so its content after the title matches `markdown_content`.
+
+    The existing top-level blocks after the title (from `snapshot`, or read here) are
+    compared with the converted top-level blocks by content hash of their whole
+    subtrees, and only the minimal batch_delete / insert / batch_update operations are
+    applied; inserted blocks are created with their descendants. Nothing is written
+    when the content is unchanged.
+    Returns a summary of the operations applied.
+    """
+    if snapshot is None:
+        snapshot = await api_client.get_snapshot(document_id)
+    block_map = snapshot.by_id
+    if not snapshot.root:
+        raise Exception("Could not find document root block")
+
+    converted = await api_client.convert_markdown(markdown_content)
+    new_block_map = {block['block_id']: block for block in converted["blocks"]}
+    new_blocks = [new_block_map[block_id] for block_id in converted["first_level_block_ids"] if block_id in new_block_map]
+
+    # Same title rule as the replace flow: the first heading block is preserved. If the
+    # Markdown starts with that same heading, it takes part in the comparison instead,
+    # so re-uploading an unchanged file is a no-op.
+    children = snapshot.children()
+    title_block_id = snapshot.title_block_id
+    title_index = snapshot.index_of(title_block_id, document_id) if title_block_id else None
+    base = 0
+    if title_index is not None:
+        base = title_index
+        if not new_blocks or block_fingerprint(block_map[title_block_id], block_map) != block_fingerprint(new_blocks[0], new_block_map):
+            base += 1
+    old_blocks = [block_map.get(child_id, {'block_id': child_id}) for child_id in children[base:]]
+
+    ops = plan_diff(old_blocks, new_blocks, block_map, new_block_map)
+
+    summary = {"changed": bool(ops), "deleted": 0, "inserted": 0, "updated": 0}
+    for op in ops:
+        if op.kind == 'delete':
+            await api_client.delete_children_range(document_id, document_id, base + op.start, base + op.end)
+            summary["deleted"] += op.end - op.start
+        elif op.kind == 'insert':
+            await api_client.insert_block_tree(document_id, op.blocks, new_block_map, index=base + op.start)
+            summary["inserted"] += len(op.blocks)
+        elif op.kind == 'update':
+            await api_client.batch_update_blocks(document_id, update_requests(op.blocks))
+            summary["updated"] += len(op.blocks)
+    logger.info("Diff update of %s: %s", document_id, summary, extra={"document_id": document_id, **summary})
+    return summary
@@ -0,0 +1,222 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOC_DIR = "doc"
+INDEX_FILE = "index.json"
+
+# File name suffix per export format; 'blocks' is the default rendering
+_FORMAT_SUFFIX = {"blocks": "", "markdown": ".raw"}
+
+
+class _PendingWrite:
+    """
+    An export being written into a temp file next to its final path.
+    `commit` moves it into place unless the content hash matches the current file.
+    """
+
+    def __init__(self, store: "DocumentStore", document_id: str, revision_id, fmt: str):
+        self.store = store
+        self.document_id = document_id
+        self.revision_id = revision_id
+        self.fmt = fmt
+        self.path = store.path(document_id, fmt)
+        self.tmp_path = f"{self.path}.{uuid.uuid4().hex}.part"
+        self._hash = hashlib.sha256()
+        self._size = 0
+        self._written = False
+        raw = open(self.tmp_path, "wb")
+        self._file = gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) if store.compress else raw
+        self._raw = raw
+
+    def write(self, text: str):
+        data = (b"\n\n" if self._written else b"") + text.encode("utf-8")
+        self._file.write(data)
+        self._hash.update(data)
+        self._size += len(data)
+        self._written = True
+
+    def _close(self):
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.close()
+
+    def commit(self) -> bool:
+        """Returns True if the file was replaced, False if the content was unchanged."""
+        self._close()
+        sha256 = self._hash.hexdigest()
+        entry = self.store.get(self.document_id, self.fmt)
+        if self.store._unchanged(entry, self.path, sha256):
+            os.remove(self.tmp_path)
+            changed = False
+            self.store.skipped += 1
+        else:
+            os.replace(self.tmp_path, self.path)
+            changed = True
+            self.store.writes += 1
+        self.store._record(self.document_id, self.fmt, {
+            "path": self.path,
+            "revision_id": self.revision_id,
+            "sha256": sha256,
+            "bytes": self._size,
+            "updated_at": round(time.time(), 3) if changed else entry["updated_at"],
+        })
+        return changed
+
+    def abort(self):
+        self._close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class DocumentStore:
+    """
+    The Markdown exports under doc/, one file per document and format:
+    `feishu_content_<document_id>[.raw].md` (`.md.gz` with compression).
+
+    Files are keyed by the resolved document_id, so every URL form of a document
+    (query strings, wiki links) maps to the same file. `index.json` records the
+    revision_id and sha256 of each file; a save whose revision or content is
+    unchanged leaves the file alone. Writes go through a temp file and a rename.
+
+    The index is shared by every process using the directory and re-read when
+    another process changed it. It is only a hint: an entry lost to a concurrent
+    update just means the next save rewrites the file.
+    """
+
+    def __init__(self, root: str = DEFAULT_DOC_DIR, compress: bool = False):
+        self.root = root
+        self.compress = compress
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self._index: Dict[str, Dict] = {}
+        self._index_mtime = None
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.skipped = 0
+        if not os.path.exists(root):
+            os.makedirs(root, exist_ok=True)
+        self._reload_index()
+
+    @staticmethod
+    def _key(document_id: str, fmt: str) -> str:
+        return f"{document_id}:{fmt}"
+
+    def path(self, document_id: str, fmt: str = "blocks") -> str:
+        name = f"feishu_content_{document_id}{_FORMAT_SUFFIX.get(fmt, '.' + fmt)}.md"
+        return os.path.join(self.root, name + (".gz" if self.compress else ""))
+
+    def _reload_index(self):
+        """Re-read index.json if another process replaced it. Call with the lock held (or from __init__)."""
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._index_mtime:
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self._index = json.load(f)
+        except ValueError:
+            logger.warning("Ignoring unreadable document index %s", self.index_path)
+            self._index = {}
+        self._index_mtime = mtime
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+
+    def get(self, document_id: str, fmt: str = "blocks") -> Optional[Dict]:
+        """Index entry of the stored export: path, revision_id, sha256, bytes, updated_at."""
+        with self._lock:
+            self._reload_index()
+            entry = self._index.get(self._key(document_id, fmt))
+            return dict(entry) if entry else None
+
+    def is_current(self, document_id: str, revision_id, fmt: str = "blocks") -> bool:
+        """Whether the stored export already is `revision_id`; False when the revision is unknown."""
+        if revision_id is None:
+            return False
+        entry = self.get(document_id, fmt)
+        return bool(entry) and entry["revision_id"] == revision_id and entry["path"] == self.path(document_id, fmt) \
+            and os.path.exists(entry["path"])
+
+    @staticmethod
+    def _unchanged(entry: Optional[Dict], path: str, sha256: str) -> bool:
+        return bool(entry) and entry["sha256"] == sha256 and entry["path"] == path and os.path.exists(path)
+
+    def _record(self, document_id: str, fmt: str, entry: Dict):
+        with self._lock:
+            self._reload_index()
+            key = self._key(document_id, fmt)
+            if self._index.get(key) == entry:
+                return
+            self._index[key] = entry
+            self._save_index()
+
+    def invalidate(self, document_id: str):
+        """
+        Forget which revision the document's exports hold (the files stay), so no
+        worker treats them as current until they are exported again.
+        """
+        with self._lock:
+            self._reload_index()
+            keys = [key for key in self._index if key.startswith(f"{document_id}:")]
+            for key in keys:
+                del self._index[key]
+            if keys:
+                self._save_index()
+
+    def writer(self, document_id: str, revision_id=None, fmt: str = "blocks") -> _PendingWrite:
+        """Start an export to be written segment by segment; finish with commit() or abort()."""
+        return _PendingWrite(self, document_id, revision_id, fmt)
+
+    def save(self, document_id: str, content: str, revision_id=None, fmt: str = "blocks") -> str:
+        """Store an export unless that revision or content is already on disk; returns its path."""
+        path = self.path(document_id, fmt)
+        if self.is_current(document_id, revision_id, fmt):
+            self.skipped += 1
+            return path
+        # Same content under a new revision (or no revision known): only the index changes
+        entry = self.get(document_id, fmt)
+        sha256 = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        if self._unchanged(entry, path, sha256):
+            self.skipped += 1
+            self._record(document_id, fmt, dict(entry, revision_id=revision_id))
+            return path
+        pending = self.writer(document_id, revision_id, fmt)
+        try:
+            pending.write(content)
+        except BaseException:
+            pending.abort()
+            raise
+        pending.commit()
+        return pending.path
+
+    def read(self, document_id: str, fmt: str = "blocks") -> Optional[str]:
+        path = self.path(document_id, fmt)
+        if not os.path.exists(path):
+            return None
+        opener = gzip.open if self.compress else open
+        with opener(path, "rb") as f:
+            return f.read().decode("utf-8")
+
+
+def build_doc_store() -> DocumentStore:
+    """Build a DocumentStore from the optional DOC_DIR / DOC_STORE_COMPRESS settings in api/config.py."""
+    return DocumentStore(
+        root=getattr(config, "DOC_DIR", DEFAULT_DOC_DIR),
+        compress=getattr(config, "DOC_STORE_COMPRESS", False),
+    )
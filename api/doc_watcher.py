@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from . import config
+from .doc_cache import DocumentCache
+from .doc_store import DocumentStore
+from .doc_service import warm_document
+from .feishu_async import AsyncFeishuDocAPI
+from .metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process watches
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WATCH_INTERVAL = 60
+# get_document_info polls per second
+DEFAULT_WATCH_RATE = 2.0
+
+
+class RevisionWatcher:
+    """
+    Keeps a list of hot documents rendered ahead of time.
+
+    Every `interval` seconds the revision_id of each watched URL is read with
+    `get_document_info`, at most `rate` calls per second. A document whose revision
+    changed since the last poll (or that was never seen) is downloaded, rendered in
+    the default 'blocks' format and put in the fetch cache and the doc/ store, so
+    a later fetch_doc only costs its own revision check.
+
+    With several worker processes one of them watches, chosen by an flock in the
+    store directory; the others pick the exports up from the store.
+    """
+
+    def __init__(self, api_client: AsyncFeishuDocAPI, cache: DocumentCache, store: DocumentStore, urls: List[str],
+                 interval: float = DEFAULT_WATCH_INTERVAL, rate: float = DEFAULT_WATCH_RATE):
+        self.api_client = api_client
+        self.cache = cache
+        self.store = store
+        self.urls = list(urls)
+        self.interval = interval
+        self.rate = rate
+        # document_id -> revision_id held in the cache
+        self.revisions: Dict[str, object] = {}
+        self.polls = 0
+        self.refreshes = 0
+        self.errors = 0
+        self._task: Optional[asyncio.Task] = None
+        self._lock_file = None
+
+    def start(self):
+        """Start polling in the background; does nothing without URLs or when already running."""
+        if not self.urls or self._task is not None:
+            return
+        self._task = asyncio.ensure_future(self._run())
+        logger.info("Watching %d documents every %ss", len(self.urls), self.interval)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _is_leader(self) -> bool:
+        if self._lock_file is not None or fcntl is None:
+            return True
+        lock_file = open(os.path.join(self.store.root, "watcher.lock"), "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            if self._is_leader():
+                await self.poll_once()
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    async def poll_once(self):
+        """One pass over the watch list."""
+        for i, url in enumerate(self.urls):
+            if i and self.rate:
+                await asyncio.sleep(1 / self.rate)
+            try:
+                await self._poll(url)
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Watching %s failed: %s", url, e)
+
+    async def _poll(self, url: str):
+        _type, document_id = await self.api_client.resolve_document(url)
+        if _type != 'docx':
+            return
+        self.polls += 1
+        revision_id = (await self.api_client.get_document_info(document_id)).get('revision_id')
+        if revision_id is None or self.revisions.get(document_id) == revision_id:
+            return
+        self.revisions[document_id] = await warm_document(self.api_client, self.cache, self.store, document_id, revision_id)
+        self.refreshes += 1
+        logger.info("Pre-warmed %s at revision %s", document_id, revision_id)
+
+    def collect_metrics(self):
+        """Scrape-time collector for the watcher's counters."""
+        return [
+            ("doc_watch_polls_total", "counter", "Revision checks of watched documents.", [({}, self.polls)]),
+            ("doc_watch_refreshes_total", "counter", "Watched documents re-rendered after a revision change.",
+             [({}, self.refreshes)]),
+            ("doc_watch_errors_total", "counter", "Failed revision checks or refreshes.", [({}, self.errors)]),
+        ]
+
+
+def build_watcher(api_client: AsyncFeishuDocAPI, cache: DocumentCache, store: DocumentStore) -> RevisionWatcher:
+    """
+    A watcher for the optional settings in api/config.py:
+    WATCH_URLS = [document or wiki URLs], WATCH_INTERVAL = seconds per pass, WATCH_RATE = polls per second.
+    """
+    watcher = RevisionWatcher(
+        api_client, cache, store,
+        urls=getattr(config, "WATCH_URLS", []),
+        interval=getattr(config, "WATCH_INTERVAL", DEFAULT_WATCH_INTERVAL),
+        rate=getattr(config, "WATCH_RATE", DEFAULT_WATCH_RATE),
+    )
+    REGISTRY.register_collector("doc_watch", watcher.collect_metrics)
+    return watcher
@@ -0,0 +1,203 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Mapping, Optional, Set, Tuple
+
+from . import config
+from .doc_cache import DocumentCache
+from .doc_service import warm_document
+from .doc_store import DocumentStore
+from .feishu_async import AsyncFeishuDocAPI
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:  # only needed when an encrypt key is configured
+    Cipher = None
+
+logger = logging.getLogger(__name__)
+
+# Drive events for a changed document (schema 2.0 names, then the 1.0 ones)
+EDIT_EVENTS = {"drive.file.edit_v1", "drive.file.title_updated_v1", "file_edit", "file_title_update"}
+REMOVE_EVENTS = {"drive.file.trashed_v1", "drive.file.deleted_v1", "file_trashed", "file_deleted"}
+
+# Feishu retries an event until it is acknowledged; remember this many ids to drop duplicates
+SEEN_EVENTS = 1024
+
+
+class EventVerificationError(Exception):
+    """The callback's token or signature doesn't match the app's settings."""
+
+
+def _require_cipher():
+    if Cipher is None:
+        raise Exception("[events] EVENT_ENCRYPT_KEY is set but the `cryptography` package is not installed")
+
+
+def decrypt_event(encrypted: str, encrypt_key: str) -> Dict:
+    """Decrypt an {"encrypt": ...} callback body: AES-256-CBC, key = sha256(encrypt_key), IV in front."""
+    _require_cipher()
+    data = base64.b64decode(encrypted)
+    decryptor = Cipher(algorithms.AES(hashlib.sha256(encrypt_key.encode("utf-8")).digest()), modes.CBC(data[:16])).decryptor()
+    plain = decryptor.update(data[16:]) + decryptor.finalize()
+    # PKCS#7 padding
+    return json.loads(plain[:-plain[-1]].decode("utf-8"))
+
+
+def encrypt_event(payload: Dict, encrypt_key: str) -> str:
+    """Counterpart of `decrypt_event`, for replaying events locally."""
+    _require_cipher()
+    plain = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    pad = 16 - len(plain) % 16
+    iv = os.urandom(16)
+    encryptor = Cipher(algorithms.AES(hashlib.sha256(encrypt_key.encode("utf-8")).digest()), modes.CBC(iv)).encryptor()
+    return base64.b64encode(iv + encryptor.update(plain + bytes([pad]) * pad) + encryptor.finalize()).decode("ascii")
+
+
+def event_signature(timestamp: str, nonce: str, encrypt_key: str, body: bytes) -> str:
+    """X-Lark-Signature: sha256 of timestamp + nonce + encrypt key + raw body."""
+    return hashlib.sha256((timestamp + nonce + encrypt_key).encode("utf-8") + body).hexdigest()
+
+
+class DocumentEventHandler:
+    """
+    Handles Feishu event callbacks (subscribe a document with
+    POST /drive/v1/files/:file_token/subscribe to receive them).
+
+    - URL verification: echoes the challenge.
+    - Edit / title events: drop the document's cached Markdown, its trusted latest
+      revision, its doc/ index entries (which tells other workers sharing the store)
+      and any wiki mapping to it; documents that were in use are rendered again in
+      the background, so the next read is a cache hit on the new revision.
+    - Trash / delete events: drop the same, without re-rendering.
+
+    With EVENT_ENCRYPT_KEY set, bodies are decrypted and X-Lark-Signature checked;
+    with EVENT_VERIFICATION_TOKEN set, the token in each event must match. With
+    neither set every callback is rejected: the events drop caches and cause
+    Feishu traffic, so an unauthenticated endpoint must not accept them.
+    """
+
+    def __init__(self, api_client: AsyncFeishuDocAPI, cache: DocumentCache, store: DocumentStore,
+                 verification_token: Optional[str] = None, encrypt_key: Optional[str] = None, watcher=None):
+        self.api_client = api_client
+        self.cache = cache
+        self.store = store
+        self.verification_token = verification_token
+        self.encrypt_key = encrypt_key
+        if encrypt_key:
+            # Fail at startup rather than on the first callback
+            _require_cipher()
+        self.watcher = watcher
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether callbacks can be authenticated at all."""
+        return bool(self.verification_token or self.encrypt_key)
+
+    def parse(self, body: bytes, headers: Mapping[str, str]) -> Dict:
+        """Verify and decode a raw callback body."""
+        if not self.enabled:
+            raise EventVerificationError("Event callbacks are disabled: set EVENT_VERIFICATION_TOKEN or EVENT_ENCRYPT_KEY")
+        signature = headers.get("x-lark-signature")
+        if self.encrypt_key and signature is not None:
+            expected = event_signature(headers.get("x-lark-request-timestamp", ""),
+                                       headers.get("x-lark-request-nonce", ""), self.encrypt_key, body)
+            if not hmac.compare_digest(signature, expected):
+                raise EventVerificationError("Bad event signature")
+        payload = json.loads(body)
+        if self.encrypt_key:
+            # With an encrypt key every callback is encrypted, and all but URL verification signed
+            if "encrypt" not in payload:
+                raise EventVerificationError("Unencrypted event received but EVENT_ENCRYPT_KEY is set")
+            payload = decrypt_event(payload["encrypt"], self.encrypt_key)
+            if signature is None and payload.get("type") != "url_verification":
+                raise EventVerificationError("Unsigned event")
+        elif "encrypt" in payload:
+            raise EventVerificationError("Encrypted event received but EVENT_ENCRYPT_KEY is not set")
+        token = payload.get("token") or payload.get("header", {}).get("token")
+        if self.verification_token and not hmac.compare_digest(token or "", self.verification_token):
+            raise EventVerificationError("Bad verification token")
+        return payload
+
+    @staticmethod
+    def _describe(payload: Dict) -> Tuple[Optional[str], Optional[str], Dict]:
+        """(event_id, event_type, event) for schema 2.0 and 1.0 callbacks."""
+        if payload.get("schema") == "2.0":
+            header = payload.get("header", {})
+            return header.get("event_id"), header.get("event_type"), payload.get("event", {})
+        event = payload.get("event", {})
+        return payload.get("uuid"), event.get("type"), event
+
+    def _first_delivery(self, event_id: Optional[str]) -> bool:
+        if event_id is None:
+            return True
+        if event_id in self._seen:
+            return False
+        self._seen[event_id] = None
+        if len(self._seen) > SEEN_EVENTS:
+            self._seen.popitem(last=False)
+        return True
+
+    def handle(self, payload: Dict) -> Dict:
+        """Apply a verified callback; returns the response body. Never waits on Feishu."""
+        if payload.get("type") == "url_verification":
+            return {"challenge": payload.get("challenge")}
+
+        event_id, event_type, event = self._describe(payload)
+        document_id = event.get("file_token")
+        if not document_id or not self._first_delivery(event_id):
+            return {}
+        if event_type in EDIT_EVENTS or event_type in REMOVE_EVENTS:
+            in_use = self.invalidate(document_id)
+            logger.info("Event %s for %s: cache invalidated", event_type, document_id,
+                        extra={"event_id": event_id, "document_id": document_id})
+            if in_use and event_type in EDIT_EVENTS and event.get("file_type", "docx") == "docx":
+                task = asyncio.ensure_future(self._refresh(document_id))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        return {}
+
+    def invalidate(self, document_id: str) -> bool:
+        """Forget everything cached for a document; returns whether it was in use."""
+        in_use = self.cache.latest(document_id) is not None or self.store.get(document_id) is not None
+        self.cache.invalidate(document_id)
+        self.store.invalidate(document_id)
+        self.api_client.wiki_cache.invalidate(obj_token=document_id)
+        if self.watcher is not None:
+            in_use = self.watcher.revisions.pop(document_id, None) is not None or in_use
+        return in_use
+
+    async def _refresh(self, document_id: str):
+        try:
+            revision_id = (await self.api_client.get_document_info(document_id)).get("revision_id")
+            if revision_id is not None:
+                revision_id = await warm_document(self.api_client, self.cache, self.store, document_id, revision_id)
+                if self.watcher is not None:
+                    self.watcher.revisions[document_id] = revision_id
+        except Exception as e:
+            logger.warning("Refreshing %s after a change event failed: %s", document_id, e)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def build_event_handler(api_client: AsyncFeishuDocAPI, cache: DocumentCache, store: DocumentStore,
+                        watcher=None) -> DocumentEventHandler:
+    """
+    Handler for the EVENT_VERIFICATION_TOKEN / EVENT_ENCRYPT_KEY settings in api/config.py;
+    without either one, callbacks are refused.
+    """
+    return DocumentEventHandler(
+        api_client, cache, store,
+        verification_token=getattr(config, "EVENT_VERIFICATION_TOKEN", None),
+        encrypt_key=getattr(config, "EVENT_ENCRYPT_KEY", None),
+        watcher=watcher,
+    )
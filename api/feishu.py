@@ -1,68 +1,145 @@
-import os
+import logging
 import requests
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
-from typing import Optional, Tuple, List, Dict
+from typing import Optional, Tuple, List, Dict, Iterator, Mapping, Union
 
 from . import config
+from .token_store import build_token_store
+from .token_manager import TokenManager, RefreshTokenRejected, AUTH_ERROR_CODES
+from .rate_limit import default_rate_limiter, endpoint_for
+from .metrics import observe_feishu_call, register_cache, DOCUMENT_PAGES, BLOCKS_INSERTED
+from .http_session import build_session
+from .wiki_cache import build_wiki_cache
+from .single_flight import SingleFlight
+from .block_tree import BlockTree
+from .snapshot import DocumentSnapshot
+from .markdown_convert import ConversionCache, split_markdown, chunk_key, first_level_ids, stitch_blocks
+from .block_diff import MAX_BATCH_UPDATE_REQUESTS
+from .bulk_insert import (
+    InsertBatch, RetryableInsertError, MAX_CHILDREN_PER_REQUEST, RETRYABLE_CODES,
+    plan_batches, plan_descendant_batches, batch_path, batch_payload, batch_params, backoff_delay,
+    is_retryable_status, merge_results,
+)
+
+# Largest page_size accepted by the /blocks list API
+MAX_BLOCK_PAGE_SIZE = 500
+
+# Per-page debug messages are sampled: 1 in this many is emitted
+PAGE_LOG_SAMPLE_EVERY = 10
+
+logger = logging.getLogger(__name__)
 
 # --- Feishu API Client Class ---
 class FeishuDocAPI:
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None):
         self.app_id = config.APP_ID
         self.app_secret = config.APP_SECRET
         # Auth API uses feishu.cn domain (for China region)
-        self.auth_base_url = "https://open.feishu.cn/open-apis"
+        self.auth_base_url = getattr(config, "FEISHU_AUTH_BASE_URL", "https://open.feishu.cn/open-apis")
         # Document API uses larkoffice.com domain (international)
-        self.doc_base_url = "https://open.larkoffice.com/open-apis"
+        self.doc_base_url = getattr(config, "FEISHU_DOC_BASE_URL", "https://open.larkoffice.com/open-apis")
+        # One pooled keep-alive session per client; timeouts and proxy policy live there
+        self.session = session or build_session()
         self.user_access_token = None
-        self.refresh_token = self._load_refresh_token()
-
-    def _load_refresh_token(self) -> Optional[str]:
-        if os.path.exists("refresh_token.txt"):
-            with open("refresh_token.txt", "r") as f:
-                return f.read().strip()
-        return None
+        # Refresh and access tokens, shared with other processes using the same store
+        self.token_store = build_token_store()
+        self.token_manager = TokenManager(self._request_user_access_token, self.token_store)
+        self.rate_limiter = default_rate_limiter()
+        self.conversion_cache = ConversionCache()
+        self.wiki_cache = build_wiki_cache()
+        register_cache("conversion", self.conversion_cache)
+        register_cache("wiki", self.wiki_cache)
+        # Identical reads in flight at the same time share one call
+        self.flights = SingleFlight()
 
     def refresh_user_access_token(self) -> str:
-        if not self.refresh_token:
+        return self.token_manager.refresh()
+
+    def _request_user_access_token(self, refresh_token: Optional[str]) -> Tuple[str, int, Optional[str]]:
+        if not refresh_token:
             raise Exception("Refresh token not found. Please generate it first using get_token.py.")
 
-        # The authentication endpoint is global and should not be dynamically changed.
-        url = "https://open.feishu.cn/open-apis/authen/v1/refresh_access_token"
+        # The authentication endpoint is global (auth_base_url only differs for a local stand-in)
+        url = f"{self.auth_base_url}/authen/v1/refresh_access_token"
         payload = {
             "grant_type": "refresh_token",
-            "refresh_token": self.refresh_token,
+            "refresh_token": refresh_token,
             "app_id": self.app_id,
             "app_secret": self.app_secret
         }
         
-        response = requests.post(url, json=payload, proxies={'http': None, 'https': None})
+        self.rate_limiter.acquire("auth.refresh")
+        response = self.session.post(url, json=payload)
         response.raise_for_status()
         data = response.json()
         
         if data.get("code") == 0:
             token_data = data.get("data", {})
             self.user_access_token = token_data.get("access_token")
-            new_refresh_token = token_data.get("refresh_token")
-            if new_refresh_token:
-                self.refresh_token = new_refresh_token
-                with open("refresh_token.txt", "w") as f:
-                    f.write(self.refresh_token)
-            print("✅ User access token refreshed successfully.")
-            return self.user_access_token
+            logger.info("User access token refreshed", extra={"expires_in": token_data.get("expires_in", 0)})
+            # The token manager saves the rotated refresh token to the store
+            return self.user_access_token, token_data.get("expires_in", 0), token_data.get("refresh_token")
         else:
-            if os.path.exists("refresh_token.txt"):
-                os.remove("refresh_token.txt")
-            raise Exception(f"❌ Failed to refresh token: {data.get('msg')}. The token might be expired. Please re-authorize.")
+            # The refresh token is dead: the token manager clears the store to force a re-authorization
+            raise RefreshTokenRejected(f"❌ Failed to refresh token: {data.get('msg')}. The token might be expired. Please re-authorize.")
 
     def get_access_token(self) -> str:
-        return self.refresh_user_access_token()
+        return self.token_manager.get_token()
+
+    @staticmethod
+    def _is_auth_error(response: requests.Response) -> bool:
+        if response.status_code == 401:
+            return True
+        # Token errors come back as 4xx; don't parse successful (possibly large) bodies
+        if response.status_code < 400:
+            return False
+        try:
+            data = response.json()
+        except ValueError:
+            return False
+        return isinstance(data, dict) and data.get("code") in AUTH_ERROR_CODES
+
+    def _request(self, method: str, url: str, headers: Optional[Dict] = None, **kwargs) -> requests.Response:
+        """
+        Send an authorized request. If Feishu rejects the access token, the cached
+        token is invalidated and the request is retried once with a fresh one.
+        Every request first takes a token from the endpoint's rate-limit bucket, and
+        throttled responses (429 / frequency limit) are retried with backoff.
+        """
+        endpoint = endpoint_for(method, url)
+        auth_retried = False
+        throttle_attempt = 0
+        while True:
+            self.rate_limiter.acquire(endpoint)
+            access_token = self.get_access_token()
+            request_headers = dict(headers or {})
+            request_headers["Authorization"] = f"Bearer {access_token}"
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, headers=request_headers, **kwargs)
+            except Exception:
+                observe_feishu_call(endpoint, None, time.perf_counter() - started)
+                raise
+            observe_feishu_call(endpoint, response, time.perf_counter() - started)
+            if not auth_retried and self._is_auth_error(response):
+                logger.warning("Access token rejected (%s), refreshing and retrying once", response.status_code)
+                self.token_manager.invalidate(access_token)
+                auth_retried = True
+                continue
+            wait = self.rate_limiter.throttle_delay(endpoint, response, throttle_attempt)
+            if wait is not None:
+                logger.warning("Throttled on %s, retrying in %.2fs", endpoint, wait, extra={"endpoint": endpoint})
+                throttle_attempt += 1
+                time.sleep(wait)
+                continue
+            return response
 
     def extract_tokens(self, doc_url: str) -> Tuple[str, Optional[str], str]:
         patterns = {
-            'wiki': r'https://([^/]+)\.feishu\.cn/wiki/([a-zA-Z0-9]+)',
+            'wiki': r'https://([^/.]+)\.[^/]+/wiki/([a-zA-Z0-9]+)',
             'doc': r'https://[^/]+/docs/([a-zA-Z0-9]+)',
             'docx': r'https://[^/]+/docx/([a-zA-Z0-9]+)'
         }
@@ -73,30 +150,45 @@ class FeishuDocAPI:
                 return (type_, match.group(1), match.group(2)) if type_ == 'wiki' else (type_, None, match.group(1))
         raise ValueError("Could not extract token from URL.")
 
-    def get_content(self, doc_url: str) -> dict:
-        _type, _space_id, token = self.extract_tokens(doc_url)
-        access_token = self.get_access_token()
-
-        url = f"{self.doc_base_url}/docx/v1/documents/{token}/blocks"
-        headers = {"Authorization": f"Bearer {access_token}"}
+    def resolve_wiki_node(self, node_token: str) -> Dict:
+        """Look up the document a wiki node holds: {"obj_token", "obj_type"}. Cached per node."""
+        cached = self.wiki_cache.get(node_token)
+        if cached is not None:
+            return cached
+        return self.flights.do(("wiki", node_token), lambda: self._request_wiki_node(node_token))
 
-        response = requests.get(url, headers=headers)
+    def _request_wiki_node(self, node_token: str) -> Dict:
+        url = f"{self.doc_base_url}/wiki/v2/spaces/get_node"
+        response = self._request("GET", url, params={"token": node_token})
         response.raise_for_status()
         data = response.json()
 
         if data.get("code") != 0:
-            raise Exception(f"[FeishuDocAPI.get_content] API Error: {data.get('msg', 'Unknown error')}")
-        return data
+            raise Exception(f"[FeishuDocAPI.resolve_wiki_node] API Error: {data.get('msg', 'Unknown error')}")
 
-    def get_content_as_markdown(self, doc_url: str) -> str:
+        node = data.get("data", {}).get("node", {})
+        self.wiki_cache.put(node_token, node["obj_token"], node["obj_type"])
+        return {"obj_token": node["obj_token"], "obj_type": node["obj_type"]}
+
+    def resolve_document(self, doc_url: str) -> Tuple[str, str]:
+        """(type, token) of the document behind `doc_url`, following wiki nodes to the page they hold."""
         _type, _space_id, token = self.extract_tokens(doc_url)
-        access_token = self.get_access_token()
+        if _type == 'wiki':
+            node = self.resolve_wiki_node(token)
+            return node["obj_type"], node["obj_token"]
+        return _type, token
+
+    def get_content(self, doc_url: str) -> dict:
+        _type, token = self.resolve_document(doc_url)
+        # Same shape as a single /blocks response, but with every page collected
+        return self.flights.do(("content", token), lambda: {
+            "code": 0, "data": {"items": list(self.iter_blocks(token)), "has_more": False}})
+
+    def get_content_as_markdown(self, doc_url: str) -> str:
+        _type, token = self.resolve_document(doc_url)
 
         url = f"{self.doc_base_url}/docx/v1/documents/{token}/raw_content"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-        }
-        response = requests.get(url, headers=headers)
+        response = self._request("GET", url)
         response.raise_for_status()
         data = response.json()
         
@@ -106,94 +198,126 @@ class FeishuDocAPI:
         return data.get("data", {}).get("content", "")
 
     def get_document_info(self, document_id: str) -> Dict:
-        access_token = self.get_access_token()
         url = f"{self.doc_base_url}/docx/v1/documents/{document_id}"
-        headers = {"Authorization": f"Bearer {access_token}"}
 
-        print(f"[get_document_info] Fetching document info for: {document_id}")
-        print(f"[get_document_info] URL: {url}")
-        response = requests.get(url, headers=headers, proxies={'http': None, 'https': None})
+        logger.debug("Fetching document info for %s", document_id)
+        response = self._request("GET", url)
         response.raise_for_status()
         data = response.json()
 
-        print(f"[get_document_info] Response code: {data.get('code')}")
         if data.get("code") != 0:
-            print(f"[get_document_info] ERROR: {data.get('msg')}")
+            logger.error("get_document_info failed for %s: %s", document_id, data.get('msg'), extra={"code": data.get('code')})
             raise Exception(f"[FeishuDocAPI.get_document_info] API Error getting document info: {data.get('msg', 'Unknown error')}")
 
         doc_info = data.get('data', {}).get('document', {})
         # Note: API returns 'revision_id', not 'revision'
-        print(f"[get_document_info] Document revision_id: {doc_info.get('revision_id')}")
-        print(f"[get_document_info] Document keys: {list(doc_info.keys())}")
+        logger.debug("Document %s revision_id: %s", document_id, doc_info.get('revision_id'))
         return doc_info
 
-    def get_all_blocks(self, document_id: str) -> List[Dict]:
-        access_token = self.get_access_token()
+    def iter_block_pages(self, document_id: str, page_size: int = MAX_BLOCK_PAGE_SIZE,
+                         revision_id: Optional[int] = None) -> Iterator[List[Dict]]:
+        """
+        Yield the document's blocks one `/blocks` page at a time, following `has_more`.
+        Only the current page is held in memory. `revision_id` reads that revision
+        instead of the latest.
+        """
         url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks"
-        headers = {"Authorization": f"Bearer {access_token}"}
 
-        print(f"[get_all_blocks] Fetching blocks for document: {document_id}")
-        print(f"[get_all_blocks] Using doc_base_url: {self.doc_base_url}")
+        logger.debug("Fetching blocks for document %s", document_id)
 
-        all_blocks = []
-        page_token = None
-        has_more = True
         page_count = 0
-
-        while has_more:
+        for page in self._iter_pages(url, document_id, {"page_size": page_size}, revision_id, "iter_block_pages"):
             page_count += 1
-            params = {}
-            if page_token:
-                params['page_token'] = page_token
+            yield page
 
-            print(f"[get_all_blocks] Fetching page {page_count}...")
-            response = requests.get(url, headers=headers, params=params)
+        DOCUMENT_PAGES.observe(page_count)
+        logger.debug("Fetched %d pages of %s", page_count, document_id)
+
+    def iter_children_pages(self, document_id: str, block_id: str, page_size: int = MAX_BLOCK_PAGE_SIZE,
+                            revision_id: Optional[int] = None, with_descendants: bool = False) -> Iterator[List[Dict]]:
+        """
+        Yield the children of `block_id` one page at a time, in document order. With
+        `with_descendants` every block below it is listed too, so a subtree costs its
+        own size rather than the whole document's.
+        """
+        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks/{block_id}/children"
+        params = {"page_size": page_size}
+        if with_descendants:
+            params['with_descendants'] = 'true'
+        for page in self._iter_pages(url, document_id, params, revision_id, "iter_children_pages"):
+            yield page
+
+    def _iter_pages(self, url: str, document_id: str, params: Dict, revision_id: Optional[int],
+                    caller: str) -> Iterator[List[Dict]]:
+        """Pages of `items` from a paginated blocks endpoint, following `has_more`."""
+        params = dict(params)
+        if revision_id is not None:
+            params['document_revision_id'] = revision_id
+        page_count = 0
+
+        while True:
+            page_count += 1
+            response = self._request("GET", url, params=params)
             response.raise_for_status()
 
             if not response.text or not response.text.strip():
-                print(f"[get_all_blocks] Empty response received on page {page_count}, stopping.")
-                has_more = False
-                continue
+                logger.warning("Empty blocks response on page %d of %s, stopping", page_count, document_id)
+                return
 
             try:
                 data = response.json()
             except requests.exceptions.JSONDecodeError as e:
-                print(f"[get_all_blocks] JSON decode error on page {page_count}: {e}")
-                print(f"[get_all_blocks] Response text: {response.text[:200]}")
-                has_more = False
-                continue
+                logger.warning("JSON decode error on page %d of %s: %s", page_count, document_id, e)
+                return
 
             if data.get("code") != 0:
-                error_msg = f"[FeishuDocAPI.get_all_blocks] API Error getting blocks: {data.get('msg', 'Unknown error')}, code: {data.get('code')}"
-                print(error_msg)
-                raise Exception(error_msg)
+                raise Exception(f"[FeishuDocAPI.{caller}] API Error getting blocks: {data.get('msg', 'Unknown error')}, code: {data.get('code')}")
 
             items = data.get('data', {}).get('items', [])
             if items:
-                print(f"[get_all_blocks] Retrieved {len(items)} blocks on page {page_count}")
-                all_blocks.extend(items)
+                logger.debug("Retrieved %d blocks on page %d of %s", len(items), page_count, document_id,
+                             extra={"sample_every": PAGE_LOG_SAMPLE_EVERY})
+                yield items
 
-            has_more = data.get('data', {}).get('has_more', False)
             page_token = data.get('data', {}).get('page_token')
+            if not data.get('data', {}).get('has_more', False) or not page_token:
+                return
+            params['page_token'] = page_token
 
-        print(f"[get_all_blocks] Total blocks retrieved: {len(all_blocks)}")
+    def iter_blocks(self, document_id: str, page_size: int = MAX_BLOCK_PAGE_SIZE) -> Iterator[Dict]:
+        """Yield the document's blocks one by one, in document order."""
+        for page in self.iter_block_pages(document_id, page_size=page_size):
+            yield from page
+
+    def get_all_blocks(self, document_id: str) -> List[Dict]:
+        all_blocks = list(self.iter_blocks(document_id))
+        logger.debug("Total blocks retrieved for %s: %d", document_id, len(all_blocks))
         return all_blocks
 
-    def get_deletable_blocks(self, document_id: str, all_blocks: List[Dict], preserve_title: bool = True) -> List[str]:
+    def get_snapshot(self, document_id: str) -> DocumentSnapshot:
+        """Read the document once: its revision_id, then every block at that revision."""
+        revision_id = self.get_document_info(document_id).get('revision_id')
+        tree = BlockTree()
+        for page in self.iter_block_pages(document_id, revision_id=revision_id):
+            tree.extend(page)
+        logger.debug("Snapshot of %s at revision %s: %d blocks", document_id, revision_id, len(tree))
+        return DocumentSnapshot(document_id, revision_id, tree)
+
+    def get_deletable_blocks(self, document_id: str, all_blocks: Union[List[Dict], DocumentSnapshot],
+                             preserve_title: bool = True) -> List[str]:
         """
         Filter blocks to get IDs that can be safely deleted.
+        `all_blocks` is the block list or a DocumentSnapshot of the document.
         Excludes:
         - Document root node (block_id == document_id)
         - Page blocks (block_type == 1)
         - Optionally title blocks (first heading block if preserve_title is True)
         """
+        if isinstance(all_blocks, DocumentSnapshot):
+            all_blocks = all_blocks.blocks
         deletable_ids = []
         title_found = False
 
-        print(f"[get_deletable_blocks] Filtering {len(all_blocks)} blocks...")
-        print(f"[get_deletable_blocks] Document ID: {document_id}")
-        print(f"[get_deletable_blocks] Preserve title: {preserve_title}")
-
         for block in all_blocks:
             block_id = block.get('block_id')
             block_type = block.get('block_type')
@@ -201,26 +325,25 @@ class FeishuDocAPI:
 
             # Skip document root node
             if block_id == document_id:
-                print(f"[get_deletable_blocks] Skipping document root: {block_id}")
                 continue
 
             # Skip page blocks (block_type == 1)
             if block_type == 1:
-                print(f"[get_deletable_blocks] Skipping page block: {block_id}")
                 continue
 
             # If preserve_title is True, skip the first heading block (block_type == 3)
             if preserve_title and block_type == 3 and not title_found:
-                print(f"[get_deletable_blocks] Skipping title block: {block_id}")
+                logger.debug("Keeping title block %s", block_id)
                 title_found = True
                 continue
 
             deletable_ids.append(block_id)
 
-        print(f"[get_deletable_blocks] Found {len(deletable_ids)} deletable blocks out of {len(all_blocks)} total blocks")
+        logger.debug("Found %d deletable blocks out of %d in %s", len(deletable_ids), len(all_blocks), document_id)
         return deletable_ids
 
-    def delete_blocks_after_title(self, document_id: str, title_block_id: str = None):
+    def delete_blocks_after_title(self, document_id: str, title_block_id: str = None,
+                                  snapshot: Optional[DocumentSnapshot] = None):
         """
         Delete all blocks after the title in the document.
         This uses the batch_delete API which deletes children of a parent block by index range.
@@ -228,203 +351,216 @@ class FeishuDocAPI:
         Args:
             document_id: The document ID (also serves as the root block ID)
             title_block_id: Optional. The block ID of the title to preserve.
+            snapshot: Optional. The document as already read by the caller; taken here otherwise.
         """
-        access_token = self.get_access_token()
-
-        print(f"[delete_blocks_after_title] Deleting content after title in document: {document_id}")
-        print(f"[delete_blocks_after_title] Title block ID: {title_block_id}")
-        print(f"[delete_blocks_after_title] Using doc_base_url: {self.doc_base_url}")
-
-        # Get document info for revision
-        doc_info = self.get_document_info(document_id)
-        revision_id = doc_info.get('revision_id')
-        print(f"[delete_blocks_after_title] Document revision_id: {revision_id}")
+        logger.debug("Deleting content after title %s in %s", title_block_id, document_id)
 
-        # Get all blocks to find the structure
-        all_blocks = self.get_all_blocks(document_id)
-
-        # Find the document root block (its children are the top-level blocks)
-        root_block = None
-        for block in all_blocks:
-            if block.get('block_id') == document_id:
-                root_block = block
-                break
+        if snapshot is None:
+            snapshot = self.get_snapshot(document_id)
+        revision_id = snapshot.revision_id
 
-        if not root_block:
-            print(f"[delete_blocks_after_title] ERROR: Could not find root block")
+        if not snapshot.root:
             raise Exception("Could not find document root block")
 
-        children = root_block.get('children', [])
-        print(f"[delete_blocks_after_title] Root block has {len(children)} children")
+        # The root's children are the top-level blocks
+        children = snapshot.children()
 
         if len(children) == 0:
-            print(f"[delete_blocks_after_title] No children to delete")
             return True
 
         # Find the index to start deleting from
         start_index = 0
         if title_block_id:
-            # Find the title block's index
-            for i, child_id in enumerate(children):
-                if child_id == title_block_id:
-                    start_index = i + 1  # Start deleting after the title
-                    print(f"[delete_blocks_after_title] Found title at index {i}, will delete from index {start_index}")
-                    break
+            title_index = snapshot.index_of(title_block_id, document_id)
+            if title_index is not None:
+                start_index = title_index + 1  # Start deleting after the title
 
         # Calculate how many blocks to delete
         end_index = len(children)
         blocks_to_delete = end_index - start_index
 
         if blocks_to_delete <= 0:
-            print(f"[delete_blocks_after_title] No blocks to delete after title")
             return True
 
-        print(f"[delete_blocks_after_title] Will delete blocks from index {start_index} to {end_index} ({blocks_to_delete} blocks)")
+        self.delete_children_range(document_id, document_id, start_index, end_index, revision_id or -1)
 
+        logger.info("Deleted %d blocks after the title of %s", blocks_to_delete, document_id)
+        return True
+    
+    def delete_children_range(self, document_id: str, parent_id: str, start_index: int, end_index: int,
+                              revision_id: int = -1) -> Dict:
+        """Delete children [start_index, end_index) of `parent_id` with the batch_delete API."""
         # API: DELETE /documents/{document_id}/blocks/{block_id}/children/batch_delete
-        # The block_id here is the parent block (document root in our case)
-        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks/{document_id}/children/batch_delete"
+        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks/{parent_id}/children/batch_delete"
         headers = {
-            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json; charset=utf-8"
         }
-
         params = {
-            "document_revision_id": revision_id if revision_id else -1
+            "document_revision_id": revision_id
         }
-
         payload = {
             "start_index": start_index,
             "end_index": end_index
         }
 
-        print(f"[delete_blocks_after_title] Sending DELETE request")
-        print(f"[delete_blocks_after_title] URL: {url}")
-        print(f"[delete_blocks_after_title] Params: {params}")
-        print(f"[delete_blocks_after_title] Payload: {payload}")
-
-        # Refresh access token again right before the delete request
-        access_token = self.get_access_token()
-        headers["Authorization"] = f"Bearer {access_token}"
-        print(f"[delete_blocks_after_title] Refreshed access token before DELETE request")
-
-        response = requests.delete(url, headers=headers, params=params, json=payload, proxies={'http': None, 'https': None})
-
-        print(f"[delete_blocks_after_title] Response status code: {response.status_code}")
-        print(f"[delete_blocks_after_title] Response text: {response.text}")
+        logger.debug("Deleting children %d..%d of %s", start_index, end_index, parent_id)
+        response = self._request("DELETE", url, headers=headers, params=params, json=payload)
 
         if response.status_code >= 400:
-            print(f"[delete_blocks_after_title] HTTP Error: {response.status_code}")
+            logger.error("batch_delete failed with HTTP %s: %.200s", response.status_code, response.text)
             response.raise_for_status()
 
+        data = {}
         if response.text and response.text.strip():
             data = response.json()
-            print(f"[delete_blocks_after_title] Response data: {data}")
+            if data.get("code") != 0:
+                raise Exception(f"[FeishuDocAPI.delete_children_range] API Error: {data.get('msg', 'Unknown error')} code: {data.get('code')}")
+        return data.get("data", {})
 
+    def batch_update_blocks(self, document_id: str, block_requests: List[Dict], revision_id: int = -1) -> List[Dict]:
+        """Apply block update requests with the batch_update API, at most 200 per call."""
+        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks/batch_update"
+        headers = {
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        updated = []
+        for start in range(0, len(block_requests), MAX_BATCH_UPDATE_REQUESTS):
+            payload = {"requests": block_requests[start:start + MAX_BATCH_UPDATE_REQUESTS]}
+            response = self._request("PATCH", url, headers=headers, params={"document_revision_id": revision_id}, json=payload)
+            response.raise_for_status()
+            data = response.json()
             if data.get("code") != 0:
-                error_msg = f"[FeishuDocAPI.delete_blocks_after_title] API Error: {data.get('msg', 'Unknown error')} code: {data.get('code')}"
-                print(error_msg)
-                raise Exception(error_msg)
+                raise Exception(f"[FeishuDocAPI.batch_update_blocks] API Error: {data.get('msg', 'Unknown error')}, code: {data.get('code')}")
+            updated.extend(data.get("data", {}).get("blocks", []))
+        return updated
 
-        print(f"[delete_blocks_after_title] Successfully deleted {blocks_to_delete} blocks")
-        return True
-    
     # 将Markdown/HTML 格式的内容转换为文档块
-    def convert_markdown_to_blocks(self, markdown_content: str) -> List[Dict]:
-        access_token = self.get_access_token()
+    def convert_markdown_to_blocks(self, markdown_content: str, max_workers: int = 4) -> List[Dict]:
+        """Convert Markdown to docx blocks: every block, nested ones included. See convert_markdown."""
+        return self.convert_markdown(markdown_content, max_workers)["blocks"]
+
+    def convert_markdown(self, markdown_content: str, max_workers: int = 4) -> Dict:
+        """
+        Convert Markdown to docx blocks, returned like the convert API's data:
+        {"blocks": [...], "first_level_block_ids": [...]}.
+
+        The file is split at `#`/`##` headings into chunks of up to DEFAULT_MAX_CHUNK_CHARS
+        (see split_markdown), chunks whose content hash is already in the conversion cache
+        are reused, and the rest are converted concurrently. Results are stitched back together in document order.
+        """
+        chunks = split_markdown(markdown_content)
+        results: List[Optional[Dict]] = [None] * len(chunks)
+        # chunk hash -> positions still to convert; identical chunks are converted once
+        missing: Dict[str, List[int]] = {}
+        for i, chunk in enumerate(chunks):
+            if not chunk.strip():
+                results[i] = {"blocks": [], "first_level_block_ids": []}
+                continue
+            key = chunk_key(chunk)
+            cached = self.conversion_cache.get(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            logger.debug("Converting %d of %d chunks", len(missing), len(chunks))
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as pool:
+                converted = pool.map(lambda positions: self._convert_markdown_chunk(chunks[positions[0]]), missing.values())
+                for (key, positions), result in zip(missing.items(), converted):
+                    self.conversion_cache.put(key, result)
+                    for i in positions:
+                        results[i] = result
+        return stitch_blocks(results)
+
+    def _convert_markdown_chunk(self, markdown_content: str) -> Dict:
         url = f"{self.doc_base_url}/docx/v1/documents/blocks/convert"
         headers = {
-            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json; charset=utf-8"
         }
         payload = {
             "content_type": "markdown",
             "content": markdown_content
         }
-        response = requests.post(url, headers=headers, json=payload)
+        response = self._request("POST", url, headers=headers, json=payload)
         response.raise_for_status()
         try:
             data = response.json()
         except requests.exceptions.JSONDecodeError:
-            print(f"Error decoding JSON from response: {response.text}")
+            logger.error("Error decoding convert response: %.200s", response.text)
             raise
         if data.get("code") != 0:
             raise Exception(f"[FeishuDocAPI.convert_markdown_to_blocks] API Error: {data.get('msg', 'Unknown error')}, code: {data.get('code')}")
-        return data.get("data", {}).get("blocks", [])
+        converted = data.get("data", {})
+        return {"blocks": converted.get("blocks", []), "first_level_block_ids": first_level_ids(converted)}
 
     def create_document(self, folder_token: str, body: dict = None) -> dict:
-        access_token = self.get_access_token()
         url = f"{self.doc_base_url}/docx/v1/documents"
         headers = {
-            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json; charset=utf-8"
         }
         payload = {"folder_token": folder_token}
         if body:
             payload['body'] = body
-        response = requests.post(url, headers=headers, json=payload)
+        response = self._request("POST", url, headers=headers, json=payload)
         response.raise_for_status()
         data = response.json()
         if data.get("code") != 0:
             raise Exception(f"[FeishuDocAPI.create_document] API Error: {data.get('msg', 'Unknown error')}, code: {data.get('code')}")
         return data.get("data")
 
-    def insert_blocks(self, document_id: str, blocks: List[Dict], retries: int = 3, delay: int = 2):
-        access_token = self.get_access_token()
-        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks/{document_id}/children"
+    def insert_blocks(self, document_id: str, blocks: List[Dict], retries: int = 3, delay: int = 2,
+                      index: Optional[int] = None, parent_id: Optional[str] = None,
+                      batch_size: int = MAX_CHILDREN_PER_REQUEST) -> Dict:
+        """
+        Insert blocks under `parent_id` (the document root by default).
+
+        Blocks are split into batches of at most 50 (the per-request limit). With `index`,
+        batches land at explicit consecutive positions; otherwise they are appended.
+        Batches are sent in order, and a failed batch is retried on its own with jittered
+        exponential backoff, reusing its client_token so a retry can't insert twice.
+        """
+        batches = plan_batches(parent_id or document_id, blocks, index, batch_size)
+        results = [self._insert_batch(document_id, batch, retries, delay) for batch in batches]
+        logger.info("Inserted %d blocks in %d batches", len(blocks), len(batches), extra={"document_id": document_id})
+        return merge_results(results)
+
+    def insert_block_tree(self, document_id: str, blocks: List[Dict], block_map: Mapping[str, Dict],
+                          retries: int = 3, delay: int = 2, index: Optional[int] = None,
+                          parent_id: Optional[str] = None) -> Dict:
+        """
+        Insert `blocks` together with their descendants (looked up in `block_map`, e.g.
+        the converted blocks by id) through the descendant API, so nested lists, tables
+        and quotes keep their structure. Batching and retries work like insert_blocks.
+        """
+        batches = plan_descendant_batches(parent_id or document_id, blocks, block_map, index)
+        results = [self._insert_batch(document_id, batch, retries, delay) for batch in batches]
+        logger.info("Inserted %d block trees in %d batches", len(blocks), len(batches), extra={"document_id": document_id})
+        return merge_results(results)
+
+    def _insert_batch(self, document_id: str, batch: InsertBatch, retries: int, delay: float) -> Dict:
+        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks/{batch.parent_id}/{batch_path(batch)}"
         headers = {
-            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json; charset=utf-8"
         }
-        payload = {
-            "children": blocks
-        }
 
         for attempt in range(retries):
             try:
-                response = requests.post(url, headers=headers, json=payload)
+                response = self._request("POST", url, headers=headers, params=batch_params(batch), json=batch_payload(batch))
+                if is_retryable_status(response.status_code):
+                    raise RetryableInsertError(f"HTTP {response.status_code}: {response.text[:200]}")
                 response.raise_for_status()
                 data = response.json()
                 if data.get("code") == 0:
-                    print("✅ Blocks inserted successfully.")
+                    BLOCKS_INSERTED.inc(len(batch.descendants or batch.children))
                     return data.get("data")
-                else:
-                    raise Exception(f"[FeishuDocAPI.insert_blocks] API Error: {data.get('msg', 'Unknown error')}, code: {data.get('code')}")
-            except requests.exceptions.RequestException as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
+                error_msg = f"[FeishuDocAPI.insert_blocks] API Error: {data.get('msg', 'Unknown error')}, code: {data.get('code')}"
+                if data.get("code") in RETRYABLE_CODES:
+                    raise RetryableInsertError(error_msg)
+                raise Exception(error_msg)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, RetryableInsertError) as e:
+                logger.warning("Batch at index %s attempt %d failed: %s", batch.index, attempt + 1, e)
                 if attempt < retries - 1:
-                    time.sleep(delay)
+                    time.sleep(backoff_delay(attempt, delay))
                 else:
                     raise
-
-# --- Markdown Parsing Functions ---
-def parse_blocks_to_md(data: dict) -> str:
-    items = data.get('data', {}).get('items', [])
-    if not items:
-        return ''
-    block_map = {item['block_id']: item for item in items}
-    md_lines = []
-    # Process blocks in the order they appear
-    for item in items:
-        parse_block_recursive(item['block_id'], block_map, md_lines, processed_ids=set())
-    return '\n\n'.join(md_lines)
-
-def parse_block_recursive(block_id: str, block_map: dict, md_lines: List[str], processed_ids: set):
-    if block_id in processed_ids:
-        return
-    processed_ids.add(block_id)
-
-    block = block_map.get(block_id)
-    if not block: return
-
-    # Simplified parser logic - extend as needed
-    bt = block.get('block_type')
-    if bt == 2: # Text
-        elements = block.get('text', {}).get('elements', [])
-        content = ''.join(e.get('text_run', {}).get('content', '') for e in elements)
-        if content.strip():
-            md_lines.append(content.strip())
-
-    # Recursively parse children
-    for child_id in block.get('children', []):
-        parse_block_recursive(child_id, block_map, md_lines, processed_ids)
\ No newline at end of file
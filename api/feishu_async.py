@@ -0,0 +1,489 @@
+import asyncio
+import logging
+import time
+import httpx
+from typing import Optional, Tuple, List, Dict, AsyncIterator, Mapping
+
+from . import config
+from .feishu import FeishuDocAPI, MAX_BLOCK_PAGE_SIZE, PAGE_LOG_SAMPLE_EVERY
+from .token_store import build_token_store
+from .token_manager import AsyncTokenManager, RefreshTokenRejected
+from .rate_limit import default_rate_limiter, endpoint_for
+from .metrics import observe_feishu_call, register_cache, DOCUMENT_PAGES, BLOCKS_INSERTED
+from .http_session import build_async_client
+from .wiki_cache import build_wiki_cache
+from .single_flight import AsyncSingleFlight
+from .block_tree import BlockTree
+from .snapshot import DocumentSnapshot
+from .markdown_convert import ConversionCache, split_markdown, chunk_key, first_level_ids, stitch_blocks
+from .block_diff import MAX_BATCH_UPDATE_REQUESTS
+from .bulk_insert import (
+    InsertBatch, RetryableInsertError, MAX_CHILDREN_PER_REQUEST, RETRYABLE_CODES,
+    plan_batches, plan_descendant_batches, batch_path, batch_payload, batch_params, backoff_delay,
+    is_retryable_status, merge_results,
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Async Feishu API Client Class ---
+class AsyncFeishuDocAPI:
+    """
+    asyncio version of FeishuDocAPI with the same methods as coroutines.
+    Used by the FastAPI and MCP servers so that slow Feishu calls don't block the event loop.
+    """
+
+    # Pure helpers that don't touch the network are shared with the sync client
+    _is_auth_error = staticmethod(FeishuDocAPI._is_auth_error)
+    extract_tokens = FeishuDocAPI.extract_tokens
+    get_deletable_blocks = FeishuDocAPI.get_deletable_blocks
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        self.app_id = config.APP_ID
+        self.app_secret = config.APP_SECRET
+        self.auth_base_url = getattr(config, "FEISHU_AUTH_BASE_URL", "https://open.feishu.cn/open-apis")
+        self.doc_base_url = getattr(config, "FEISHU_DOC_BASE_URL", "https://open.larkoffice.com/open-apis")
+        self.client = client or build_async_client()
+        self.user_access_token = None
+        # Refresh and access tokens, shared with other processes using the same store
+        self.token_store = build_token_store()
+        self.token_manager = AsyncTokenManager(self._request_user_access_token, self.token_store)
+        self.rate_limiter = default_rate_limiter()
+        self.conversion_cache = ConversionCache()
+        self.wiki_cache = build_wiki_cache()
+        register_cache("conversion", self.conversion_cache)
+        register_cache("wiki", self.wiki_cache)
+        # Identical reads in flight at the same time share one call
+        self.flights = AsyncSingleFlight()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def refresh_user_access_token(self) -> str:
+        return await self.token_manager.refresh()
+
+    async def _request_user_access_token(self, refresh_token: Optional[str]) -> Tuple[str, int, Optional[str]]:
+        if not refresh_token:
+            raise Exception("Refresh token not found. Please generate it first using get_token.py.")
+
+        url = f"{self.auth_base_url}/authen/v1/refresh_access_token"
+        payload = {
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            "app_id": self.app_id,
+            "app_secret": self.app_secret
+        }
+
+        await self.rate_limiter.acquire_async("auth.refresh")
+        response = await self.client.post(url, json=payload)
+        response.raise_for_status()
+        data = response.json()
+
+        if data.get("code") == 0:
+            token_data = data.get("data", {})
+            self.user_access_token = token_data.get("access_token")
+            logger.info("User access token refreshed", extra={"expires_in": token_data.get("expires_in", 0)})
+            # The token manager saves the rotated refresh token to the store
+            return self.user_access_token, token_data.get("expires_in", 0), token_data.get("refresh_token")
+        else:
+            # The refresh token is dead: the token manager clears the store to force a re-authorization
+            raise RefreshTokenRejected(f"❌ Failed to refresh token: {data.get('msg')}. The token might be expired. Please re-authorize.")
+
+    async def get_access_token(self) -> str:
+        return await self.token_manager.get_token()
+
+    async def _request(self, method: str, url: str, headers: Optional[Dict] = None, **kwargs) -> httpx.Response:
+        """
+        Send an authorized request. If Feishu rejects the access token, the cached
+        token is invalidated and the request is retried once with a fresh one.
+        Every request first takes a token from the endpoint's rate-limit bucket, and
+        throttled responses (429 / frequency limit) are retried with backoff.
+        """
+        endpoint = endpoint_for(method, url)
+        auth_retried = False
+        throttle_attempt = 0
+        while True:
+            await self.rate_limiter.acquire_async(endpoint)
+            access_token = await self.get_access_token()
+            request_headers = dict(headers or {})
+            request_headers["Authorization"] = f"Bearer {access_token}"
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, headers=request_headers, **kwargs)
+            except Exception:
+                observe_feishu_call(endpoint, None, time.perf_counter() - started)
+                raise
+            observe_feishu_call(endpoint, response, time.perf_counter() - started)
+            if not auth_retried and self._is_auth_error(response):
+                logger.warning("Access token rejected (%s), refreshing and retrying once", response.status_code)
+                self.token_manager.invalidate(access_token)
+                auth_retried = True
+                continue
+            wait = self.rate_limiter.throttle_delay(endpoint, response, throttle_attempt)
+            if wait is not None:
+                logger.warning("Throttled on %s, retrying in %.2fs", endpoint, wait, extra={"endpoint": endpoint})
+                throttle_attempt += 1
+                await asyncio.sleep(wait)
+                continue
+            return response
+
+    async def resolve_wiki_node(self, node_token: str) -> Dict:
+        """Look up the document a wiki node holds: {"obj_token", "obj_type"}. Cached per node."""
+        cached = self.wiki_cache.get(node_token)
+        if cached is not None:
+            return cached
+        return await self.flights.do(("wiki", node_token), lambda: self._request_wiki_node(node_token))
+
+    async def _request_wiki_node(self, node_token: str) -> Dict:
+        url = f"{self.doc_base_url}/wiki/v2/spaces/get_node"
+        response = await self._request("GET", url, params={"token": node_token})
+        response.raise_for_status()
+        data = response.json()
+
+        if data.get("code") != 0:
+            raise Exception(f"[AsyncFeishuDocAPI.resolve_wiki_node] API Error: {data.get('msg', 'Unknown error')}")
+
+        node = data.get("data", {}).get("node", {})
+        self.wiki_cache.put(node_token, node["obj_token"], node["obj_type"])
+        return {"obj_token": node["obj_token"], "obj_type": node["obj_type"]}
+
+    async def resolve_document(self, doc_url: str) -> Tuple[str, str]:
+        """(type, token) of the document behind `doc_url`, following wiki nodes to the page they hold."""
+        _type, _space_id, token = self.extract_tokens(doc_url)
+        if _type == 'wiki':
+            node = await self.resolve_wiki_node(token)
+            return node["obj_type"], node["obj_token"]
+        return _type, token
+
+    async def get_content(self, doc_url: str) -> dict:
+        _type, token = await self.resolve_document(doc_url)
+        return await self.flights.do(("content", token), lambda: self._collect_content(token))
+
+    async def _collect_content(self, document_id: str) -> dict:
+        return {"code": 0, "data": {"items": await self.get_all_blocks(document_id), "has_more": False}}
+
+    async def get_content_as_markdown(self, doc_url: str) -> str:
+        _type, token = await self.resolve_document(doc_url)
+
+        url = f"{self.doc_base_url}/docx/v1/documents/{token}/raw_content"
+        response = await self._request("GET", url)
+        response.raise_for_status()
+        data = response.json()
+
+        if data.get("code") != 0:
+            raise Exception(f"[AsyncFeishuDocAPI.get_content_as_markdown] API Error: {data.get('msg', 'Unknown error')}")
+
+        return data.get("data", {}).get("content", "")
+
+    async def get_document_info(self, document_id: str) -> Dict:
+        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}"
+
+        response = await self._request("GET", url)
+        response.raise_for_status()
+        data = response.json()
+
+        if data.get("code") != 0:
+            logger.error("get_document_info failed for %s: %s", document_id, data.get('msg'), extra={"code": data.get('code')})
+            raise Exception(f"[AsyncFeishuDocAPI.get_document_info] API Error getting document info: {data.get('msg', 'Unknown error')}")
+
+        doc_info = data.get('data', {}).get('document', {})
+        logger.debug("Document %s revision_id: %s", document_id, doc_info.get('revision_id'))
+        return doc_info
+
+    async def iter_block_pages(self, document_id: str, page_size: int = MAX_BLOCK_PAGE_SIZE,
+                               revision_id: Optional[int] = None) -> AsyncIterator[List[Dict]]:
+        """Async generator yielding the document's blocks one `/blocks` page at a time. See FeishuDocAPI.iter_block_pages."""
+        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks"
+
+        page_count = 0
+        async for page in self._iter_pages(url, document_id, {"page_size": page_size}, revision_id, "iter_block_pages"):
+            page_count += 1
+            yield page
+
+        DOCUMENT_PAGES.observe(page_count)
+        logger.debug("Fetched %d pages of %s", page_count, document_id)
+
+    async def iter_children_pages(self, document_id: str, block_id: str, page_size: int = MAX_BLOCK_PAGE_SIZE,
+                                  revision_id: Optional[int] = None, with_descendants: bool = False) -> AsyncIterator[List[Dict]]:
+        """Async generator yielding the children of `block_id` one page at a time. See FeishuDocAPI.iter_children_pages."""
+        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks/{block_id}/children"
+        params = {"page_size": page_size}
+        if with_descendants:
+            params['with_descendants'] = 'true'
+        async for page in self._iter_pages(url, document_id, params, revision_id, "iter_children_pages"):
+            yield page
+
+    async def _iter_pages(self, url: str, document_id: str, params: Dict, revision_id: Optional[int],
+                          caller: str) -> AsyncIterator[List[Dict]]:
+        """Pages of `items` from a paginated blocks endpoint, following `has_more`."""
+        params = dict(params)
+        if revision_id is not None:
+            params['document_revision_id'] = revision_id
+        page_count = 0
+
+        while True:
+            page_count += 1
+            response = await self._request("GET", url, params=params)
+            response.raise_for_status()
+
+            if not response.text or not response.text.strip():
+                logger.warning("Empty blocks response on page %d of %s, stopping", page_count, document_id)
+                return
+
+            try:
+                data = response.json()
+            except ValueError as e:
+                logger.warning("JSON decode error on page %d of %s: %s", page_count, document_id, e)
+                return
+
+            if data.get("code") != 0:
+                raise Exception(f"[AsyncFeishuDocAPI.{caller}] API Error getting blocks: {data.get('msg', 'Unknown error')}, code: {data.get('code')}")
+
+            items = data.get('data', {}).get('items', [])
+            if items:
+                logger.debug("Retrieved %d blocks on page %d of %s", len(items), page_count, document_id,
+                             extra={"sample_every": PAGE_LOG_SAMPLE_EVERY})
+                yield items
+
+            page_token = data.get('data', {}).get('page_token')
+            if not data.get('data', {}).get('has_more', False) or not page_token:
+                return
+            params['page_token'] = page_token
+
+    async def iter_blocks(self, document_id: str, page_size: int = MAX_BLOCK_PAGE_SIZE) -> AsyncIterator[Dict]:
+        async for page in self.iter_block_pages(document_id, page_size=page_size):
+            for block in page:
+                yield block
+
+    async def get_all_blocks(self, document_id: str) -> List[Dict]:
+        all_blocks = []
+        async for page in self.iter_block_pages(document_id):
+            all_blocks.extend(page)
+        logger.debug("Total blocks retrieved for %s: %d", document_id, len(all_blocks))
+        return all_blocks
+
+    async def get_snapshot(self, document_id: str) -> DocumentSnapshot:
+        """Read the document once: its revision_id, then every block at that revision."""
+        revision_id = (await self.get_document_info(document_id)).get('revision_id')
+        tree = BlockTree()
+        async for page in self.iter_block_pages(document_id, revision_id=revision_id):
+            tree.extend(page)
+        logger.debug("Snapshot of %s at revision %s: %d blocks", document_id, revision_id, len(tree))
+        return DocumentSnapshot(document_id, revision_id, tree)
+
+    async def delete_blocks_after_title(self, document_id: str, title_block_id: str = None,
+                                        snapshot: Optional[DocumentSnapshot] = None):
+        """
+        Delete all blocks after the title in the document.
+        See FeishuDocAPI.delete_blocks_after_title.
+        """
+        if snapshot is None:
+            snapshot = await self.get_snapshot(document_id)
+        revision_id = snapshot.revision_id
+
+        if not snapshot.root:
+            raise Exception("Could not find document root block")
+
+        children = snapshot.children()
+        if len(children) == 0:
+            return True
+
+        start_index = 0
+        if title_block_id:
+            title_index = snapshot.index_of(title_block_id, document_id)
+            if title_index is not None:
+                start_index = title_index + 1  # Start deleting after the title
+
+        end_index = len(children)
+        blocks_to_delete = end_index - start_index
+        if blocks_to_delete <= 0:
+            return True
+
+        await self.delete_children_range(document_id, document_id, start_index, end_index, revision_id or -1)
+
+        logger.info("Deleted %d blocks after the title of %s", blocks_to_delete, document_id)
+        return True
+
+    async def delete_children_range(self, document_id: str, parent_id: str, start_index: int, end_index: int,
+                                    revision_id: int = -1) -> Dict:
+        """Delete children [start_index, end_index) of `parent_id` with the batch_delete API."""
+        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks/{parent_id}/children/batch_delete"
+        headers = {
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        params = {
+            "document_revision_id": revision_id
+        }
+        payload = {
+            "start_index": start_index,
+            "end_index": end_index
+        }
+
+        response = await self._request("DELETE", url, headers=headers, params=params, json=payload)
+
+        if response.status_code >= 400:
+            logger.error("batch_delete failed with HTTP %s: %.200s", response.status_code, response.text)
+            response.raise_for_status()
+
+        data = {}
+        if response.text and response.text.strip():
+            data = response.json()
+            if data.get("code") != 0:
+                raise Exception(f"[AsyncFeishuDocAPI.delete_children_range] API Error: {data.get('msg', 'Unknown error')} code: {data.get('code')}")
+        return data.get("data", {})
+
+    async def batch_update_blocks(self, document_id: str, block_requests: List[Dict], revision_id: int = -1) -> List[Dict]:
+        """Apply block update requests with the batch_update API, at most 200 per call."""
+        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks/batch_update"
+        headers = {
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        updated = []
+        for start in range(0, len(block_requests), MAX_BATCH_UPDATE_REQUESTS):
+            payload = {"requests": block_requests[start:start + MAX_BATCH_UPDATE_REQUESTS]}
+            response = await self._request("PATCH", url, headers=headers, params={"document_revision_id": revision_id}, json=payload)
+            response.raise_for_status()
+            data = response.json()
+            if data.get("code") != 0:
+                raise Exception(f"[AsyncFeishuDocAPI.batch_update_blocks] API Error: {data.get('msg', 'Unknown error')}, code: {data.get('code')}")
+            updated.extend(data.get("data", {}).get("blocks", []))
+        return updated
+
+    async def convert_markdown_to_blocks(self, markdown_content: str, max_concurrency: int = 4) -> List[Dict]:
+        """Convert Markdown to docx blocks: every block, nested ones included. See convert_markdown."""
+        return (await self.convert_markdown(markdown_content, max_concurrency))["blocks"]
+
+    async def convert_markdown(self, markdown_content: str, max_concurrency: int = 4) -> Dict:
+        """Convert Markdown chunk by chunk, concurrently and with caching. See FeishuDocAPI.convert_markdown."""
+        chunks = split_markdown(markdown_content)
+        results: List[Optional[Dict]] = [None] * len(chunks)
+        # chunk hash -> positions still to convert; identical chunks are converted once
+        missing: Dict[str, List[int]] = {}
+        for i, chunk in enumerate(chunks):
+            if not chunk.strip():
+                results[i] = {"blocks": [], "first_level_block_ids": []}
+                continue
+            key = chunk_key(chunk)
+            cached = self.conversion_cache.get(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            logger.debug("Converting %d of %d chunks", len(missing), len(chunks))
+            semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+            async def convert(key: str, positions: List[int]):
+                async with semaphore:
+                    result = await self._convert_markdown_chunk(chunks[positions[0]])
+                self.conversion_cache.put(key, result)
+                for i in positions:
+                    results[i] = result
+
+            await asyncio.gather(*(convert(key, positions) for key, positions in missing.items()))
+        return stitch_blocks(results)
+
+    async def _convert_markdown_chunk(self, markdown_content: str) -> Dict:
+        url = f"{self.doc_base_url}/docx/v1/documents/blocks/convert"
+        headers = {
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        payload = {
+            "content_type": "markdown",
+            "content": markdown_content
+        }
+        response = await self._request("POST", url, headers=headers, json=payload)
+        response.raise_for_status()
+        try:
+            data = response.json()
+        except ValueError:
+            logger.error("Error decoding convert response: %.200s", response.text)
+            raise
+        if data.get("code") != 0:
+            raise Exception(f"[AsyncFeishuDocAPI.convert_markdown_to_blocks] API Error: {data.get('msg', 'Unknown error')}, code: {data.get('code')}")
+        converted = data.get("data", {})
+        return {"blocks": converted.get("blocks", []), "first_level_block_ids": first_level_ids(converted)}
+
+    async def create_document(self, folder_token: str, body: dict = None) -> dict:
+        url = f"{self.doc_base_url}/docx/v1/documents"
+        headers = {
+            "Content-Type": "application/json; charset=utf-8"
+        }
+        payload = {"folder_token": folder_token}
+        if body:
+            payload['body'] = body
+        response = await self._request("POST", url, headers=headers, json=payload)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("code") != 0:
+            raise Exception(f"[AsyncFeishuDocAPI.create_document] API Error: {data.get('msg', 'Unknown error')}, code: {data.get('code')}")
+        return data.get("data")
+
+    async def insert_blocks(self, document_id: str, blocks: List[Dict], retries: int = 3, delay: int = 2,
+                            index: Optional[int] = None, parent_id: Optional[str] = None,
+                            batch_size: int = MAX_CHILDREN_PER_REQUEST, max_in_flight: int = 4) -> Dict:
+        """Insert blocks in limit-sized batches. See FeishuDocAPI.insert_blocks."""
+        batches = plan_batches(parent_id or document_id, blocks, index, batch_size)
+        result = await self.insert_batches(document_id, batches, retries, delay, max_in_flight)
+        logger.info("Inserted %d blocks in %d batches", len(blocks), len(batches), extra={"document_id": document_id})
+        return result
+
+    async def insert_block_tree(self, document_id: str, blocks: List[Dict], block_map: Mapping[str, Dict],
+                                retries: int = 3, delay: int = 2, index: Optional[int] = None,
+                                parent_id: Optional[str] = None, max_in_flight: int = 4) -> Dict:
+        """Insert blocks with their descendants. See FeishuDocAPI.insert_block_tree."""
+        batches = plan_descendant_batches(parent_id or document_id, blocks, block_map, index)
+        result = await self.insert_batches(document_id, batches, retries, delay, max_in_flight)
+        logger.info("Inserted %d block trees in %d batches", len(blocks), len(batches), extra={"document_id": document_id})
+        return result
+
+    async def insert_batches(self, document_id: str, batches: List[InsertBatch], retries: int = 3, delay: float = 2,
+                             max_in_flight: int = 4) -> Dict:
+        """
+        Send insert batches with at most `max_in_flight` requests in the air.
+
+        Batches under the same parent shift each other's indexes, so they are sent one
+        after another in order; batches under different parents are independent and run
+        concurrently.
+        """
+        by_parent: Dict[str, List[int]] = {}
+        for position, batch in enumerate(batches):
+            by_parent.setdefault(batch.parent_id, []).append(position)
+
+        results: List[Optional[Dict]] = [None] * len(batches)
+        semaphore = asyncio.Semaphore(max(1, max_in_flight))
+
+        async def run_parent(positions: List[int]):
+            for position in positions:
+                async with semaphore:
+                    results[position] = await self._insert_batch(document_id, batches[position], retries, delay)
+
+        await asyncio.gather(*(run_parent(positions) for positions in by_parent.values()))
+        return merge_results(results)
+
+    async def _insert_batch(self, document_id: str, batch: InsertBatch, retries: int, delay: float) -> Dict:
+        url = f"{self.doc_base_url}/docx/v1/documents/{document_id}/blocks/{batch.parent_id}/{batch_path(batch)}"
+        headers = {
+            "Content-Type": "application/json; charset=utf-8"
+        }
+
+        for attempt in range(retries):
+            try:
+                response = await self._request("POST", url, headers=headers, params=batch_params(batch), json=batch_payload(batch))
+                if is_retryable_status(response.status_code):
+                    raise RetryableInsertError(f"HTTP {response.status_code}: {response.text[:200]}")
+                response.raise_for_status()
+                data = response.json()
+                if data.get("code") == 0:
+                    BLOCKS_INSERTED.inc(len(batch.descendants or batch.children))
+                    return data.get("data")
+                error_msg = f"[AsyncFeishuDocAPI.insert_blocks] API Error: {data.get('msg', 'Unknown error')}, code: {data.get('code')}"
+                if data.get("code") in RETRYABLE_CODES:
+                    raise RetryableInsertError(error_msg)
+                raise Exception(error_msg)
+            except (httpx.TransportError, RetryableInsertError) as e:
+                logger.warning("Batch at index %s attempt %d failed: %s", batch.index, attempt + 1, e)
+                if attempt < retries - 1:
+                    await asyncio.sleep(backoff_delay(attempt, delay))
+                else:
+                    raise
@@ -0,0 +1,84 @@
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional, Tuple, Union
+
+from . import config
+
+# (connect timeout, read timeout) in seconds
+DEFAULT_TIMEOUT = (5, 60)
+DEFAULT_POOL_MAXSIZE = 10
+# Per-host connection pool sizes. Document APIs are paginated and batched, so they
+# get a bigger pool than the auth endpoint, which is hit once per token lifetime.
+DEFAULT_HOST_POOL_SIZES = {
+    "https://open.larkoffice.com": 20,
+    "https://open.feishu.cn": 4,
+}
+
+
+class PooledSession(requests.Session):
+    """
+    A requests.Session with keep-alive connection pools per host, a default timeout
+    and one proxy policy for every request made through it.
+
+    By default environment proxies are ignored (trust_env=False) and connections go
+    directly to Feishu. Pass `proxies` to route through an explicit proxy instead.
+    """
+
+    def __init__(
+        self,
+        timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        host_pool_sizes: Optional[Dict[str, int]] = None,
+        proxies: Optional[Dict[str, str]] = None,
+        trust_env: bool = False,
+    ):
+        super().__init__()
+        self.timeout = timeout
+        self.trust_env = trust_env
+        if proxies:
+            self.proxies.update(proxies)
+
+        default_adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.mount("https://", default_adapter)
+        self.mount("http://", default_adapter)
+        for host_prefix, size in (host_pool_sizes or {}).items():
+            # requests picks the adapter with the longest matching prefix
+            self.mount(host_prefix.rstrip("/") + "/", HTTPAdapter(pool_connections=1, pool_maxsize=size))
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def build_session(trust_env: Optional[bool] = None) -> PooledSession:
+    """Build a PooledSession from the optional HTTP_* settings in api/config.py."""
+    return PooledSession(
+        timeout=getattr(config, "HTTP_TIMEOUT", DEFAULT_TIMEOUT),
+        pool_maxsize=getattr(config, "HTTP_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE),
+        host_pool_sizes=getattr(config, "HTTP_HOST_POOL_SIZES", DEFAULT_HOST_POOL_SIZES),
+        proxies=getattr(config, "HTTP_PROXIES", None),
+        trust_env=getattr(config, "HTTP_TRUST_ENV", False) if trust_env is None else trust_env,
+    )
+
+
+def build_async_client(trust_env: Optional[bool] = None) -> httpx.AsyncClient:
+    """Build an httpx.AsyncClient with the same pool, timeout and proxy settings as build_session."""
+    timeout = getattr(config, "HTTP_TIMEOUT", DEFAULT_TIMEOUT)
+    if isinstance(timeout, tuple):
+        timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+    pool_maxsize = getattr(config, "HTTP_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE)
+    host_pool_sizes = getattr(config, "HTTP_HOST_POOL_SIZES", DEFAULT_HOST_POOL_SIZES)
+    proxies = getattr(config, "HTTP_PROXIES", None) or {}
+    if trust_env is None:
+        trust_env = getattr(config, "HTTP_TRUST_ENV", False)
+
+    def transport(size: int, scheme: str = "https") -> httpx.AsyncHTTPTransport:
+        limits = httpx.Limits(max_connections=size, max_keepalive_connections=size)
+        proxy = proxies.get(scheme)
+        return httpx.AsyncHTTPTransport(limits=limits, proxy=proxy, trust_env=trust_env)
+
+    mounts = {"https://": transport(pool_maxsize), "http://": transport(pool_maxsize, "http")}
+    for host_prefix, size in (host_pool_sizes or {}).items():
+        mounts[host_prefix.rstrip("/")] = transport(size, host_prefix.split(":", 1)[0])
+    return httpx.AsyncClient(timeout=timeout, mounts=mounts, trust_env=trust_env)
@@ -0,0 +1,94 @@
+import json
+import logging
+import sys
+import threading
+from typing import Dict, Optional
+
+from . import config
+
+DEFAULT_LEVEL = "INFO"
+DEFAULT_FORMAT = "text"
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample_every"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, msg, plus every `extra=` field.
+    The message is only formatted here, i.e. after level and sampling checks passed.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps 1 of every N records logged with extra={"sample_every": N}, counted per
+    logger and message template. Meant for per-block / per-page messages that would
+    otherwise flood the output on large documents. Other records pass unchanged.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, "sample_every", None)
+        if not every or every <= 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % every == 0
+
+
+_configured = False
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None, levels: Optional[Dict[str, str]] = None):
+    """
+    Set up the "api" and server loggers from the optional LOG_* settings in api/config.py:
+
+        LOG_LEVEL = "INFO"                      # root level of our loggers
+        LOG_LEVELS = {"api.feishu": "DEBUG"}    # per-module overrides
+        LOG_FORMAT = "json"                     # or "text"
+
+    Safe to call more than once; only the first call installs the handler.
+    """
+    global _configured
+    level = level or getattr(config, "LOG_LEVEL", DEFAULT_LEVEL)
+    fmt = fmt or getattr(config, "LOG_FORMAT", DEFAULT_FORMAT)
+    levels = levels if levels is not None else getattr(config, "LOG_LEVELS", {})
+
+    if not _configured:
+        handler = logging.StreamHandler(sys.stderr)
+        if fmt == "json":
+            handler.setFormatter(JsonFormatter())
+        else:
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        handler.addFilter(SamplingFilter())
+        for name in ("api", "server_http", "server_mcp"):
+            logger = logging.getLogger(name)
+            logger.addHandler(handler)
+            logger.propagate = False
+        _configured = True
+
+    for name in ("api", "server_http", "server_mcp"):
+        logging.getLogger(name).setLevel(level.upper())
+    for name, module_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(module_level.upper())
@@ -0,0 +1,192 @@
+import copy
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Consecutive sections are packed into chunks of up to this size; a single bigger
+# section is split again at paragraph boundaries
+DEFAULT_MAX_CHUNK_CHARS = 20000
+DEFAULT_CACHE_ENTRIES = 2048
+
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+# Chunks may start at `#` and `##` headings only
+_HEADING_RE = re.compile(r'^ {0,3}#{1,2}(\s|$)')
+_CONTINUATION_RE = re.compile(r'^(\s|[-*+]\s|\d+[.)]\s|>|\|)')
+
+
+def split_markdown(markdown_content: str, max_chars: int = DEFAULT_MAX_CHUNK_CHARS) -> List[str]:
+    """
+    Split Markdown into chunks that convert independently.
+
+    The text is cut into sections at `#` and `##` headings; fenced code blocks are
+    never split, so a `#` line inside a fence doesn't count as a heading. Consecutive
+    sections are then packed into chunks of at most `max_chars`, so a document only
+    costs one convert call per `max_chars` of text. A section longer than `max_chars`
+    is split again at blank lines followed by a plain paragraph (a list, quote, table
+    or indented line continues the previous block, so no split happens there), and
+    between lines only where a single block is too long; no chunk exceeds `max_chars`
+    unless one line does. Joining the chunks with '' gives back the original text.
+    """
+    sections: List[List[str]] = [[]]
+    fence = None
+    for line in markdown_content.splitlines(keepends=True):
+        match = _FENCE_RE.match(line)
+        if fence is None:
+            if match:
+                fence = match.group(1)[0] * len(match.group(1))
+            elif _HEADING_RE.match(line) and sections[-1]:
+                sections.append([])
+        elif match and match.group(1).startswith(fence):
+            fence = None
+        sections[-1].append(line)
+
+    chunks = []
+    packed: List[str] = []
+    packed_size = 0
+    for section in sections:
+        if not section:
+            continue
+        text = ''.join(section)
+        if packed and packed_size + len(text) > max_chars:
+            chunks.append(''.join(packed))
+            packed, packed_size = [], 0
+        if len(text) > max_chars:
+            chunks.extend(_split_large_section(section, max_chars))
+            continue
+        packed.append(text)
+        packed_size += len(text)
+    if packed:
+        chunks.append(''.join(packed))
+    return chunks
+
+
+def _split_large_section(lines: List[str], max_chars: int) -> List[str]:
+    """
+    Split one section into chunks of at most `max_chars`.
+
+    The section is cut into units at blank lines followed by a plain paragraph
+    (outside fences), and units are packed while they fit. A unit that is longer than
+    `max_chars` on its own is cut between lines instead; only a single line longer
+    than `max_chars` becomes a chunk over the limit.
+    """
+    if sum(len(line) for line in lines) <= max_chars:
+        return [''.join(lines)]
+    units: List[List[str]] = [[]]
+    fence = None
+    previous_blank = False
+    for line in lines:
+        match = _FENCE_RE.match(line)
+        if (fence is None and previous_blank and units[-1]
+                and line.strip() and not _CONTINUATION_RE.match(line)):
+            units.append([])
+        if fence is None and match:
+            fence = match.group(1)[0] * len(match.group(1))
+        elif fence is not None and match and match.group(1).startswith(fence):
+            fence = None
+        units[-1].append(line)
+        previous_blank = not line.strip()
+
+    chunks = []
+    current: List[str] = []
+    size = 0
+    for unit in units:
+        unit_size = sum(len(line) for line in unit)
+        pieces = [unit] if unit_size <= max_chars else [[line] for line in unit]
+        for piece in pieces:
+            piece_size = sum(len(line) for line in piece)
+            if current and size + piece_size > max_chars:
+                chunks.append(''.join(current))
+                current, size = [], 0
+            current.extend(piece)
+            size += piece_size
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+
+def chunk_key(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+
+
+class ConversionCache:
+    """
+    LRU of conversion results keyed by the SHA-256 of the Markdown chunk. A result is
+    the convert API's data: {"blocks": [...], "first_level_block_ids": [...]}.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            converted = self._entries.get(key)
+            if converted is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return converted
+
+    def put(self, key: str, converted: Dict):
+        with self._lock:
+            self._entries[key] = converted
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def first_level_ids(converted: Dict) -> List[str]:
+    """
+    Ids of a conversion result's top-level blocks, in order. Taken from
+    first_level_block_ids; without it, the blocks no other block lists as a child.
+    """
+    ids = converted.get('first_level_block_ids')
+    if ids is not None:
+        return list(ids)
+    blocks = converted.get('blocks', [])
+    nested = {child for block in blocks for child in block.get('children', [])}
+    return [block['block_id'] for block in blocks if block.get('block_id') not in nested]
+
+
+def stitch_blocks(chunk_results: List[Dict]) -> Dict:
+    """
+    Concatenate per-chunk conversion results in order, into one result of the same
+    shape: {"blocks": [...], "first_level_block_ids": [...]}.
+
+    Results may come from the cache, and the same chunk can appear twice in a file, so
+    blocks are copied. Temporary block_ids that repeat across chunks are renamed, along
+    with the children/parent_id/first-level references to them inside that chunk.
+    """
+    stitched = []
+    first_level = []
+    seen = set()
+    for chunk_index, converted in enumerate(chunk_results):
+        blocks = copy.deepcopy(converted.get('blocks', []))
+        top = first_level_ids(converted)
+        renames = {}
+        for block in blocks:
+            block_id = block.get('block_id')
+            if block_id is not None and block_id in seen:
+                renames[block_id] = f"{block_id}_{chunk_index}"
+        if renames:
+            for block in blocks:
+                if block.get('block_id') in renames:
+                    block['block_id'] = renames[block['block_id']]
+                if block.get('parent_id') in renames:
+                    block['parent_id'] = renames[block['parent_id']]
+                if 'children' in block:
+                    block['children'] = [renames.get(child, child) for child in block['children']]
+            top = [renames.get(block_id, block_id) for block_id in top]
+        seen.update(block.get('block_id') for block in blocks)
+        stitched.extend(blocks)
+        first_level.extend(top)
+    return {"blocks": stitched, "first_level_block_ids": first_level}
@@ -0,0 +1,305 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import unquote
+
+from .block_tree import BlockTree
+
+# --- Feishu block types ---
+PAGE = 1
+TEXT = 2
+HEADING1 = 3
+HEADING9 = 11
+BULLET = 12
+ORDERED = 13
+CODE = 14
+QUOTE = 15
+EQUATION = 16
+TODO = 17
+CALLOUT = 19
+DIVIDER = 22
+IMAGE = 27
+TABLE = 31
+TABLE_CELL = 32
+QUOTE_CONTAINER = 34
+
+# Block type -> key holding its text payload
+TEXT_KEYS = {
+    PAGE: 'page', TEXT: 'text', BULLET: 'bullet', ORDERED: 'ordered', CODE: 'code',
+    QUOTE: 'quote', EQUATION: 'equation', TODO: 'todo',
+}
+TEXT_KEYS.update({bt: f'heading{bt - HEADING1 + 1}' for bt in range(HEADING1, HEADING9 + 1)})
+
+# docx code block language enum -> fence info string
+CODE_LANGUAGES = {
+    1: '', 7: 'bash', 8: 'csharp', 9: 'cpp', 10: 'c', 12: 'css', 15: 'dart', 18: 'dockerfile',
+    22: 'go', 23: 'groovy', 24: 'html', 26: 'http', 27: 'haskell', 28: 'json', 29: 'java',
+    30: 'javascript', 32: 'kotlin', 33: 'latex', 36: 'lua', 38: 'makefile', 39: 'markdown',
+    40: 'nginx', 41: 'objectivec', 43: 'php', 44: 'perl', 46: 'powershell', 48: 'protobuf',
+    49: 'python', 50: 'r', 52: 'ruby', 53: 'rust', 55: 'scss', 56: 'sql', 57: 'scala',
+    60: 'shell', 61: 'swift', 62: 'thrift', 63: 'typescript', 66: 'xml', 67: 'yaml',
+    68: 'cmake', 69: 'diff', 71: 'graphql', 73: 'properties', 74: 'solidity', 75: 'toml',
+}
+
+
+# --- Inline Rendering ---
+def _wrap(content: str, marker: str, closing: Optional[str] = None) -> str:
+    # Emphasis markers must hug the text, so keep surrounding whitespace outside them
+    stripped = content.strip()
+    if not stripped:
+        return content
+    start = content.index(stripped[0])
+    end = start + len(stripped)
+    return f"{content[:start]}{marker}{stripped}{closing if closing is not None else marker}{content[end:]}"
+
+
+def render_elements(elements: List[Dict], plain: bool = False) -> str:
+    """Render a block's text elements to inline Markdown. `plain` skips styling (code blocks)."""
+    parts = []
+    for element in elements:
+        text_run = element.get('text_run')
+        if text_run is not None:
+            content = text_run.get('content', '')
+            style = text_run.get('text_element_style') or {}
+            if plain or not style or not content.strip():
+                parts.append(content)
+                continue
+            if style.get('inline_code'):
+                content = _wrap(content, '`')
+            else:
+                if style.get('bold'):
+                    content = _wrap(content, '**')
+                if style.get('italic'):
+                    content = _wrap(content, '*')
+                if style.get('strikethrough'):
+                    content = _wrap(content, '~~')
+                if style.get('underline'):
+                    content = _wrap(content, '<u>', '</u>')
+            link = style.get('link')
+            if link and link.get('url'):
+                content = f"[{content}]({unquote(link['url'])})"
+            parts.append(content)
+        elif 'mention_doc' in element:
+            doc = element['mention_doc']
+            parts.append(f"[{doc.get('title', '')}]({unquote(doc.get('url', ''))})")
+        elif 'mention_user' in element:
+            parts.append(f"@{element['mention_user'].get('user_id', '')}")
+        elif 'equation' in element:
+            parts.append(f"${element['equation'].get('content', '').strip()}$")
+    return ''.join(parts)
+
+
+def _indent_lines(text: str, first_prefix: str, rest_prefix: str) -> str:
+    lines = text.split('\n')
+    return '\n'.join([first_prefix + lines[0]] + [rest_prefix + line if line else rest_prefix.rstrip() for line in lines[1:]])
+
+
+def _table_cell_text(segments: List[str]) -> str:
+    return '<br>'.join(s.replace('\n', '<br>') for s in segments).replace('|', '\\|')
+
+
+# --- Markdown Parsing Functions ---
+class _Frame:
+    """An open block on the renderer stack."""
+    __slots__ = ('block_id', 'block_type', 'block', 'sink', 'indent', 'outer_sink', 'outer_indent',
+                 'prev_type', 'ordered_seq', 'cells')
+
+    def __init__(self, block_id, block_type, block, sink, indent, outer_sink, outer_indent):
+        self.block_id = block_id
+        self.block_type = block_type
+        self.block = block
+        self.sink = sink                  # where children write their segments
+        self.indent = indent              # line prefix for children
+        self.outer_sink = outer_sink      # where this block itself writes
+        self.outer_indent = outer_indent
+        self.prev_type = None             # type of the previous child, for ordered list numbering
+        self.ordered_seq = 0
+        self.cells = None                 # table only: cell_id -> list of segments
+
+
+class MarkdownRenderer:
+    """
+    Single-pass, incremental block-to-Markdown renderer.
+
+    Blocks must be fed in document (pre-)order, which is the order the `/blocks`
+    list API returns them. Each block is visited exactly once; open ancestors are
+    kept on an explicit stack, so there is no recursion and no depth limit. Memory
+    is bounded by the nesting depth plus any table/callout currently being built:
+
+        renderer = MarkdownRenderer()
+        for page in api.iter_block_pages(document_id):
+            segments = renderer.feed(page)
+        segments = renderer.finish()
+    """
+
+    def __init__(self):
+        self._out: List[str] = []
+        self._stack: List[_Frame] = []
+        self._open: Dict[str, _Frame] = {}
+        self._root = _Frame(None, None, None, self._out, '', self._out, '')
+
+    def feed(self, blocks: Iterable[Dict]) -> List[str]:
+        """Render a batch of blocks and return the Markdown segments that are complete."""
+        for block in blocks:
+            self._feed_block(block)
+        out, self._out[:] = list(self._out), []
+        return out
+
+    def finish(self) -> List[str]:
+        """Close every open block once the last block has been fed and flush what's left."""
+        while self._stack:
+            self._close(self._stack.pop())
+        out, self._out[:] = list(self._out), []
+        return out
+
+    def _parent_frame(self, parent_id: Optional[str]) -> _Frame:
+        if parent_id and parent_id in self._open:
+            stack = self._stack
+            while stack[-1].block_id != parent_id:
+                self._close(stack.pop())
+            return stack[-1]
+        # Root block, or a parent we never saw: close everything and attach to the root
+        while self._stack:
+            self._close(self._stack.pop())
+        return self._root
+
+    def _close(self, frame: _Frame):
+        del self._open[frame.block_id]
+        bt = frame.block_type
+        if bt in (CALLOUT, QUOTE_CONTAINER):
+            if frame.sink:
+                quoted = '\n>\n'.join(_indent_lines(s, '> ', '> ') for s in frame.sink)
+                frame.outer_sink.append(_indent_lines(quoted, frame.outer_indent, frame.outer_indent))
+        elif bt == TABLE:
+            table = self._render_table(frame)
+            if table:
+                frame.outer_sink.append(_indent_lines(table, frame.outer_indent, frame.outer_indent))
+
+    @staticmethod
+    def _render_table(frame: _Frame) -> str:
+        table = frame.block.get('table', {})
+        cell_ids = table.get('cells', [])
+        columns = table.get('property', {}).get('column_size') or len(cell_ids) or 1
+        if not cell_ids:
+            return ''
+        rows = []
+        for start in range(0, len(cell_ids), columns):
+            row = [_table_cell_text(frame.cells.get(cell_id, [])) for cell_id in cell_ids[start:start + columns]]
+            rows.append('| ' + ' | '.join(row) + ' |')
+        rows.insert(1, '|' + ' --- |' * columns)
+        return '\n'.join(rows)
+
+    def _feed_block(self, block: Dict):
+        block_id = block.get('block_id')
+        bt = block.get('block_type')
+        parent = self._parent_frame(block.get('parent_id'))
+        sink, indent = parent.sink, parent.indent
+
+        if bt == ORDERED:
+            if parent.prev_type == ORDERED:
+                parent.ordered_seq += 1
+            else:
+                sequence = block.get('ordered', {}).get('style', {}).get('sequence')
+                parent.ordered_seq = int(sequence) if sequence and str(sequence).isdigit() else 1
+        parent.prev_type = bt
+
+        child_sink, child_indent = sink, indent
+        text_key = TEXT_KEYS.get(bt)
+
+        if bt == CODE:
+            code = block.get('code', {})
+            language = CODE_LANGUAGES.get(code.get('style', {}).get('language'), '')
+            content = render_elements(code.get('elements', []), plain=True).rstrip('\n')
+            sink.append(_indent_lines(f"```{language}\n{content}\n```", indent, indent))
+        elif text_key is not None:
+            content = render_elements(block.get(text_key, {}).get('elements', []))
+            if bt == PAGE:
+                if content.strip():
+                    sink.append(f"# {content.strip()}")
+            elif HEADING1 <= bt <= HEADING9:
+                if content.strip():
+                    sink.append(f"{indent}{'#' * min(bt - HEADING1 + 1, 6)} {content.strip()}")
+            elif bt == BULLET:
+                sink.append(_indent_lines(content.strip(), f"{indent}- ", indent + '  '))
+                child_indent = indent + '  '
+            elif bt == ORDERED:
+                marker = f"{parent.ordered_seq}. "
+                sink.append(_indent_lines(content.strip(), indent + marker, indent + ' ' * len(marker)))
+                child_indent = indent + ' ' * len(marker)
+            elif bt == TODO:
+                done = block.get('todo', {}).get('style', {}).get('done')
+                sink.append(_indent_lines(content.strip(), f"{indent}- [{'x' if done else ' '}] ", indent + '  '))
+                child_indent = indent + '  '
+            elif bt == QUOTE:
+                if content.strip():
+                    sink.append(_indent_lines(content.strip(), f"{indent}> ", f"{indent}> "))
+            elif bt == EQUATION:
+                sink.append(f"{indent}$$\n{indent}{content.strip()}\n{indent}$$")
+            elif content.strip():
+                sink.append(_indent_lines(content.strip(), indent, indent))
+        elif bt == DIVIDER:
+            sink.append(f"{indent}---")
+        elif bt == IMAGE:
+            token = block.get('image', {}).get('token', '')
+            sink.append(f"{indent}![image]({token})")
+        elif bt in (CALLOUT, QUOTE_CONTAINER):
+            child_sink, child_indent = [], ''
+        elif bt == TABLE:
+            child_sink, child_indent = [], ''
+        elif bt == TABLE_CELL:
+            if parent.block_type == TABLE:
+                child_sink = parent.cells.setdefault(block_id, [])
+            else:
+                child_sink = []
+            child_indent = ''
+        # Any other block type (grid, grid_column, ...) is a transparent container
+
+        frame = _Frame(block_id, bt, block if bt == TABLE else None, child_sink, child_indent, sink, indent)
+        if bt == TABLE:
+            frame.cells = {}
+        self._stack.append(frame)
+        self._open[block_id] = frame
+
+
+def iter_preorder(blocks: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Yield a complete block list in document order, starting from the page root and
+    following each block's `children`. Every block is yielded exactly once; blocks
+    that are not reachable from the root are yielded at the end in input order.
+    A BlockTree is walked over its own index arrays.
+    """
+    if isinstance(blocks, BlockTree):
+        yield from blocks.preorder()
+        return
+    block_map = {}
+    roots = []
+    for block in blocks:
+        block_map[block['block_id']] = block
+        if not block.get('parent_id'):
+            roots.append(block['block_id'])
+    seen = set()
+    stack = list(reversed(roots))
+    while stack:
+        block_id = stack.pop()
+        if block_id in seen or block_id not in block_map:
+            continue
+        seen.add(block_id)
+        block = block_map[block_id]
+        yield block
+        stack.extend(reversed(block.get('children', [])))
+    for block_id, block in block_map.items():
+        if block_id not in seen:
+            yield block
+
+
+def render_blocks_to_md(blocks: Iterable[Dict]) -> str:
+    """Render blocks that are already in document order."""
+    renderer = MarkdownRenderer()
+    segments = renderer.feed(blocks)
+    segments.extend(renderer.finish())
+    return '\n\n'.join(segments)
+
+
+def parse_blocks_to_md(data: dict) -> str:
+    items = data.get('data', {}).get('items', [])
+    if not items:
+        return ''
+    return render_blocks_to_md(iter_preorder(items))
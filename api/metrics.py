@@ -0,0 +1,266 @@
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Latency buckets in seconds; Feishu calls range from tens of ms to tens of seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PAGE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple, **extra) -> Dict:
+        labels = dict(zip(self.labelnames, key))
+        labels.update(extra)
+        return labels
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}"
+                                for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count], sum
+        self._counts: Dict[Tuple, List[int]] = {}
+        self._sums: Dict[Tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[position] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        lines = self.header()
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self._labels(key, le=_format_value(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self._labels(key))} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self._labels(key))} {cumulative}")
+        return lines
+
+
+# A collector returns (name, type, help, [(labels, value), ...]) tuples, read at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict, float]]]]]
+
+
+class MetricsRegistry:
+    """
+    Process-wide set of metrics, rendered in the Prometheus text exposition format.
+
+    Counters and histograms are updated as things happen. Values that already live
+    elsewhere (cache hit/miss counters, rate-limiter stats) are read through
+    collectors when the metrics are rendered instead of being copied on every call.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Collector] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, name: str, collector: Collector):
+        """Add (or replace) a scrape-time collector under `name`."""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for collector in list(self._collectors.values()):
+            for name, kind, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+FEISHU_REQUESTS = REGISTRY.counter(
+    "feishu_requests_total", "Feishu API calls by endpoint, HTTP status and the Feishu error code of failed responses.",
+    ("endpoint", "status", "code"))
+FEISHU_LATENCY = REGISTRY.histogram(
+    "feishu_request_duration_seconds", "Latency of single Feishu API calls (each retry counts separately).",
+    ("endpoint",))
+DOCUMENT_PAGES = REGISTRY.histogram(
+    "feishu_document_pages", "/blocks pages fetched per document read.", buckets=PAGE_BUCKETS)
+BLOCKS_INSERTED = REGISTRY.counter("feishu_blocks_inserted_total", "Blocks inserted into documents.")
+TOKEN_REFRESHES = REGISTRY.counter(
+    "feishu_token_refreshes_total", "User access token refreshes by result.", ("result",))
+ROUTE_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP server requests by route, method and status.", ("route", "method", "status"))
+ROUTE_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP server request latency by route.", ("route",))
+TOOL_CALLS = REGISTRY.counter("mcp_tool_calls_total", "MCP tool calls by tool and outcome.", ("tool", "status"))
+TOOL_LATENCY = REGISTRY.histogram("mcp_tool_duration_seconds", "MCP tool call latency by tool.", ("tool",))
+
+_caches: Dict[str, object] = {}
+
+
+def register_cache(name: str, cache):
+    """Report a cache's `hits` / `misses` counters (and hit ratio) under cache=`name`."""
+    _caches[name] = cache
+
+
+def _cache_collector():
+    caches = sorted(_caches.items())
+    hits = [({"cache": name}, cache.hits) for name, cache in caches]
+    misses = [({"cache": name}, cache.misses) for name, cache in caches]
+    ratios = [({"cache": name}, cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0)
+              for name, cache in caches]
+    return [
+        ("cache_hits_total", "counter", "Cache hits by cache.", hits),
+        ("cache_misses_total", "counter", "Cache misses by cache.", misses),
+        ("cache_hit_ratio", "gauge", "hits / (hits + misses) since start, by cache.", ratios),
+    ]
+
+
+REGISTRY.register_collector("caches", _cache_collector)
+
+
+def response_code(response) -> int:
+    """Feishu error code of a failed response (0 when it succeeded or carries none)."""
+    if response.status_code < 400:
+        return 0
+    try:
+        data = response.json()
+    except ValueError:
+        return 0
+    return data.get("code", 0) if isinstance(data, dict) else 0
+
+
+def observe_feishu_call(endpoint: str, response, elapsed: float):
+    """Record one Feishu call; `response` is None when it failed before getting one."""
+    FEISHU_LATENCY.observe(elapsed, endpoint=endpoint)
+    if response is None:
+        FEISHU_REQUESTS.inc(endpoint=endpoint, status="error", code="")
+    else:
+        FEISHU_REQUESTS.inc(endpoint=endpoint, status=response.status_code, code=response_code(response))
+
+
+def instrument_tool(func):
+    """Record call count, outcome and latency of an MCP tool (sync or async)."""
+    name = func.__name__
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            status = "error"
+            with TOOL_LATENCY.time(tool=name):
+                try:
+                    result = await func(*args, **kwargs)
+                    status = "success"
+                    return result
+                finally:
+                    TOOL_CALLS.inc(tool=name, status=status)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        status = "error"
+        with TOOL_LATENCY.time(tool=name):
+            try:
+                result = func(*args, **kwargs)
+                status = "success"
+                return result
+            finally:
+                TOOL_CALLS.inc(tool=name, status=status)
+    return wrapper
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
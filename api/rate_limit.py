@@ -0,0 +1,247 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from . import config
+from .metrics import REGISTRY
+
+# Feishu error code for "request frequency limit exceeded"
+FREQUENCY_LIMIT_CODE = 99991400
+
+# Documented per-app QPS quotas of the endpoints we call. Override any of them with
+# RATE_LIMITS = {"docx.blocks.list": 3, ...} in api/config.py.
+DEFAULT_RATE_LIMITS = {
+    "auth.refresh": 10,
+    "docx.document.get": 5,
+    "docx.document.raw_content": 5,
+    "docx.document.create": 3,
+    "docx.blocks.list": 5,
+    "docx.blocks.children": 5,
+    "docx.blocks.children.create": 3,
+    "docx.blocks.descendant.create": 3,
+    "docx.blocks.batch_delete": 3,
+    "docx.blocks.batch_update": 3,
+    "docx.blocks.convert": 5,
+    "wiki.node.get": 5,
+    "default": 5,
+}
+
+DEFAULT_MAX_THROTTLE_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_CAP = 30.0
+
+# (method, path regex) -> endpoint name, checked in order
+_ENDPOINT_PATTERNS = [
+    ("POST", re.compile(r"/authen/v1/refresh_access_token$"), "auth.refresh"),
+    ("POST", re.compile(r"/docx/v1/documents/blocks/convert$"), "docx.blocks.convert"),
+    ("POST", re.compile(r"/docx/v1/documents$"), "docx.document.create"),
+    ("GET", re.compile(r"/docx/v1/documents/[^/]+/raw_content$"), "docx.document.raw_content"),
+    ("GET", re.compile(r"/docx/v1/documents/[^/]+/blocks$"), "docx.blocks.list"),
+    ("GET", re.compile(r"/docx/v1/documents/[^/]+/blocks/[^/]+/children$"), "docx.blocks.children"),
+    ("POST", re.compile(r"/docx/v1/documents/[^/]+/blocks/[^/]+/children$"), "docx.blocks.children.create"),
+    ("POST", re.compile(r"/docx/v1/documents/[^/]+/blocks/[^/]+/descendant$"), "docx.blocks.descendant.create"),
+    ("DELETE", re.compile(r"/children/batch_delete$"), "docx.blocks.batch_delete"),
+    ("PATCH", re.compile(r"/docx/v1/documents/[^/]+/blocks/batch_update$"), "docx.blocks.batch_update"),
+    ("GET", re.compile(r"/docx/v1/documents/[^/]+$"), "docx.document.get"),
+    ("GET", re.compile(r"/wiki/v2/spaces/get_node$"), "wiki.node.get"),
+]
+
+
+def endpoint_for(method: str, url: str) -> str:
+    """Map a request to the name of the quota it counts against."""
+    path = url.split("?", 1)[0]
+    method = method.upper()
+    for pattern_method, pattern, name in _ENDPOINT_PATTERNS:
+        if method == pattern_method and pattern.search(path):
+            return name
+    return "default"
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second, holding at most `capacity`.
+
+    `reserve` takes a token immediately, letting the balance go negative, and returns
+    how long the caller has to wait before using it. Waiting happens outside the lock,
+    so the same bucket can serve threads and asyncio tasks alike. `clock` is the
+    time source (time.monotonic; tests pass a fake one).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._blocked_until - now)
+
+    def block_for(self, seconds: float):
+        """Hold every caller back for `seconds` (the server told us to slow down)."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+
+class EndpointStats:
+    __slots__ = ("requests", "throttled", "throttled_seconds", "server_throttled", "retries")
+
+    def __init__(self):
+        self.requests = 0
+        self.throttled = 0             # calls that had to wait for a local token
+        self.throttled_seconds = 0.0   # total time spent waiting, local and server-imposed
+        self.server_throttled = 0      # 429 / frequency-limit responses received
+        self.retries = 0
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RateLimiter:
+    """
+    Per-endpoint token buckets shared by every client in the process.
+
+    Callers reserve a token before each request (`acquire` / `acquire_async`). When
+    Feishu still answers with HTTP 429 or the frequency-limit code, `throttle_delay`
+    works out how long to back off: the reset time from `Retry-After` or
+    `x-ogw-ratelimit-reset` if present, otherwise exponential backoff with jitter.
+    It also pauses the endpoint's bucket for that long, so concurrent callers back
+    off together instead of stampeding. The per-endpoint stats are updated under the
+    same lock that guards the buckets.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, float]] = None, max_retries: int = DEFAULT_MAX_THROTTLE_RETRIES,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_cap: float = DEFAULT_BACKOFF_CAP,
+                 clock: Callable[[], float] = time.monotonic):
+        self.limits = dict(DEFAULT_RATE_LIMITS)
+        self.limits.update(limits or {})
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._clock = clock
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._stats: Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, endpoint: str) -> TokenBucket:
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(endpoint)
+                if bucket is None:
+                    rate = self.limits.get(endpoint, self.limits["default"])
+                    bucket = self._buckets[endpoint] = TokenBucket(rate, clock=self._clock)
+                    self._stats[endpoint] = EndpointStats()
+        return bucket
+
+    def _reserve(self, endpoint: str) -> float:
+        wait = self._bucket(endpoint).reserve()
+        with self._lock:
+            stats = self._stats[endpoint]
+            stats.requests += 1
+            if wait > 0:
+                stats.throttled += 1
+                stats.throttled_seconds += wait
+        return wait
+
+    def acquire(self, endpoint: str):
+        wait = self._reserve(endpoint)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, endpoint: str):
+        wait = self._reserve(endpoint)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    def _is_throttled(response) -> bool:
+        if response.status_code == 429:
+            return True
+        if response.status_code < 400:
+            return False
+        try:
+            data = response.json()
+        except ValueError:
+            return False
+        return isinstance(data, dict) and data.get("code") == FREQUENCY_LIMIT_CODE
+
+    @staticmethod
+    def _reset_after(response) -> Optional[float]:
+        for header in ("Retry-After", "x-ogw-ratelimit-reset"):
+            value = response.headers.get(header)
+            if value:
+                try:
+                    return max(0.0, float(value))
+                except ValueError:
+                    continue
+        return None
+
+    def throttle_delay(self, endpoint: str, response, attempt: int) -> Optional[float]:
+        """
+        None if `response` isn't a throttling response or retries are used up,
+        otherwise how many seconds to wait before retrying.
+        """
+        if not self._is_throttled(response):
+            return None
+        bucket = self._bucket(endpoint)
+        with self._lock:
+            stats = self._stats[endpoint]
+            stats.server_throttled += 1
+            if attempt >= self.max_retries:
+                return None
+            stats.retries += 1
+        backoff = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        reset = self._reset_after(response)
+        delay = max(reset, backoff) if reset is not None else backoff
+        bucket.block_for(delay)
+        with self._lock:
+            stats.throttled_seconds += delay
+        return delay
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-endpoint counters: requests, throttled waits and seconds, 429s, retries."""
+        with self._lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self._stats.items()}
+
+    def collect_metrics(self):
+        """Scrape-time collector exposing `stats()` as Prometheus counters."""
+        stats = sorted(self.stats().items())
+        return [
+            ("feishu_rate_limit_waits_total", "counter", "Calls that waited for a local rate-limit token, by endpoint.",
+             [({"endpoint": endpoint}, s["throttled"]) for endpoint, s in stats]),
+            ("feishu_rate_limit_wait_seconds_total", "counter", "Time spent waiting on rate limits, by endpoint.",
+             [({"endpoint": endpoint}, s["throttled_seconds"]) for endpoint, s in stats]),
+            ("feishu_throttled_responses_total", "counter", "429 / frequency-limit responses, by endpoint.",
+             [({"endpoint": endpoint}, s["server_throttled"]) for endpoint, s in stats]),
+        ]
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def default_rate_limiter() -> RateLimiter:
+    """The process-wide limiter, built from RATE_LIMITS / RATE_LIMIT_MAX_RETRIES in api/config.py."""
+    global _default_limiter
+    if _default_limiter is None:
+        with _default_lock:
+            if _default_limiter is None:
+                _default_limiter = RateLimiter(
+                    limits=getattr(config, "RATE_LIMITS", None),
+                    max_retries=getattr(config, "RATE_LIMIT_MAX_RETRIES", DEFAULT_MAX_THROTTLE_RETRIES),
+                )
+                REGISTRY.register_collector("rate_limit", _default_limiter.collect_metrics)
+    return _default_limiter
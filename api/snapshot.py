@@ -0,0 +1,49 @@
+from typing import Dict, Iterable, List, Optional
+
+from .block_tree import Block, BlockTree
+
+
+class DocumentSnapshot:
+    """
+    A document's blocks as read at one revision, with the lookups the write flows
+    need built once: blocks by id, each parent's children in order, the first
+    heading (the title the replace flow keeps).
+
+    Take one with `get_snapshot` and hand it to the operations of the same flow
+    (delete_blocks_after_title, get_deletable_blocks, the diff update) instead of
+    letting each of them download the document again. It describes the document at
+    `revision_id`; after a write, take a new one.
+
+    The blocks are held in a BlockTree; `blocks` may also be a plain list of block dicts.
+    """
+
+    def __init__(self, document_id: str, revision_id: Optional[int], blocks: Iterable[Dict]):
+        self.document_id = document_id
+        self.revision_id = revision_id
+        self.tree = blocks if isinstance(blocks, BlockTree) else BlockTree.from_blocks(blocks)
+        self.by_id = self.tree
+        self.title_block_id: Optional[str] = self.tree.first_of_type(3)
+
+    @property
+    def blocks(self):
+        """Every block, in the order read."""
+        return self.tree.values()
+
+    @property
+    def root(self) -> Optional[Block]:
+        """The page block; its children are the top-level blocks."""
+        return self.tree.get(self.document_id)
+
+    def children(self, parent_id: Optional[str] = None) -> List[str]:
+        """Child ids of `parent_id` (the root by default), in document order."""
+        return self.tree.children(parent_id or self.document_id)
+
+    def index_of(self, block_id: str, parent_id: Optional[str] = None) -> Optional[int]:
+        """Position of `block_id` among its parent's children, or None."""
+        if parent_id is None:
+            block = self.tree.get(block_id)
+            parent_id = (block.get('parent_id') if block else None) or self.document_id
+        return self.tree.child_position(parent_id, block_id)
+
+    def __len__(self) -> int:
+        return len(self.tree)
@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional, Tuple
+
+from .metrics import TOKEN_REFRESHES
+from .token_store import MemoryTokenStore, TokenState, TokenStore
+
+# Feishu error codes returned when the user access token is missing, invalid or expired
+AUTH_ERROR_CODES = {99991661, 99991663, 99991668, 99991677}
+
+# Refresh this many seconds before the token actually expires
+DEFAULT_REFRESH_AHEAD = 300
+
+# refresh_func(refresh_token) -> (access_token, expires_in_seconds, new_refresh_token or None)
+RefreshResult = Tuple[str, int, Optional[str]]
+
+
+class RefreshTokenRejected(Exception):
+    """
+    Raised by `refresh_func` when the refresh token itself is no longer valid. The
+    manager clears the store (still under its lock) and re-raises, so the next
+    attempt asks for a re-authorization instead of retrying the dead token.
+    """
+
+
+class TokenManager:
+    """
+    Keeps the user access token in memory together with its expiry time, backed by
+    a TokenStore that other processes may share.
+
+    `refresh_func(refresh_token)` performs the real refresh round-trip. It is only
+    called when neither memory nor the store has a usable token: none cached, about
+    to expire, or invalidated because an API call was rejected with an auth error.
+    Refreshes run under the store's cross-process lock, and a token another process
+    saved in the meantime is adopted instead of rotating the refresh token again.
+    """
+
+    def __init__(self, refresh_func: Callable[[Optional[str]], RefreshResult], store: Optional[TokenStore] = None,
+                 refresh_ahead: int = DEFAULT_REFRESH_AHEAD):
+        self._refresh_func = refresh_func
+        self.store = store or MemoryTokenStore()
+        self.refresh_ahead = refresh_ahead
+        self._access_token: Optional[str] = None
+        self._expires_at = 0.0
+        # Last token rejected by the API; never adopted from the store again
+        self._rejected: Optional[str] = None
+        # Bumped on every successful refresh, so callers can tell one happened while they waited
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _usable(self, token: Optional[str], expires_at: float) -> bool:
+        return bool(token) and time.time() < expires_at - self.refresh_ahead
+
+    def _is_fresh(self) -> bool:
+        return self._usable(self._access_token, self._expires_at)
+
+    def get_token(self) -> str:
+        if self._is_fresh():
+            return self._access_token
+        with self._lock:
+            # Another thread may have refreshed while we were waiting for the lock
+            if not self._is_fresh():
+                self._refresh_locked(self._access_token or self._rejected)
+            return self._access_token
+
+    def refresh(self) -> str:
+        """
+        Force a refresh regardless of the cached token's expiry. Concurrent callers
+        share one round-trip: whoever waited for the lock while another refresh
+        completed gets that token instead of rotating the refresh token again.
+        """
+        generation = self._generation
+        stale = self._access_token
+        with self._lock:
+            if self._generation == generation:
+                self._refresh_locked(stale)
+            return self._access_token
+
+    def _refresh_locked(self, stale: Optional[str]):
+        with self.store.lock() as handle:
+            state = self.store.load(handle)
+            if state.access_token != stale and self._usable(state.access_token, state.expires_at):
+                self._adopt(state)
+                return
+            try:
+                access_token, expires_in, new_refresh_token = self._refresh_func(state.refresh_token)
+            except RefreshTokenRejected:
+                TOKEN_REFRESHES.inc(result="failure")
+                self.store.clear(handle)
+                raise
+            except Exception:
+                TOKEN_REFRESHES.inc(result="failure")
+                raise
+            TOKEN_REFRESHES.inc(result="success")
+            state = TokenState(new_refresh_token or state.refresh_token, access_token, time.time() + (expires_in or 0))
+            self.store.save(state, handle)
+        self._adopt(state)
+
+    def _adopt(self, state: TokenState):
+        self._access_token = state.access_token
+        self._expires_at = state.expires_at
+        self._generation += 1
+
+    def invalidate(self, access_token: Optional[str] = None):
+        """
+        Drop the cached token so the next `get_token` refreshes it.
+        If `access_token` is given, only invalidate when it is still the cached one,
+        so a token that was already replaced by another caller is not thrown away.
+        """
+        with self._lock:
+            if access_token is None or access_token == self._access_token:
+                self._rejected = self._access_token
+                self._access_token = None
+                self._expires_at = 0.0
+
+    @property
+    def expires_at(self) -> float:
+        return self._expires_at
+
+
+class AsyncTokenManager(TokenManager):
+    """
+    asyncio counterpart of TokenManager; `refresh_func` is a coroutine function.
+    The whole locked section's store calls (acquire, load, save / clear) run on the
+    manager's own worker thread, so waiting for another process's refresh doesn't
+    block the event loop, and lock waits elsewhere can't use up the threads the
+    holder needs to finish. The handle from `acquire` is passed to every store call.
+    """
+
+    def __init__(self, refresh_func: Callable[[Optional[str]], Awaitable[RefreshResult]], store: Optional[TokenStore] = None,
+                 refresh_ahead: int = DEFAULT_REFRESH_AHEAD):
+        super().__init__(refresh_func, store, refresh_ahead)
+        self._lock = asyncio.Lock()
+        # One thread is enough: refreshes are serialized by self._lock
+        self._store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="token-store")
+
+    async def get_token(self) -> str:
+        if self._is_fresh():
+            return self._access_token
+        async with self._lock:
+            if not self._is_fresh():
+                await self._refresh_locked(self._access_token or self._rejected)
+            return self._access_token
+
+    async def refresh(self) -> str:
+        generation = self._generation
+        stale = self._access_token
+        async with self._lock:
+            if self._generation == generation:
+                await self._refresh_locked(stale)
+            return self._access_token
+
+    async def _acquire_store(self):
+        future = asyncio.get_running_loop().run_in_executor(self._store_executor, self.store.acquire)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The worker still takes the lock; give it back once it has (release doesn't wait)
+            future.add_done_callback(lambda f: f.cancelled() or f.exception() or self.store.release(f.result()))
+            raise
+
+    async def _refresh_locked(self, stale: Optional[str]):
+        handle = await self._acquire_store()
+        loop, executor = asyncio.get_running_loop(), self._store_executor
+        try:
+            state = await loop.run_in_executor(executor, self.store.load, handle)
+            if state.access_token != stale and self._usable(state.access_token, state.expires_at):
+                self._adopt(state)
+                return
+            try:
+                access_token, expires_in, new_refresh_token = await self._refresh_func(state.refresh_token)
+            except RefreshTokenRejected:
+                TOKEN_REFRESHES.inc(result="failure")
+                await loop.run_in_executor(executor, self.store.clear, handle)
+                raise
+            except Exception:
+                TOKEN_REFRESHES.inc(result="failure")
+                raise
+            TOKEN_REFRESHES.inc(result="success")
+            state = TokenState(new_refresh_token or state.refresh_token, access_token, time.time() + (expires_in or 0))
+            await loop.run_in_executor(executor, self.store.save, state, handle)
+        finally:
+            self.store.release(handle)
+        self._adopt(state)
+
+    def invalidate(self, access_token: Optional[str] = None):
+        if access_token is None or access_token == self._access_token:
+            self._rejected = self._access_token
+            self._access_token = None
+            self._expires_at = 0.0
@@ -0,0 +1,232 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, NamedTuple, Optional
+
+from . import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking for the file store
+    fcntl = None
+
+DEFAULT_TOKEN_FILE = "refresh_token.txt"
+
+
+class TokenState(NamedTuple):
+    refresh_token: Optional[str]
+    access_token: Optional[str] = None
+    # Unix time the access token expires at
+    expires_at: float = 0.0
+
+
+class TokenStore(ABC):
+    """
+    Where the refresh token and the current access token live, shared by every
+    process that uses the same store.
+
+    A refresh must happen under `lock()`: load the state, refresh only if no other
+    process already did, save the result. `load` / `save` / `clear` never take the
+    lock themselves, so they can be called while holding it; pass them the handle
+    `acquire` returned, so a store whose lock is a connection (SQLite) reads and
+    writes on that connection from whichever thread the call runs on.
+    """
+
+    def acquire(self) -> Any:
+        """Take the cross-process lock; returns a handle for `release`."""
+        return None
+
+    def release(self, handle: Any):
+        pass
+
+    @contextmanager
+    def lock(self):
+        """Hold the lock for the block; yields the handle for load / save / clear."""
+        handle = self.acquire()
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    @abstractmethod
+    def load(self, handle: Any = None) -> TokenState:
+        ...
+
+    @abstractmethod
+    def save(self, state: TokenState, handle: Any = None):
+        ...
+
+    @abstractmethod
+    def clear(self, handle: Any = None):
+        """Forget everything, e.g. after the refresh token was rejected."""
+
+
+class MemoryTokenStore(TokenStore):
+    """Single-process store, for tests and benchmarks."""
+
+    def __init__(self, refresh_token: Optional[str] = None):
+        self._state = TokenState(refresh_token)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        self._lock.acquire()
+
+    def release(self, handle):
+        self._lock.release()
+
+    def load(self, handle: Any = None) -> TokenState:
+        return self._state
+
+    def save(self, state: TokenState, handle: Any = None):
+        self._state = state
+
+    def clear(self, handle: Any = None):
+        self._state = TokenState(None)
+
+
+def _atomic_write(path: str, content: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class FileTokenStore(TokenStore):
+    """
+    The refresh token stays in `path` (refresh_token.txt, as written by get_token.py);
+    the access token and its expiry go to `<path>.access`. Writes are atomic
+    (temp file + rename) and refreshes are serialized with an flock on `<path>.lock`.
+    """
+
+    def __init__(self, path: str = DEFAULT_TOKEN_FILE):
+        self.path = path
+        self.access_path = f"{path}.access"
+        self.lock_path = f"{path}.lock"
+
+    def acquire(self):
+        f = open(self.lock_path, "a+")
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return f
+
+    def release(self, handle):
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        handle.close()
+
+    def load(self, handle: Any = None) -> TokenState:
+        refresh_token = None
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                refresh_token = f.read().strip() or None
+        access_token, expires_at = None, 0.0
+        if os.path.exists(self.access_path):
+            try:
+                with open(self.access_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                access_token, expires_at = data.get("access_token"), data.get("expires_at", 0.0)
+            except ValueError:
+                pass
+        return TokenState(refresh_token, access_token, expires_at)
+
+    def save(self, state: TokenState, handle: Any = None):
+        if state.refresh_token:
+            _atomic_write(self.path, state.refresh_token)
+        _atomic_write(self.access_path, json.dumps({"access_token": state.access_token, "expires_at": state.expires_at}))
+
+    def clear(self, handle: Any = None):
+        for path in (self.path, self.access_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class SQLiteTokenStore(TokenStore):
+    """
+    One row per `name` in an SQLite database. The lock is a `BEGIN IMMEDIATE`
+    transaction, so concurrent refreshes from other processes (and other threads, each
+    on its own connection) wait for it to commit.
+    """
+
+    def __init__(self, path: str, name: str = "default", timeout: float = 30.0):
+        self.path = path
+        self.name = name
+        self.timeout = timeout
+        # The connection holding the lock, per thread: load/save/clear without a handle use
+        # it inside lock(); calls from any other thread open their own and wait for the lock
+        self._local = threading.local()
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS tokens (name TEXT PRIMARY KEY, refresh_token TEXT, "
+                         "access_token TEXT, expires_at REAL NOT NULL DEFAULT 0)")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; transactions are opened explicitly in acquire()
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+
+    def acquire(self):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            conn.close()
+            raise
+        self._local.held = conn
+        return conn
+
+    def release(self, handle):
+        self._local.held = None
+        try:
+            handle.execute("COMMIT")
+        finally:
+            handle.close()
+
+    @contextmanager
+    def _connection(self, handle: Optional[sqlite3.Connection] = None):
+        held = handle or getattr(self._local, "held", None)
+        if held is not None:
+            yield held
+            return
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def load(self, handle: Any = None) -> TokenState:
+        with self._connection(handle) as conn:
+            row = conn.execute("SELECT refresh_token, access_token, expires_at FROM tokens WHERE name = ?",
+                               (self.name,)).fetchone()
+        return TokenState(*row) if row else TokenState(None)
+
+    def save(self, state: TokenState, handle: Any = None):
+        with self._connection(handle) as conn:
+            conn.execute(
+                "INSERT INTO tokens (name, refresh_token, access_token, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET refresh_token = COALESCE(excluded.refresh_token, refresh_token), "
+                "access_token = excluded.access_token, expires_at = excluded.expires_at",
+                (self.name, state.refresh_token, state.access_token, state.expires_at))
+
+    def clear(self, handle: Any = None):
+        with self._connection(handle) as conn:
+            conn.execute("DELETE FROM tokens WHERE name = ?", (self.name,))
+
+
+def build_token_store() -> TokenStore:
+    """
+    The store configured in api/config.py:
+    TOKEN_STORE = "file" (default) or "sqlite", TOKEN_STORE_PATH = file or database path.
+    """
+    kind = getattr(config, "TOKEN_STORE", "file")
+    if kind == "sqlite":
+        return SQLiteTokenStore(getattr(config, "TOKEN_STORE_PATH", "tokens.db"))
+    if kind == "file":
+        return FileTokenStore(getattr(config, "TOKEN_STORE_PATH", DEFAULT_TOKEN_FILE))
+    raise ValueError(f"Unknown TOKEN_STORE: {kind}")
@@ -0,0 +1,136 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from . import config
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+# Seconds between a change and the write of `persist_path`; changes in between share one write
+DEFAULT_SAVE_DELAY = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+class WikiNodeCache:
+    """
+    node_token -> {"obj_token", "obj_type"} map for wiki pages, as an LRU whose
+    entries expire after `ttl` seconds.
+
+    A wiki node keeps pointing at the same document unless it is moved or deleted,
+    so entries can live long. With `persist_path` the map is loaded at startup and
+    saved (atomically) after it changes, so a restart doesn't cost a lookup per wiki
+    page. Saves run on a timer thread `save_delay` seconds after the first unsaved
+    change, never on the caller's thread (the async client calls `put` on the event
+    loop), and once more at exit.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES, persist_path: Optional[str] = None,
+                 save_delay: float = DEFAULT_SAVE_DELAY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self.save_delay = save_delay
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Serializes file writes, which happen outside _lock
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        self.hits = 0
+        self.misses = 0
+        self._load()
+        if persist_path:
+            atexit.register(self.flush)
+
+    def _load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable wiki cache file %s: %s", self.persist_path, e)
+            return
+        now = time.time()
+        for node_token, entry in entries.items():
+            if entry.get("expires_at", 0) > now:
+                self._entries[node_token] = entry
+
+    def _changed_locked(self):
+        """Note an unsaved change and make sure a save is scheduled."""
+        if not self.persist_path:
+            return
+        self._dirty = True
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Write pending changes to `persist_path` now."""
+        with self._save_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if not self._dirty:
+                    return
+                content = json.dumps(self._entries)
+                self._dirty = False
+            tmp_path = f"{self.persist_path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(content)
+                os.replace(tmp_path, self.persist_path)
+            except OSError as e:
+                logger.warning("Could not save wiki cache to %s: %s", self.persist_path, e)
+
+    def get(self, node_token: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(node_token)
+            if entry is not None and entry["expires_at"] > time.time():
+                self._entries.move_to_end(node_token)
+                self.hits += 1
+                return {"obj_token": entry["obj_token"], "obj_type": entry["obj_type"]}
+            if entry is not None:
+                del self._entries[node_token]
+            self.misses += 1
+            return None
+
+    def put(self, node_token: str, obj_token: str, obj_type: str):
+        with self._lock:
+            old = self._entries.get(node_token)
+            self._entries[node_token] = {"obj_token": obj_token, "obj_type": obj_type, "expires_at": time.time() + self.ttl}
+            self._entries.move_to_end(node_token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if old is None or (old["obj_token"], old["obj_type"]) != (obj_token, obj_type):
+                self._changed_locked()
+
+    def invalidate(self, node_token: Optional[str] = None, obj_token: Optional[str] = None):
+        """Drop a node, or every node pointing at `obj_token`."""
+        with self._lock:
+            keys = [k for k, v in self._entries.items() if k == node_token or (obj_token and v["obj_token"] == obj_token)]
+            for key in keys:
+                del self._entries[key]
+            if keys:
+                self._changed_locked()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def build_wiki_cache() -> WikiNodeCache:
+    """Build a WikiNodeCache from the optional WIKI_CACHE_* settings in api/config.py."""
+    return WikiNodeCache(
+        ttl=getattr(config, "WIKI_CACHE_TTL", DEFAULT_TTL),
+        max_entries=getattr(config, "WIKI_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+        persist_path=getattr(config, "WIKI_CACHE_PATH", None),
+        save_delay=getattr(config, "WIKI_CACHE_SAVE_DELAY", DEFAULT_SAVE_DELAY),
+    )
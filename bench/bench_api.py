@@ -0,0 +1,197 @@
+"""
+End-to-end benchmark of the async client against the local Feishu stand-in.
+
+Starts bench/mock_feishu.py in-process on a free port, then times three flows on
+synthetic documents of each size:
+
+  fetch    render a document to Markdown page by page (what /fetch-doc does)
+  create   create a document, convert Markdown, insert the blocks
+  replace  read an existing document, delete everything after the title, convert
+           and insert new content (what /create-doc with is_replace does)
+
+Results (p50 / p99 / mean latency, blocks per second, Feishu calls per run) are
+printed and written as JSON, so runs from two versions can be compared:
+
+    python bench/bench_api.py --sizes 100,5000 --repeat 5 --latency 0.01
+    python bench/bench_api.py --compare bench/results/bench_api-<before>.json
+
+By default the client-side rate limits are lifted so the numbers show the code's own
+cost; pass --respect-rate-limits to include them.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import uvicorn
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_render import make_document  # noqa: E402
+from mock_feishu import MockFeishu, build_app, add_settings_arguments, settings_from_args  # noqa: E402
+from api.feishu_async import AsyncFeishuDocAPI  # noqa: E402
+from api.doc_service import insert_markdown, render_document_markdown  # noqa: E402
+from api.markdown_convert import ConversionCache  # noqa: E402
+from api.markdown_render import parse_blocks_to_md  # noqa: E402
+from api.rate_limit import RateLimiter, DEFAULT_RATE_LIMITS  # noqa: E402
+from api.token_store import MemoryTokenStore  # noqa: E402
+
+SCENARIOS = ("fetch", "create", "replace")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(mock: MockFeishu) -> Tuple[uvicorn.Server, str]:
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(build_app(mock), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}/open-apis"
+
+
+def make_client(base_url: str, respect_rate_limits: bool) -> AsyncFeishuDocAPI:
+    client = AsyncFeishuDocAPI()
+    client.auth_base_url = client.doc_base_url = base_url
+    client.token_store = client.token_manager.store = MemoryTokenStore("bench")
+    if not respect_rate_limits:
+        client.rate_limiter = RateLimiter(limits={name: 1e6 for name in DEFAULT_RATE_LIMITS})
+    return client
+
+
+async def replace_content(client: AsyncFeishuDocAPI, document_id: str, markdown: str) -> int:
+    """The is_replace flow of /create-doc, without its fixed one-second pause."""
+    snapshot = await client.get_snapshot(document_id)
+    await client.delete_blocks_after_title(document_id, snapshot.title_block_id, snapshot=snapshot)
+    return await insert_markdown(client, document_id, markdown)
+
+
+async def run_scenario(client: AsyncFeishuDocAPI, mock: MockFeishu, scenario: str, size: int, repeat: int) -> Dict:
+    source_id = f"synthetic_{size}"
+    source = mock.seed_document(source_id, size)
+    markdown = parse_blocks_to_md({"data": {"items": make_document(size)}})
+    calls_before = sum(mock.request_counts.values())
+
+    timings = []
+    blocks = len(source.blocks)
+    for run in range(repeat):
+        # Every run converts from scratch, as a new upload would
+        client.conversion_cache = ConversionCache()
+        if scenario == "replace":
+            mock.seed_document(f"replace_{size}", size)
+        started = time.perf_counter()
+        if scenario == "fetch":
+            await render_document_markdown(client, source_id)
+        elif scenario == "create":
+            document_id = (await client.create_document("bench"))["document"]["document_id"]
+            blocks = await insert_markdown(client, document_id, markdown)
+        else:
+            blocks = await replace_content(client, f"replace_{size}", markdown)
+        timings.append(time.perf_counter() - started)
+
+    p50 = percentile(timings, 50)
+    return {
+        "scenario": scenario,
+        "size": size,
+        "blocks": blocks,
+        "runs": repeat,
+        "p50_ms": round(p50 * 1000, 2),
+        "p99_ms": round(percentile(timings, 99) * 1000, 2),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 2),
+        "blocks_per_s": round(blocks / p50, 1) if p50 else None,
+        "feishu_calls_per_run": round((sum(mock.request_counts.values()) - calls_before) / repeat, 1),
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(previous_path: str, results: List[Dict]):
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = {(r["scenario"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"\ncompared with {previous_path}:")
+    for result in results:
+        before = previous.get((result["scenario"], result["size"]))
+        if not before or not before["p50_ms"]:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"]
+        print(f"  {result['scenario']:8} {result['size']:>6}  p50 {before['p50_ms']:>10.2f} -> {result['p50_ms']:>10.2f} ms  ({ratio:.2f}x)")
+
+
+async def run(args) -> List[Dict]:
+    mock = MockFeishu(settings_from_args(args))
+    server, base_url = start_mock_server(mock)
+    client = make_client(base_url, args.respect_rate_limits)
+    results = []
+    try:
+        for size in args.sizes:
+            for scenario in args.scenarios:
+                result = await run_scenario(client, mock, scenario, size, args.repeat)
+                results.append(result)
+                print(f"{scenario:8} {size:>6} blocks  p50 {result['p50_ms']:>10.2f} ms  p99 {result['p99_ms']:>10.2f} ms  "
+                      f"{result['blocks_per_s'] or 0:>10,.0f} blocks/s  {result['feishu_calls_per_run']:>7} calls/run")
+    finally:
+        await client.aclose()
+        server.should_exit = True
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fetch / create / replace against a local Feishu stand-in.")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=[100, 5000, 50000])
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--respect-rate-limits", action="store_true")
+    parser.add_argument("--output", help="result file (default: bench/results/bench_api-<time>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare p50 latencies with")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"bench_api-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {output}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Benchmark for the block-to-Markdown renderer.
+
+Builds synthetic documents in the shape returned by the `/blocks` list API and
+times rendering them, both from a complete block list (parse_blocks_to_md) and
+streamed page by page (MarkdownRenderer.feed). Also compares the memory held by a
+whole document read as block dicts and as a BlockTree (what snapshots keep).
+
+    python bench/bench_render.py
+    python bench/bench_render.py --blocks 50000 --repeat 10
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.block_tree import BlockTree  # noqa: E402
+from api.markdown_render import MarkdownRenderer, parse_blocks_to_md, render_blocks_to_md  # noqa: E402
+
+
+def _run(content, **style):
+    run = {"content": content}
+    if style:
+        run["text_element_style"] = style
+    return {"text_run": run}
+
+
+def make_document(n_blocks: int, document_id: str = "doc") -> list:
+    """A mixed document: headings, paragraphs, nested lists, code, quotes and small tables."""
+    root = {"block_id": document_id, "block_type": 1, "parent_id": "",
+            "page": {"elements": [_run("Benchmark document")]}, "children": []}
+    blocks = [root]
+    i = 0
+    while len(blocks) < n_blocks:
+        kind = i % 8
+        block_id = f"b{i}"
+        if kind == 0:
+            block = {"block_type": 4, "heading2": {"elements": [_run(f"Section {i}")]}}
+        elif kind in (1, 2):
+            block = {"block_type": 2, "text": {"elements": [
+                _run("Plain text with "), _run("bold", bold=True), _run(" and "),
+                _run("a link", link={"url": "https%3A%2F%2Fexample.com"}), _run(f" #{i}.")]}}
+        elif kind == 3:
+            block = {"block_type": 12, "bullet": {"elements": [_run(f"bullet {i}")]}, "children": [f"{block_id}c"]}
+            blocks.append(dict(block, block_id=block_id, parent_id=document_id))
+            blocks.append({"block_id": f"{block_id}c", "parent_id": block_id, "block_type": 13,
+                           "ordered": {"elements": [_run("nested item")]}})
+            root["children"].append(block_id)
+            i += 1
+            continue
+        elif kind == 4:
+            block = {"block_type": 14, "code": {"style": {"language": 49},
+                                                "elements": [_run("def f(x):\n    return x * 2")]}}
+        elif kind == 5:
+            block = {"block_type": 15, "quote": {"elements": [_run("quoted", italic=True)]}}
+        elif kind == 6:
+            cells = [f"{block_id}c{j}" for j in range(4)]
+            blocks.append({"block_id": block_id, "parent_id": document_id, "block_type": 31, "children": cells,
+                           "table": {"cells": cells, "property": {"row_size": 2, "column_size": 2}}})
+            for cell in cells:
+                blocks.append({"block_id": cell, "parent_id": block_id, "block_type": 32, "children": [f"{cell}t"]})
+                blocks.append({"block_id": f"{cell}t", "parent_id": cell, "block_type": 2,
+                               "text": {"elements": [_run("cell")]}})
+            root["children"].append(block_id)
+            i += 1
+            continue
+        else:
+            block = {"block_type": 17, "todo": {"style": {"done": i % 2 == 0}, "elements": [_run("task")]}}
+        blocks.append(dict(block, block_id=block_id, parent_id=document_id))
+        root["children"].append(block_id)
+        i += 1
+    return blocks
+
+
+def make_deep_document(depth: int, document_id: str = "deep") -> list:
+    """A single chain of nested bullets, deeper than Python's default recursion limit."""
+    blocks = [{"block_id": document_id, "block_type": 1, "parent_id": "", "page": {"elements": []}, "children": ["d0"]}]
+    for i in range(depth):
+        blocks.append({"block_id": f"d{i}", "parent_id": blocks[-1]["block_id"], "block_type": 12,
+                       "bullet": {"elements": [_run(f"level {i}")]},
+                       "children": [f"d{i + 1}"] if i + 1 < depth else []})
+    return blocks
+
+
+# Feishu returns every style flag, so real runs carry the full set
+DEFAULT_RUN_STYLE = {"bold": False, "inline_code": False, "italic": False, "strikethrough": False, "underline": False}
+
+
+def with_default_styles(blocks: list) -> list:
+    """The document as the API returns it: default paragraph and text styles spelled out."""
+    for block in blocks:
+        for value in block.values():
+            if isinstance(value, dict) and "elements" in value:
+                value.setdefault("style", {"align": 1, "folded": False})
+                for element in value["elements"]:
+                    run = element["text_run"]
+                    run["text_element_style"] = dict(DEFAULT_RUN_STYLE, **run.get("text_element_style", {}))
+    return blocks
+
+
+def _held_bytes(build) -> int:
+    """Bytes still allocated by what `build` returns."""
+    gc.collect()
+    tracemalloc.start()
+    held = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return size
+
+
+def _time(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Markdown renderer.")
+    parser.add_argument("--blocks", type=int, default=20000)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--depth", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    blocks = make_document(args.blocks)
+    data = {"data": {"items": blocks}}
+
+    def streamed():
+        renderer = MarkdownRenderer()
+        for start in range(0, len(blocks), args.page_size):
+            renderer.feed(blocks[start:start + args.page_size])
+        renderer.finish()
+
+    full = _time(lambda: parse_blocks_to_md(data), args.repeat)
+    stream = _time(streamed, args.repeat)
+    output_size = len(parse_blocks_to_md(data))
+    print(f"blocks={len(blocks)} markdown_chars={output_size}")
+    print(f"parse_blocks_to_md   best of {args.repeat}: {full * 1000:8.2f} ms ({len(blocks) / full:,.0f} blocks/s)")
+    print(f"streamed (page={args.page_size}) best of {args.repeat}: {stream * 1000:8.2f} ms ({len(blocks) / stream:,.0f} blocks/s)")
+
+    tree = BlockTree.from_blocks(blocks)
+    tree_time = _time(lambda: render_blocks_to_md(tree.preorder()), args.repeat)
+    print(f"BlockTree.preorder   best of {args.repeat}: {tree_time * 1000:8.2f} ms ({len(blocks) / tree_time:,.0f} blocks/s)")
+
+    # Decoded from JSON page by page, like get_all_blocks / get_snapshot
+    pages = [json.dumps(with_default_styles(make_document(args.blocks))[start:start + args.page_size])
+             for start in range(0, len(blocks), args.page_size)]
+
+    def as_dicts():
+        return [block for page in pages for block in json.loads(page)]
+
+    def as_tree():
+        held = BlockTree()
+        for page in pages:
+            held.extend(json.loads(page))
+        return held
+
+    dicts_bytes, tree_bytes = _held_bytes(as_dicts), _held_bytes(as_tree)
+    print(f"held in memory: block dicts {dicts_bytes / 2**20:6.1f} MiB, "
+          f"BlockTree {tree_bytes / 2**20:6.1f} MiB ({tree_bytes / dicts_bytes:.0%})")
+
+    deep = {"data": {"items": make_deep_document(args.depth)}}
+    deep_time = _time(lambda: parse_blocks_to_md(deep), args.repeat)
+    print(f"deep document depth={args.depth} (recursion limit {sys.getrecursionlimit()}): {deep_time * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+Local stand-in for the Feishu open API, for offline benchmarks.
+
+Implements the endpoints FeishuDocAPI / AsyncFeishuDocAPI call: token refresh,
+document create / get / raw_content, paginated block listing, children listing
+(with with_descendants), Markdown convert, children and descendant insert,
+children batch_delete, batch_update and wiki get_node. Documents live in memory.
+Latency, the largest page size and throttling are configurable.
+
+    python bench/mock_feishu.py --port 9100 --latency 0.02 --qps 50
+
+Point a client at it by setting FEISHU_AUTH_BASE_URL and FEISHU_DOC_BASE_URL in
+api/config.py (or the client's auth_base_url / doc_base_url) to
+http://127.0.0.1:9100/open-apis. Seed documents are created with `seed_document`;
+any document id of the form `synthetic_<n>` is generated on first access with n blocks.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_render import make_document  # noqa: E402
+
+FREQUENCY_LIMIT_CODE = 99991400
+
+
+class MockSettings:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, max_page_size: int = 500,
+                 qps: Optional[float] = None, throttle_ratio: float = 0.0):
+        self.latency = latency                # seconds added to every response
+        self.jitter = jitter                  # extra uniform(0, jitter) seconds
+        self.max_page_size = max_page_size    # cap on /blocks page_size
+        self.qps = qps                        # per-endpoint limit; over it -> 429 + 99991400
+        self.throttle_ratio = throttle_ratio  # fraction of requests throttled at random
+
+
+class MockDocument:
+    def __init__(self, document_id: str, blocks: List[Dict]):
+        self.document_id = document_id
+        self.revision_id = 1
+        self.blocks = {block["block_id"]: block for block in blocks}
+        self._ordered: Optional[List[Dict]] = None
+
+    def ordered(self) -> List[Dict]:
+        """Blocks in document (pre-)order, as the /blocks API lists them; rebuilt after edits."""
+        if self._ordered is None:
+            ordered = []
+            stack = [self.document_id]
+            while stack:
+                block = self.blocks[stack.pop()]
+                ordered.append(block)
+                stack.extend(reversed([c for c in block.get("children", []) if c in self.blocks]))
+            self._ordered = ordered
+        return self._ordered
+
+    def touch(self):
+        self.revision_id += 1
+        self._ordered = None
+
+
+class MockFeishu:
+    def __init__(self, settings: Optional[MockSettings] = None):
+        self.settings = settings or MockSettings()
+        self.documents: Dict[str, MockDocument] = {}
+        self.request_counts: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+        self._windows: Dict[str, List[float]] = {}
+
+    def seed_document(self, document_id: str, n_blocks: int) -> MockDocument:
+        document = MockDocument(document_id, make_document(n_blocks, document_id))
+        self.documents[document_id] = document
+        return document
+
+    def document(self, document_id: str) -> Optional[MockDocument]:
+        if document_id not in self.documents and document_id.startswith("synthetic_"):
+            self.seed_document(document_id, int(document_id.split("_", 1)[1]))
+        return self.documents.get(document_id)
+
+    def _new_id(self, prefix: str = "blk") -> str:
+        return f"{prefix}{next(self._ids)}"
+
+    def _throttled(self, endpoint: str) -> bool:
+        settings = self.settings
+        if settings.throttle_ratio and random.random() < settings.throttle_ratio:
+            return True
+        if not settings.qps:
+            return False
+        now = time.monotonic()
+        window = [t for t in self._windows.get(endpoint, []) if now - t < 1.0]
+        if len(window) >= settings.qps:
+            self._windows[endpoint] = window
+            return True
+        window.append(now)
+        self._windows[endpoint] = window
+        return False
+
+    async def respond(self, endpoint: str, handler) -> JSONResponse:
+        self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+        delay = self.settings.latency + (random.uniform(0, self.settings.jitter) if self.settings.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self._throttled(endpoint):
+            return JSONResponse({"code": FREQUENCY_LIMIT_CODE, "msg": "request trigger frequency limit"},
+                                status_code=429, headers={"x-ogw-ratelimit-reset": "1"})
+        result = handler()
+        if isinstance(result, JSONResponse):
+            return result
+        return JSONResponse({"code": 0, "msg": "success", "data": result})
+
+    @staticmethod
+    def not_found(what: str) -> JSONResponse:
+        return JSONResponse({"code": 1770002, "msg": f"{what} not found"}, status_code=404)
+
+    # --- endpoint handlers ---
+
+    def refresh_token(self) -> Dict:
+        # No new refresh_token, so the client doesn't overwrite a real refresh_token.txt
+        return {"access_token": f"u-{self._new_id('tok')}", "expires_in": 7200}
+
+    def create_document(self, body: Dict) -> Dict:
+        document_id = self._new_id("doc")
+        root = {"block_id": document_id, "block_type": 1, "parent_id": "", "children": [],
+                "page": {"elements": [{"text_run": {"content": (body.get("title") or "")}}]}}
+        self.documents[document_id] = MockDocument(document_id, [root])
+        return {"document": {"document_id": document_id, "revision_id": 1, "title": body.get("title", "")}}
+
+    def get_document(self, document_id: str):
+        document = self.document(document_id)
+        if document is None:
+            return self.not_found("document")
+        return {"document": {"document_id": document_id, "revision_id": document.revision_id, "title": ""}}
+
+    def list_blocks(self, document_id: str, page_size: int, page_token: Optional[str]):
+        document = self.document(document_id)
+        if document is None:
+            return self.not_found("document")
+        page_size = max(1, min(page_size, self.settings.max_page_size))
+        start = int(page_token or 0)
+        ordered = document.ordered()
+        items = ordered[start:start + page_size]
+        has_more = start + page_size < len(ordered)
+        return {"items": items, "has_more": has_more, "page_token": str(start + page_size) if has_more else None}
+
+    def list_children(self, document_id: str, block_id: str, page_size: int, page_token: Optional[str],
+                      with_descendants: bool):
+        """Children of `block_id`; with_descendants lists every block below it, in pre-order."""
+        document = self.document(document_id)
+        if document is None or block_id not in document.blocks:
+            return self.not_found("block")
+        if with_descendants:
+            below = []
+            stack = list(reversed(document.blocks[block_id].get("children", [])))
+            while stack:
+                block = document.blocks[stack.pop()]
+                below.append(block)
+                stack.extend(reversed([c for c in block.get("children", []) if c in document.blocks]))
+        else:
+            below = [document.blocks[c] for c in document.blocks[block_id].get("children", []) if c in document.blocks]
+        page_size = max(1, min(page_size, self.settings.max_page_size))
+        start = int(page_token or 0)
+        items = below[start:start + page_size]
+        has_more = start + page_size < len(below)
+        return {"items": items, "has_more": has_more, "page_token": str(start + page_size) if has_more else None}
+
+    def raw_content(self, document_id: str):
+        document = self.document(document_id)
+        if document is None:
+            return self.not_found("document")
+        return {"content": "\n".join(str(b.get("block_id")) for b in document.ordered())}
+
+    def convert(self, body: Dict) -> Dict:
+        """
+        Every paragraph becomes a text block, lines starting with '#' become headings,
+        and a paragraph of '- ' lines becomes a bullet list, nested by indentation.
+        """
+        blocks = []
+        first_level = []
+        for paragraph in body.get("content", "").split("\n\n"):
+            if paragraph.strip() and all(line.lstrip().startswith("- ") for line in paragraph.strip("\n").split("\n")):
+                first_level.extend(self._convert_list(paragraph.strip("\n").split("\n"), blocks))
+                continue
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            block_id = self._new_id("tmp")
+            first_level.append(block_id)
+            level = len(paragraph) - len(paragraph.lstrip("#"))
+            if 1 <= level <= 9 and paragraph[level:level + 1] == " ":
+                key = f"heading{level}"
+                blocks.append({"block_id": block_id, "block_type": 2 + level,
+                               key: {"elements": [{"text_run": {"content": paragraph[level + 1:]}}]}})
+            else:
+                blocks.append({"block_id": block_id, "block_type": 2,
+                               "text": {"elements": [{"text_run": {"content": paragraph}}]}})
+        return {"blocks": blocks, "first_level_block_ids": first_level}
+
+    def _convert_list(self, lines: List[str], blocks: List[Dict]) -> List[str]:
+        """Append bullet blocks for `lines` to `blocks`; returns the top-level ids."""
+        top = []
+        # (indent, block) of the open list items
+        stack: List = []
+        for line in lines:
+            indent = len(line) - len(line.lstrip())
+            block = {"block_id": self._new_id("tmp"), "block_type": 12,
+                     "bullet": {"elements": [{"text_run": {"content": line.strip()[2:]}}]}}
+            while stack and stack[-1][0] >= indent:
+                stack.pop()
+            if stack:
+                parent = stack[-1][1]
+                block["parent_id"] = parent["block_id"]
+                parent.setdefault("children", []).append(block["block_id"])
+            else:
+                top.append(block["block_id"])
+            stack.append((indent, block))
+            blocks.append(block)
+        return top
+
+    def insert_children(self, document_id: str, parent_id: str, body: Dict):
+        document = self.document(document_id)
+        if document is None or parent_id not in document.blocks:
+            return self.not_found("block")
+        children = body.get("children", [])
+        if len(children) > 50:
+            return JSONResponse({"code": 1770001, "msg": "invalid param: too many children"}, status_code=400)
+        parent = document.blocks[parent_id]
+        created = []
+        for child in children:
+            block = {k: v for k, v in child.items() if k != "children"}
+            block["block_id"] = self._new_id()
+            block["parent_id"] = parent_id
+            document.blocks[block["block_id"]] = block
+            created.append(block)
+        siblings = parent.setdefault("children", [])
+        index = body.get("index", -1)
+        if index is None or index < 0 or index > len(siblings):
+            index = len(siblings)
+        siblings[index:index] = [block["block_id"] for block in created]
+        document.touch()
+        return {"children": created, "document_revision_id": document.revision_id, "client_token": ""}
+
+    def insert_descendants(self, document_id: str, parent_id: str, body: Dict):
+        document = self.document(document_id)
+        if document is None or parent_id not in document.blocks:
+            return self.not_found("block")
+        descendants = body.get("descendants", [])
+        children_id = body.get("children_id", [])
+        temp = {block.get("block_id"): block for block in descendants}
+        if len(descendants) > 1000 or not children_id or any(block_id not in temp for block_id in children_id):
+            return JSONResponse({"code": 1770001, "msg": "invalid param: descendants"}, status_code=400)
+        new_ids = {block_id: self._new_id() for block_id in temp}
+        created = []
+        for block_id, child in temp.items():
+            block = dict(child, block_id=new_ids[block_id])
+            if child.get("children"):
+                block["children"] = [new_ids[c] for c in child["children"] if c in new_ids]
+            document.blocks[block["block_id"]] = block
+            created.append(block)
+        for block in created:
+            for child_id in block.get("children", []):
+                document.blocks[child_id]["parent_id"] = block["block_id"]
+        for block_id in children_id:
+            document.blocks[new_ids[block_id]]["parent_id"] = parent_id
+        siblings = document.blocks[parent_id].setdefault("children", [])
+        index = body.get("index", -1)
+        if index is None or index < 0 or index > len(siblings):
+            index = len(siblings)
+        siblings[index:index] = [new_ids[block_id] for block_id in children_id]
+        document.touch()
+        relations = [{"temporary_block_id": t, "block_id": b} for t, b in new_ids.items()]
+        return {"children": created, "document_revision_id": document.revision_id,
+                "block_id_relations": relations, "client_token": ""}
+
+    def batch_delete(self, document_id: str, parent_id: str, body: Dict):
+        document = self.document(document_id)
+        if document is None or parent_id not in document.blocks:
+            return self.not_found("block")
+        siblings = document.blocks[parent_id].get("children", [])
+        start, end = body.get("start_index", 0), body.get("end_index", 0)
+        stack = siblings[start:end]
+        del siblings[start:end]
+        while stack:
+            block = document.blocks.pop(stack.pop(), None)
+            if block:
+                stack.extend(block.get("children", []))
+        document.touch()
+        return {"document_revision_id": document.revision_id, "client_token": ""}
+
+    def batch_update(self, document_id: str, body: Dict):
+        document = self.document(document_id)
+        if document is None:
+            return self.not_found("document")
+        blocks = []
+        for update in body.get("requests", []):
+            block = document.blocks.get(update.get("block_id"))
+            if block is None:
+                continue
+            elements = update.get("update_text_elements", {}).get("elements", [])
+            for key, value in block.items():
+                if isinstance(value, dict) and "elements" in value:
+                    value["elements"] = elements
+            blocks.append(block)
+        document.touch()
+        return {"blocks": blocks, "document_revision_id": document.revision_id}
+
+    def get_node(self, token: str) -> Dict:
+        return {"node": {"node_token": token, "obj_token": f"synthetic_{token.rsplit('_', 1)[-1]}"
+                         if token.startswith("wiki_") else token, "obj_type": "docx"}}
+
+
+def build_app(mock: MockFeishu) -> FastAPI:
+    app = FastAPI(title="Feishu API stand-in")
+
+    @app.post("/open-apis/authen/v1/refresh_access_token")
+    async def refresh_access_token():
+        return await mock.respond("auth.refresh", mock.refresh_token)
+
+    @app.post("/open-apis/docx/v1/documents/blocks/convert")
+    async def convert(request: Request):
+        body = await request.json()
+        return await mock.respond("docx.blocks.convert", lambda: mock.convert(body))
+
+    @app.post("/open-apis/docx/v1/documents")
+    async def create_document(request: Request):
+        body = await request.json()
+        return await mock.respond("docx.document.create", lambda: mock.create_document(body))
+
+    @app.get("/open-apis/docx/v1/documents/{document_id}")
+    async def get_document(document_id: str):
+        return await mock.respond("docx.document.get", lambda: mock.get_document(document_id))
+
+    @app.get("/open-apis/docx/v1/documents/{document_id}/raw_content")
+    async def raw_content(document_id: str):
+        return await mock.respond("docx.document.raw_content", lambda: mock.raw_content(document_id))
+
+    @app.get("/open-apis/docx/v1/documents/{document_id}/blocks")
+    async def list_blocks(document_id: str, page_size: int = 500, page_token: Optional[str] = None):
+        return await mock.respond("docx.blocks.list", lambda: mock.list_blocks(document_id, page_size, page_token))
+
+    @app.get("/open-apis/docx/v1/documents/{document_id}/blocks/{block_id}/children")
+    async def list_children(document_id: str, block_id: str, page_size: int = 500, page_token: Optional[str] = None,
+                            with_descendants: bool = False):
+        return await mock.respond("docx.blocks.children",
+                                  lambda: mock.list_children(document_id, block_id, page_size, page_token, with_descendants))
+
+    @app.post("/open-apis/docx/v1/documents/{document_id}/blocks/{block_id}/children")
+    async def insert_children(document_id: str, block_id: str, request: Request):
+        body = await request.json()
+        return await mock.respond("docx.blocks.children.create", lambda: mock.insert_children(document_id, block_id, body))
+
+    @app.post("/open-apis/docx/v1/documents/{document_id}/blocks/{block_id}/descendant")
+    async def insert_descendants(document_id: str, block_id: str, request: Request):
+        body = await request.json()
+        return await mock.respond("docx.blocks.descendant.create",
+                                  lambda: mock.insert_descendants(document_id, block_id, body))
+
+    @app.delete("/open-apis/docx/v1/documents/{document_id}/blocks/{block_id}/children/batch_delete")
+    async def batch_delete(document_id: str, block_id: str, request: Request):
+        body = await request.json()
+        return await mock.respond("docx.blocks.batch_delete", lambda: mock.batch_delete(document_id, block_id, body))
+
+    @app.patch("/open-apis/docx/v1/documents/{document_id}/blocks/batch_update")
+    async def batch_update(document_id: str, request: Request):
+        body = await request.json()
+        return await mock.respond("docx.blocks.batch_update", lambda: mock.batch_update(document_id, body))
+
+    @app.get("/open-apis/wiki/v2/spaces/get_node")
+    async def get_node(token: str):
+        return await mock.respond("wiki.node.get", lambda: mock.get_node(token))
+
+    return app
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform(0, jitter) seconds per response")
+    parser.add_argument("--max-page-size", type=int, default=500, help="cap on /blocks page_size")
+    parser.add_argument("--qps", type=float, default=None, help="per-endpoint QPS before answering 429")
+    parser.add_argument("--throttle-ratio", type=float, default=0.0, help="fraction of requests throttled at random")
+
+
+def settings_from_args(args) -> MockSettings:
+    return MockSettings(latency=args.latency, jitter=args.jitter, max_page_size=args.max_page_size,
+                        qps=args.qps, throttle_ratio=args.throttle_ratio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local Feishu API stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(build_app(MockFeishu(settings_from_args(args))), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
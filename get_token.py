@@ -2,6 +2,7 @@ import requests
 import argparse
 from urllib.parse import urlparse, parse_qs
 from api import config
+from api.token_store import build_token_store, TokenState
 
 APP_ID = config.APP_ID
 APP_SECRET = config.APP_SECRET
@@ -47,11 +48,12 @@ def get_token_from_url(redirect_url: str):
                 print(f"Response: {data}")
                 return
 
-            # Save the refresh_token for later use
-            with open("refresh_token.txt", "w") as f:
-                f.write(refresh_token)
+            # Save the refresh_token for later use (refresh_token.txt unless TOKEN_STORE says otherwise)
+            store = build_token_store()
+            with store.lock():
+                store.save(TokenState(refresh_token))
             
-            print("🎉 Success! `refresh_token.txt` has been created.")
+            print("🎉 Success! The refresh token has been saved.")
             print("You can now start the main server.")
         else:
             print(f"❌ Error: Failed to get access token: {data.get('msg')}")
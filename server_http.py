@@ -1,19 +1,120 @@
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Set
+import argparse
 import os
 import re
 import uvicorn
-import traceback
+import json
+import logging
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from urllib.parse import quote
 from api import config
 from api.create_mr import create_mr, CreateMergeRequestResponse
-from api.feishu import FeishuDocAPI, parse_blocks_to_md
+from api.feishu_async import AsyncFeishuDocAPI
+from api.doc_cache import build_document_cache
+from api.doc_store import build_doc_store
+from api.doc_watcher import build_watcher
+from api.doc_outline import build_outline_cache
+from api.events import build_event_handler, EventVerificationError
+from api.token_store import build_token_store
+from api.log import configure_logging
+from api.metrics import render_metrics, register_cache, ROUTE_REQUESTS, ROUTE_LATENCY, CONTENT_TYPE
+from api.doc_service import (
+    fetch_doc_markdown, fetch_docs_markdown, stream_doc_markdown, get_document_outline, fetch_section_markdown,
+    update_document_diff, insert_markdown, document_url, doc_file_path, DEFAULT_FETCH_CONCURRENCY,
+)
+
+# Server tunables; each can be overridden in api/config.py (SERVER_*) or on the command line
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8001
+DEFAULT_KEEP_ALIVE = 5
+DEFAULT_BACKLOG = 2048
+# Seconds to wait for in-flight requests (and create-doc uploads) when stopping
+DEFAULT_GRACEFUL_TIMEOUT = 120
+# Carries --graceful-timeout to the worker processes, which import this module afresh
+GRACEFUL_TIMEOUT_ENV = "FEISHU_DOC_GRACEFUL_TIMEOUT"
+
+
+def graceful_timeout() -> float:
+    """The shutdown drain timeout: --graceful-timeout, else SERVER_GRACEFUL_TIMEOUT, else the default."""
+    if os.environ.get(GRACEFUL_TIMEOUT_ENV):
+        return float(os.environ[GRACEFUL_TIMEOUT_ENV])
+    return getattr(config, "SERVER_GRACEFUL_TIMEOUT", DEFAULT_GRACEFUL_TIMEOUT)
 
 # --- FastAPI App Initialization ---
-app = FastAPI(title="Feishu Doc HTTP Service", description="HTTP service to fetch and convert Feishu documents")
-api_client = FeishuDocAPI()
+configure_logging()
+logger = logging.getLogger("server_http")
+
+api_client = AsyncFeishuDocAPI()
+doc_cache = build_document_cache()
+doc_store = build_doc_store()
+doc_outlines = build_outline_cache()
+register_cache("document", doc_cache)
+register_cache("outline", doc_outlines)
+watcher = build_watcher(api_client, doc_cache, doc_store)
+event_handler = build_event_handler(api_client, doc_cache, doc_store, watcher)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watcher.start()
+    yield
+    await watcher.stop()
+    await event_handler.close()
+    if _uploads:
+        timeout = graceful_timeout()
+        logger.info("Shutting down: waiting up to %ss for %d create-doc uploads", timeout, len(_uploads))
+        _, pending = await asyncio.wait(set(_uploads), timeout=timeout)
+        if pending:
+            logger.warning("Shutting down with %d create-doc uploads unfinished", len(pending))
+    await api_client.aclose()
+
+app = FastAPI(title="Feishu Doc HTTP Service", description="HTTP service to fetch and convert Feishu documents", lifespan=lifespan)
+
+@app.middleware("http")
+async def record_route_metrics(request: Request, call_next):
+    # For streaming routes this measures time to the first byte, not the whole body
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        ROUTE_LATENCY.observe(time.perf_counter() - started, route=route_path)
+        ROUTE_REQUESTS.inc(route=route_path, method=request.method, status=status)
+
+@app.post("/feishu/events")
+async def feishu_events_endpoint(request: Request):
+    """
+    Event callback URL for the Feishu app: drive file edit / trash events invalidate
+    the document's cached Markdown, revision and wiki mapping. Only served when
+    EVENT_VERIFICATION_TOKEN or EVENT_ENCRYPT_KEY is configured.
+    """
+    if not event_handler.enabled:
+        raise HTTPException(status_code=404, detail="Event callbacks are not configured")
+    try:
+        payload = event_handler.parse(await request.body(), request.headers)
+    except EventVerificationError as e:
+        logger.warning("Rejected event callback: %s", e)
+        raise HTTPException(status_code=401, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid event body")
+    return event_handler.handle(payload)
+
+@app.get("/healthz")
+async def healthz():
+    """Readiness check; answers from memory without calling Feishu."""
+    return {"status": "ok", "pid": os.getpid(), "uploads_in_flight": len(_uploads)}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
 
 # --- API Endpoints ---
 class DocRequest(BaseModel):
@@ -23,24 +124,8 @@ class DocRequest(BaseModel):
 @app.post("/fetch-doc")
 async def fetch_doc_endpoint(request: DocRequest):
     try:
-        if request.format == 'markdown':
-            md_content = api_client.get_content_as_markdown(request.url)
-        else:
-            content = api_client.get_content(request.url)
-            md_content = parse_blocks_to_md(content)
-        
-        doc_dir = "doc"
-        if not os.path.exists(doc_dir):
-            os.makedirs(doc_dir)
-        
-        # Sanitize URL to create a valid filename
-        sanitized_token = re.sub(r'[\W_]+', '-', request.url.split('/')[-1])
-        filename = f"feishu_content_{sanitized_token}.md"
-        filepath = os.path.join(doc_dir, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(md_content)
-        
+        md_content, filepath = await fetch_doc_markdown(api_client, doc_cache, doc_store, request.url, request.format)
+
         return {
             "success": True,
             "markdown_content": md_content,
@@ -49,6 +134,70 @@ async def fetch_doc_endpoint(request: DocRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/fetch-doc/stream")
+async def fetch_doc_stream_endpoint(request: DocRequest):
+    """
+    Streaming variant of /fetch-doc. Responds with NDJSON, one event per line:
+      {"type": "markdown", "content": "..."}  rendered segments as block pages arrive,
+                                             to be joined with a blank line ("\\n\\n")
+      {"type": "done", "file_path": "..."}    after the last segment
+      {"type": "error", "error": "..."}      if fetching fails midway
+    """
+    async def events():
+        try:
+            async for segment in stream_doc_markdown(api_client, doc_cache, doc_store, request.url, request.format):
+                yield json.dumps({"type": "markdown", "content": segment}, ensure_ascii=False) + "\n"
+            file_path = await doc_file_path(api_client, doc_store, request.url, request.format)
+            yield json.dumps({"type": "done", "file_path": file_path}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+class OutlineRequest(BaseModel):
+    url: str
+
+@app.post("/outline")
+async def outline_endpoint(request: OutlineRequest):
+    """Heading tree of a document (block_id, level, text, section size), cached by revision."""
+    try:
+        return {"success": True, **(await get_document_outline(api_client, doc_outlines, request.url)).to_dict()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class SectionRequest(BaseModel):
+    url: str
+    # A heading's block_id from /outline
+    block_id: str
+
+@app.post("/fetch-section")
+async def fetch_section_endpoint(request: SectionRequest):
+    """Markdown of one heading's section; only that part of the document is downloaded."""
+    try:
+        section = await fetch_section_markdown(api_client, doc_cache, doc_outlines, request.url, request.block_id)
+        return {"success": True, **section}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class DocsRequest(BaseModel):
+    urls: List[str]
+    format: Optional[str] = None
+    max_concurrency: Optional[int] = None
+
+@app.post("/fetch-docs")
+async def fetch_docs_endpoint(request: DocsRequest):
+    try:
+        max_concurrency = request.max_concurrency or getattr(config, "FETCH_DOCS_MAX_CONCURRENCY", DEFAULT_FETCH_CONCURRENCY)
+        results = await fetch_docs_markdown(api_client, doc_cache, doc_store, request.urls, request.format, max_concurrency)
+        return {
+            "success": all(result["success"] for result in results),
+            "results": results
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 class CreateMRRequest(BaseModel):
     title: str
     description: str
@@ -63,7 +212,9 @@ class CreateMRRequest(BaseModel):
 @app.post("/create-mr", response_model=CreateMergeRequestResponse)
 async def create_mr_endpoint(request: CreateMRRequest):
     try:
-        return create_mr(
+        # create_mr makes a blocking requests call; keep it off the event loop
+        return await asyncio.to_thread(
+            create_mr,
             title=request.title,
             description=request.description,
             # source_repo_id=request.source_repo_id,
@@ -82,125 +233,122 @@ class CreateDocRequest(BaseModel):
     url: str
     doc_url: Optional[str] = None
     is_replace: Optional[bool] = False
+    # "diff": update an existing document in place with the minimal block changes
+    update_mode: Optional[str] = None
+
+
+# Uploads still running; awaited on shutdown so a worker never stops halfway through
+# replacing a document (e.g. after deleting the old content, before inserting the new)
+_uploads: Set[asyncio.Task] = set()
+
+
+def _upload_done(task: asyncio.Task):
+    _uploads.discard(task)
+    # Already logged by _create_doc; retrieve it in case the request went away
+    if not task.cancelled():
+        task.exception()
 
 
 @app.post("/create-doc")
 async def create_doc_endpoint(request: CreateDocRequest):
-    print("\n" + "="*80)
-    print("[create-doc] Starting create_doc request")
-    print(f"[create-doc] File path: {request.url}")
-    print(f"[create-doc] Doc URL: {request.doc_url}")
-    print(f"[create-doc] Is replace: {request.is_replace}")
-    print("="*80 + "\n")
+    task = asyncio.ensure_future(_create_doc(request))
+    _uploads.add(task)
+    task.add_done_callback(_upload_done)
+    # A cancelled request doesn't cancel the upload itself
+    return await asyncio.shield(task)
+
+
+async def _create_doc(request: CreateDocRequest):
+    logger.info("create-doc: file=%s doc_url=%s is_replace=%s update_mode=%s",
+                request.url, request.doc_url, request.is_replace, request.update_mode)
 
     try:
         # 1. Read markdown content from the given file path
-        print(f"[create-doc] Step 1: Reading markdown file from {request.url}")
         try:
             with open(request.url, 'r', encoding='utf-8') as f:
                 markdown_content = f.read()
-            print(f"[create-doc] Successfully read {len(markdown_content)} characters from file")
+            logger.debug("create-doc: read %d characters from %s", len(markdown_content), request.url)
         except FileNotFoundError:
-            print(f"[create-doc] ERROR: File not found at path: {request.url}")
             raise HTTPException(status_code=400, detail=f"File not found at path: {request.url}")
         except Exception as e:
-            print(f"[create-doc] ERROR: Error reading file: {e}")
             raise HTTPException(status_code=500, detail=f"Error reading file: {e}")
 
         document_id = None
         # 2. Determine the document_id
         if request.doc_url:
-            print(f"[create-doc] Step 2: Using existing document from URL: {request.doc_url}")
-
             # Extract document_id from doc_url
             match = re.search(r'/docx/([a-zA-Z0-9]+)', request.doc_url)
             if match:
                 document_id = match.group(1)
-                print(f"[create-doc] Extracted document_id: {document_id}")
             else:
-                print(f"[create-doc] ERROR: Invalid doc_url format. Could not extract document_id from {request.doc_url}")
                 raise HTTPException(status_code=400, detail="Invalid doc_url format. Could not extract document_id.")
 
+            if request.update_mode == "diff":
+                changes = await update_document_diff(api_client, document_id, markdown_content)
+                final_doc_url = document_url(request.doc_url, document_id)
+                logger.info("create-doc: updated %s in place: %s", final_doc_url, changes)
+                return {"success": True, "url": final_doc_url, "changes": changes}
+
             if request.is_replace:
-                print(f"[create-doc] Step 3: Replacing existing content (is_replace=true)")
-
-                # Get all blocks
-                print(f"[create-doc] Fetching all blocks from document...")
-                all_blocks = api_client.get_all_blocks(document_id)
-                print(f"[create-doc] Retrieved {len(all_blocks)} total blocks")
-
-                if all_blocks:
-                    # Find the title block (first heading block, block_type == 3)
-                    title_block_id = None
-                    for block in all_blocks:
-                        if block.get('block_type') == 3:  # Heading block
-                            title_block_id = block.get('block_id')
-                            print(f"[create-doc] Found title block: {title_block_id}")
-                            break
+                # Read the document once; the title (first heading block) is kept
+                snapshot = await api_client.get_snapshot(document_id)
 
+                if snapshot.blocks:
                     # Delete all blocks after the title
-                    print(f"[create-doc] Deleting blocks after title...")
-                    api_client.delete_blocks_after_title(document_id, title_block_id)
-                    print(f"[create-doc] Blocks deleted successfully")
+                    await api_client.delete_blocks_after_title(document_id, snapshot.title_block_id, snapshot=snapshot)
 
                     # Wait a bit for the deletion to complete
-                    print(f"[create-doc] Waiting 1 second for deletion to complete...")
-                    import time
-                    time.sleep(1)
-                else:
-                    print(f"[create-doc] No blocks found in document")
-            else:
-                print(f"[create-doc] Step 3: Appending content (is_replace=false)")
+                    await asyncio.sleep(1)
 
         else:
-            print(f"[create-doc] Step 2: Creating new document")
             # Create a new empty document
-            new_doc_data = api_client.create_document(config.FOLDER_TOKEN)
+            new_doc_data = await api_client.create_document(config.FOLDER_TOKEN)
             document_id = new_doc_data.get("document", {}).get("document_id")
-            print(f"[create-doc] Created new document with ID: {document_id}")
+            logger.info("create-doc: created document %s", document_id)
 
         if not document_id:
-            print(f"[create-doc] ERROR: Failed to get document_id")
             raise HTTPException(status_code=500, detail="Failed to get document_id.")
 
-        # 3. Convert markdown to blocks
-        print(f"[create-doc] Step 4: Converting markdown to blocks")
-        blocks = api_client.convert_markdown_to_blocks(markdown_content)
-        print(f"[create-doc] Converted markdown to {len(blocks)} blocks")
-
-        # 4. Insert blocks into the document
-        print(f"[create-doc] Step 5: Inserting {len(blocks)} blocks into document")
-        api_client.insert_blocks(document_id, blocks)
-        print(f"[create-doc] Blocks inserted successfully")
+        # 3. Convert markdown to blocks and insert them, nested blocks with their parents
+        written = await insert_markdown(api_client, document_id, markdown_content)
 
         # Use the same domain as the input doc_url if provided
-        if request.doc_url:
-            match = re.search(r'https://([^/]+)', request.doc_url)
-            if match:
-                domain = match.group(1)
-                final_doc_url = f"https://{domain}/docx/{document_id}"
-            else:
-                final_doc_url = f"https://bytedance.larkoffice.com/docx/{document_id}"
-        else:
-            final_doc_url = f"https://bytedance.larkoffice.com/docx/{document_id}"
+        final_doc_url = document_url(request.doc_url, document_id)
 
-        print(f"[create-doc] SUCCESS: Document URL: {final_doc_url}")
-        print("="*80 + "\n")
+        logger.info("create-doc: wrote %d blocks to %s", written, final_doc_url)
 
         return {"success": True, "url": final_doc_url}
     except Exception as e:
-        print(f"[create-doc] EXCEPTION: {type(e).__name__}: {str(e)}")
-        traceback.print_exc()
-        print("="*80 + "\n")
-
         # To be safe, catch any other exceptions and return a 500 error
         if isinstance(e, HTTPException):
+            logger.warning("create-doc failed: %s", e.detail)
             raise e
+        logger.exception("create-doc failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- Server Startup Logic ---
-def run_server():
-    if not os.path.exists("refresh_token.txt"):
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Feishu Doc HTTP Service")
+    parser.add_argument("--production", action="store_true", default=getattr(config, "SERVER_PRODUCTION", False),
+                        help="run several worker processes without the auto-reloader")
+    parser.add_argument("--host", default=getattr(config, "SERVER_HOST", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=getattr(config, "SERVER_PORT", DEFAULT_PORT))
+    parser.add_argument("--workers", type=int, default=getattr(config, "SERVER_WORKERS", None),
+                        help="worker processes in production mode (default: one per CPU core)")
+    parser.add_argument("--keep-alive", type=int, default=getattr(config, "SERVER_KEEP_ALIVE", DEFAULT_KEEP_ALIVE),
+                        help="seconds to keep idle connections open")
+    parser.add_argument("--backlog", type=int, default=getattr(config, "SERVER_BACKLOG", DEFAULT_BACKLOG))
+    parser.add_argument("--limit-concurrency", type=int, default=getattr(config, "SERVER_LIMIT_CONCURRENCY", None),
+                        help="per-worker cap on open connections and tasks; beyond it requests get a 503")
+    parser.add_argument("--graceful-timeout", type=int,
+                        default=getattr(config, "SERVER_GRACEFUL_TIMEOUT", DEFAULT_GRACEFUL_TIMEOUT),
+                        help="seconds to drain in-flight requests on shutdown")
+    return parser.parse_args(argv)
+
+
+def run_server(argv=None):
+    args = parse_args(argv)
+    if not build_token_store().load().refresh_token:
         auth_url = (
             f"https://open.feishu.cn/open-apis/authen/v1/authorize"
             f"?app_id={config.APP_ID}"
@@ -219,8 +367,25 @@ def run_server():
         print("="*80)
         return # Stop server execution if token is missing
 
-    print("✅ Refresh token found. Starting server at http://0.0.0.0:8001")
-    uvicorn.run("server_http:app", host="0.0.0.0", port=8001, reload=True)
+    # Read by lifespan() in each worker, so the upload drain uses the same timeout as uvicorn
+    os.environ[GRACEFUL_TIMEOUT_ENV] = str(args.graceful_timeout)
+    options = dict(
+        host=args.host,
+        port=args.port,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        limit_concurrency=args.limit_concurrency,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    if args.production:
+        # Workers share tokens through the token store and documents through doc/;
+        # each keeps its own in-memory caches and /metrics
+        workers = args.workers or os.cpu_count() or 1
+        print(f"✅ Refresh token found. Starting {workers} workers at http://{args.host}:{args.port}")
+        uvicorn.run("server_http:app", workers=workers, **options)
+    else:
+        print(f"✅ Refresh token found. Starting server at http://{args.host}:{args.port}")
+        uvicorn.run("server_http:app", reload=True, **options)
 
 if __name__ == "__main__":
-    run_server()
\ No newline at end of file
+    run_server()
@@ -1,21 +1,49 @@
 from fastapi import HTTPException
 from pydantic import BaseModel
-from typing import Optional
-import os
+from typing import Optional, List
 import re
+import asyncio
+from contextlib import asynccontextmanager
 
 from mcp.server.fastmcp import FastMCP
-from api.feishu import FeishuDocAPI, parse_blocks_to_md
+from starlette.responses import Response
+from api.feishu_async import AsyncFeishuDocAPI
+from api.doc_cache import build_document_cache
+from api.doc_store import build_doc_store
+from api.doc_watcher import build_watcher
+from api.doc_outline import build_outline_cache
+from api.log import configure_logging
+from api.metrics import render_metrics, register_cache, instrument_tool, CONTENT_TYPE
+from api import config
+from api.doc_service import (
+    fetch_doc_markdown, fetch_docs_markdown, get_document_outline, fetch_section_markdown, update_document_diff,
+    insert_markdown, document_url, DEFAULT_FETCH_CONCURRENCY,
+)
 from api.create_mr import create_mr, CreateMergeRequestResponse
 
+configure_logging()
+
+api_client = AsyncFeishuDocAPI()
+doc_cache = build_document_cache()
+doc_store = build_doc_store()
+doc_outlines = build_outline_cache()
+register_cache("document", doc_cache)
+register_cache("outline", doc_outlines)
+watcher = build_watcher(api_client, doc_cache, doc_store)
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    # Entered once per MCP session; the watcher only starts on the first one
+    watcher.start()
+    yield
+
 mcp = FastMCP(
     "feishu_doc_mcp_service",
     host="0.0.0.0",
-    port=8000  # Running on a different port to avoid conflict with HTTP server
+    port=8000,  # Running on a different port to avoid conflict with HTTP server
+    lifespan=lifespan,
 )
 
-api_client = FeishuDocAPI()
-
 class DocRequest(BaseModel):
     url: str
     format: Optional[str] = None
@@ -24,6 +52,7 @@ class CreateDocRequest(BaseModel):
     url: str
     doc_url: Optional[str] = None
     is_replace: Optional[bool] = False
+    update_mode: Optional[str] = None
 
 class CreateMRRequest(BaseModel):
     title: str
@@ -32,7 +61,8 @@ class CreateMRRequest(BaseModel):
     target_branch: str
 
 @mcp.tool()
-def fetch_doc(url: str, format: Optional[str] = None):
+@instrument_tool
+async def fetch_doc(url: str, format: Optional[str] = None):
     """
     Fetch Feishu document content from URL and convert to Markdown.
     Args:
@@ -42,22 +72,7 @@ def fetch_doc(url: str, format: Optional[str] = None):
         A dictionary containing the success status, markdown content, and file path.
     """
     try:
-        if format == 'markdown':
-            md_content = api_client.get_content_as_markdown(url)
-        else:
-            content = api_client.get_content(url)
-            md_content = parse_blocks_to_md(content)
-
-        doc_dir = "doc"
-        if not os.path.exists(doc_dir):
-            os.makedirs(doc_dir)
-
-        sanitized_token = re.sub(r'[\W_]+', '-', url.split('/')[-1])
-        filename = f"feishu_content_{sanitized_token}.md"
-        filepath = os.path.join(doc_dir, filename)
-
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(md_content)
+        md_content, filepath = await fetch_doc_markdown(api_client, doc_cache, doc_store, url, format)
 
         return {
             "success": True,
@@ -68,19 +83,78 @@ def fetch_doc(url: str, format: Optional[str] = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 @mcp.tool()
-def create_doc(url: str, doc_url: Optional[str] = None, is_replace: Optional[bool] = False):
+@instrument_tool
+async def fetch_docs(urls: List[str], format: Optional[str] = None, max_concurrency: Optional[int] = None):
+    """
+    Fetch several Feishu documents concurrently and convert each to Markdown.
+    Args:
+        urls: The URLs of the Feishu documents.
+        format: The format to return, either 'markdown' for raw markdown or 'blocks' for structured content.
+        max_concurrency: (Optional) How many documents to fetch at the same time.
+    Returns:
+        A dictionary with an overall success flag and one result per URL, in order. Each result
+        has either markdown_content and file_path, or an error message.
+    """
+    try:
+        max_concurrency = max_concurrency or getattr(config, "FETCH_DOCS_MAX_CONCURRENCY", DEFAULT_FETCH_CONCURRENCY)
+        results = await fetch_docs_markdown(api_client, doc_cache, doc_store, urls, format, max_concurrency)
+        return {
+            "success": all(result["success"] for result in results),
+            "results": results
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@mcp.tool()
+@instrument_tool
+async def outline(url: str):
+    """
+    Get the heading outline of a Feishu document without downloading its content.
+    Args:
+        url: The URL of the Feishu document.
+    Returns:
+        A dictionary with the document title, revision_id and a tree of headings. Each heading
+        has its block_id (for fetch_section), level, text, the number of top-level blocks in its
+        section, and its sub-headings.
+    """
+    try:
+        return {"success": True, **(await get_document_outline(api_client, doc_outlines, url)).to_dict()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@mcp.tool()
+@instrument_tool
+async def fetch_section(url: str, block_id: str):
+    """
+    Fetch one section of a Feishu document as Markdown: a heading and everything below it up
+    to the next heading of the same or a higher level. Only that part of the document is downloaded.
+    Args:
+        url: The URL of the Feishu document.
+        block_id: The heading's block_id, as returned by the outline tool.
+    Returns:
+        A dictionary containing the success status, the heading text and the section's markdown content.
+    """
+    try:
+        section = await fetch_section_markdown(api_client, doc_cache, doc_outlines, url, block_id)
+        return {"success": True, **section}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@mcp.tool()
+@instrument_tool
+async def create_doc(url: str, doc_url: Optional[str] = None, is_replace: Optional[bool] = False, update_mode: Optional[str] = None):
     """
     Create a new Feishu document with markdown content from a file, or update an existing document.
     Args:
         url: The file path to the markdown file.
         doc_url: (Optional) The URL of an existing Feishu document to update.
         is_replace: (Optional) If true, replace existing content. If false, append content. Default is false.
+        update_mode: (Optional) "diff" to update an existing document in place, writing only the blocks that changed.
     Returns:
         A dictionary containing the success status and the URL of the document.
     """
-    from api import config
-    import time
-
     try:
         # 1. Read markdown content from file
         with open(url, 'r', encoding='utf-8') as f:
@@ -98,51 +172,38 @@ def create_doc(url: str, doc_url: Optional[str] = None, is_replace: Optional[boo
             else:
                 raise Exception("Invalid doc_url format. Could not extract document_id.")
 
-            if is_replace:
-                # Get all blocks and filter deletable ones
-                all_blocks = api_client.get_all_blocks(document_id)
-                if all_blocks:
-                    # Find the title block (first heading block)
-                    title_block_id = None
-                    for block in all_blocks:
-                        if block.get('block_type') == 3:  # Heading block
-                            title_block_id = block.get('block_id')
-                            break
+            if update_mode == "diff":
+                changes = await update_document_diff(api_client, document_id, markdown_content)
+                return {"success": True, "url": document_url(doc_url, document_id), "changes": changes}
 
+            if is_replace:
+                # Read the document once; the title (first heading block) is kept
+                snapshot = await api_client.get_snapshot(document_id)
+                if snapshot.blocks:
                     # Delete all blocks after the title
-                    api_client.delete_blocks_after_title(document_id, title_block_id)
-                    time.sleep(1)  # Wait for deletion to complete
+                    await api_client.delete_blocks_after_title(document_id, snapshot.title_block_id, snapshot=snapshot)
+                    await asyncio.sleep(1)  # Wait for deletion to complete
         else:
             # Create a new document
-            new_doc_data = api_client.create_document(config.FOLDER_TOKEN)
+            new_doc_data = await api_client.create_document(config.FOLDER_TOKEN)
             document_id = new_doc_data.get("document", {}).get("document_id")
 
         if not document_id:
             raise Exception("Failed to get document_id.")
 
-        # 3. Convert markdown to blocks
-        blocks = api_client.convert_markdown_to_blocks(markdown_content)
-
-        # 4. Insert blocks into the document
-        api_client.insert_blocks(document_id, blocks)
+        # 3. Convert markdown to blocks and insert them, nested blocks with their parents
+        await insert_markdown(api_client, document_id, markdown_content)
 
         # Use the same domain as the input doc_url if provided
-        if doc_url:
-            match = re.search(r'https://([^/]+)', doc_url)
-            if match:
-                domain = match.group(1)
-                result_doc_url = f"https://{domain}/docx/{document_id}"
-            else:
-                result_doc_url = f"https://bytedance.larkoffice.com/docx/{document_id}"
-        else:
-            result_doc_url = f"https://bytedance.larkoffice.com/docx/{document_id}"
+        result_doc_url = document_url(doc_url, document_id)
 
         return {"success": True, "url": result_doc_url}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @mcp.tool()
-def create_mr_mcp(title: str, description: str, source_branch: str, target_branch: str):
+@instrument_tool
+async def create_mr_mcp(title: str, description: str, source_branch: str, target_branch: str):
     """
     Create a new merge request.
     Args:
@@ -154,7 +215,9 @@ def create_mr_mcp(title: str, description: str, source_branch: str, target_branc
         A CreateMergeRequestResponse object.
     """
     try:
-        return create_mr(
+        # create_mr makes a blocking requests call; keep it off the event loop
+        return await asyncio.to_thread(
+            create_mr,
             title=title,
             description=description,
             source_branch=source_branch,
@@ -163,5 +226,18 @@ def create_mr_mcp(title: str, description: str, source_branch: str, target_branc
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@mcp.tool()
+def metrics():
+    """
+    Service metrics in Prometheus text format: Feishu call counts, latencies and
+    error codes per endpoint, tool latencies, pages per document, blocks inserted,
+    token refreshes and cache hit ratios.
+    """
+    return render_metrics()
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_route(request):
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     mcp.run(transport="streamable-http")
\ No newline at end of file
@@ -0,0 +1,44 @@
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import api.config  # noqa: F401
+except ImportError:
+    # api/config.py holds each deployment's app credentials and isn't checked in;
+    # the tests only need the settings to exist
+    import api
+
+    config = types.ModuleType("api.config")
+    config.APP_ID = "cli_test"
+    config.APP_SECRET = "secret"
+    config.FOLDER_TOKEN = "folder"
+    config.REDIRECT_URI = "http://localhost/callback"
+    config.BASE_URL = "https://open.feishu.cn/open-apis"
+    config.CREATE_MR_URL = "http://localhost/mr"
+    config.CODE_COOKIE = ""
+    config.LUMI_REPO_ID = "1"
+    sys.modules["api.config"] = config
+    api.config = config
+
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from api.feishu_async import AsyncFeishuDocAPI  # noqa: E402
+from api.token_store import MemoryTokenStore  # noqa: E402
+from mock_feishu import MockFeishu, build_app  # noqa: E402
+
+
+@pytest.fixture
+def mock_feishu():
+    """(MockFeishu, AsyncFeishuDocAPI talking to it in-process)."""
+    mock = MockFeishu()
+    client = AsyncFeishuDocAPI(client=httpx.AsyncClient(transport=httpx.ASGITransport(app=build_app(mock))))
+    client.auth_base_url = client.doc_base_url = "http://mock/open-apis"
+    client.token_store = client.token_manager.store = MemoryTokenStore("refresh")
+    return mock, client
@@ -0,0 +1,120 @@
+import asyncio
+
+from api.block_diff import plan_diff
+from api.bulk_insert import batch_payload, plan_descendant_batches
+from api.doc_service import insert_markdown, update_document_diff
+from api.markdown_convert import stitch_blocks
+
+
+def text(block_id, content, block_type=2, children=None):
+    key = {2: "text", 12: "bullet"}[block_type]
+    block = {"block_id": block_id, "block_type": block_type, key: {"elements": [{"text_run": {"content": content}}]}}
+    if children:
+        block["children"] = children
+    return block
+
+
+def by_id(*blocks):
+    return {block["block_id"]: block for block in blocks}
+
+
+def nested_list(prefix, inner="inner"):
+    """A bullet with two nested bullets, as (top-level block, block_map)."""
+    top = text(f"{prefix}1", "one", 12, [f"{prefix}2", f"{prefix}3"])
+    return top, by_id(top, text(f"{prefix}2", inner, 12), text(f"{prefix}3", "inner2", 12))
+
+
+def test_unchanged_sequence_has_no_ops():
+    old = [text("a", "x"), text("b", "y")]
+    new = [text("t1", "x"), text("t2", "y")]
+    assert plan_diff(old, new, by_id(*old), by_id(*new)) == []
+
+
+def test_edited_text_is_updated_in_place():
+    old = [text("a", "x"), text("b", "y")]
+    new = [text("t1", "x"), text("t2", "changed")]
+    ops = plan_diff(old, new, by_id(*old), by_id(*new))
+    assert [op.kind for op in ops] == ["update"]
+    assert ops[0].blocks == [("b", new[1])]
+
+
+def test_unchanged_nested_list_has_no_ops():
+    old_top, old_map = nested_list("blk")
+    new_top, new_map = nested_list("tmp")
+    old = [text("a", "x"), old_top]
+    new = [text("t0", "x"), new_top]
+    old_map.update(by_id(old[0]))
+    new_map.update(by_id(new[0]))
+    assert plan_diff(old, new, old_map, new_map) == []
+
+
+def test_edited_nested_item_replaces_its_subtree():
+    old_top, old_map = nested_list("blk")
+    new_top, new_map = nested_list("tmp", inner="changed")
+    ops = plan_diff([old_top], [new_top], old_map, new_map)
+    # A block with children can't be patched with batch_update: replace the subtree
+    assert [(op.kind, op.start, op.end) for op in ops] == [("delete", 0, 1), ("insert", 0, 0)]
+    assert ops[1].blocks == [new_top]
+
+
+def test_descendant_batches_carry_subtrees():
+    top, block_map = nested_list("tmp")
+    plain = text("tmp9", "after")
+    block_map.update(by_id(plain))
+    batches = plan_descendant_batches("doc", [top, plain], block_map, start_index=3)
+    assert len(batches) == 1
+    payload = batch_payload(batches[0])
+    assert payload["children_id"] == ["tmp1", "tmp9"]
+    assert payload["index"] == 3
+    assert [block["block_id"] for block in payload["descendants"]] == ["tmp1", "tmp2", "tmp3", "tmp9"]
+
+
+def test_stitch_keeps_first_level_ids():
+    chunk = {"blocks": [text("tmp1", "one", 12, ["tmp2"]), text("tmp2", "two", 12)], "first_level_block_ids": ["tmp1"]}
+    stitched = stitch_blocks([chunk, chunk])
+    assert stitched["first_level_block_ids"] == ["tmp1", "tmp1_1"]
+    assert stitched["blocks"][2]["children"] == ["tmp2_1"]
+
+
+def test_diff_update_keeps_nested_lists(mock_feishu):
+    mock, client = mock_feishu
+    document_id = mock.create_document({})["document"]["document_id"]
+    markdown = "# Title\n\nIntro\n\n- one\n  - inner\n  - inner2\n- two\n\nOutro\n"
+
+    async def run():
+        first = await update_document_diff(client, document_id, markdown)
+        again = await update_document_diff(client, document_id, markdown)
+        edited = await update_document_diff(client, document_id, markdown.replace("Outro", "End"))
+        return first, again, edited
+
+    first, again, edited = asyncio.run(run())
+    assert first["inserted"] == 5
+    assert again == {"changed": False, "deleted": 0, "inserted": 0, "updated": 0}
+    assert edited["updated"] == 1 and edited["inserted"] == edited["deleted"] == 0
+    document = mock.documents[document_id]
+    bullet = document.blocks[document.blocks[document_id]["children"][2]]
+    assert [document.blocks[c]["bullet"]["elements"][0]["text_run"]["content"] for c in bullet["children"]] == ["inner", "inner2"]
+    assert "docx.blocks.children.create" not in mock.request_counts
+
+
+def test_create_and_diff_paths_build_the_same_document(mock_feishu):
+    mock, client = mock_feishu
+    markdown = "# Title\n\nIntro\n\n- one\n  - inner\n    - deeper\n- two\n\nOutro\n"
+    created = mock.create_document({})["document"]["document_id"]
+    diffed = mock.create_document({})["document"]["document_id"]
+
+    async def run():
+        await insert_markdown(client, created, markdown)
+        await update_document_diff(client, diffed, markdown)
+
+    asyncio.run(run())
+
+    def shape(document_id):
+        document = mock.documents[document_id]
+        return [{k: v for k, v in block.items() if k not in ("block_id", "parent_id", "children")}
+                | {"children": len(block.get("children", []))}
+                for block in document.ordered()[1:]]
+
+    assert shape(created) == shape(diffed)
+    assert len(shape(created)) == 7
+    assert "docx.blocks.children.create" not in mock.request_counts
@@ -0,0 +1,63 @@
+import json
+
+from api.block_diff import block_fingerprint
+from api.block_tree import BlockTree
+from api.markdown_render import iter_preorder, parse_blocks_to_md, render_blocks_to_md
+from bench_render import make_deep_document, make_document, with_default_styles
+
+
+def render(items):
+    return parse_blocks_to_md({"data": {"items": items}})
+
+
+def test_rendering_matches_dicts():
+    blocks = with_default_styles(make_document(500))
+    assert render(BlockTree.from_blocks(blocks)) == render(blocks)
+
+
+def test_rendering_matches_dicts_when_built_page_by_page():
+    # Children arrive before their parents when the pages are reversed
+    blocks = make_document(300)
+    tree = BlockTree()
+    for start in reversed(range(0, len(blocks), 40)):
+        tree.extend(blocks[start:start + 40])
+    assert render(tree) == render(blocks)
+
+
+def test_deep_document():
+    blocks = make_deep_document(3000)
+    assert render(BlockTree.from_blocks(blocks)) == render(blocks)
+
+
+def test_preorder_from_roots_matches_subtree_walk():
+    blocks = make_document(200)
+    tree = BlockTree.from_blocks(blocks)
+    roots = [block_id for block_id in blocks[0]["children"] if block_id.startswith("b") and tree.children(block_id)][:3]
+    by_id = {block["block_id"]: block for block in blocks}
+    expected = []
+    for root in roots:
+        stack = [root]
+        while stack:
+            block_id = stack.pop()
+            expected.append(block_id)
+            stack.extend(reversed(by_id[block_id].get("children", [])))
+    assert [block["block_id"] for block in tree.preorder(roots)] == expected
+    assert render_blocks_to_md(tree.preorder(roots)) == render_blocks_to_md(by_id[i] for i in expected)
+
+
+def test_block_views_match_dicts():
+    blocks = make_document(100)
+    tree = BlockTree.from_blocks(blocks)
+    for block in blocks:
+        view = tree[block["block_id"]]
+        assert json.dumps(dict(view), sort_keys=True, default=list) == json.dumps(
+            {k: v for k, v in block.items() if k != "children" or v}, sort_keys=True, default=list)
+    assert [b["block_id"] for b in iter_preorder(tree)] == [b["block_id"] for b in iter_preorder(blocks)]
+
+
+def test_fingerprints_match_dicts():
+    blocks = make_document(100)
+    tree = BlockTree.from_blocks(blocks)
+    by_id = {block["block_id"]: block for block in blocks}
+    for block in blocks:
+        assert block_fingerprint(tree[block["block_id"]], tree) == block_fingerprint(block, by_id)
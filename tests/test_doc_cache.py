@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+from api.doc_cache import DocumentCache
+
+
+def test_memory_tier_hits_and_misses():
+    cache = DocumentCache()
+    cache.put("doc1", 1, "text")
+
+    assert cache.get("doc1", 1) == "text"
+    assert cache.get("doc1", 2) is None
+    assert cache.get("doc1", 1, "markdown") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_lru_is_bounded_by_bytes():
+    cache = DocumentCache(max_bytes=10)
+    cache.put("a", 1, "aaaa")
+    cache.put("b", 1, "bbbb")
+    cache.get("a", 1)  # b is now the least recently used
+    cache.put("c", 1, "cccc")
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "aaaa" and cache.get("c", 1) == "cccc"
+    assert cache.size == 8 and len(cache) == 2
+
+
+def test_disk_tier_warms_a_new_cache(tmp_path):
+    DocumentCache(disk_dir=str(tmp_path)).put("doc1", 1, "text", "markdown")
+
+    cache = DocumentCache(disk_dir=str(tmp_path))
+    assert cache.get("doc1", 1, "markdown") == "text"
+    assert cache.misses == 0
+    assert cache.get("doc1", 1) is None
+    assert cache.misses == 1
+    assert len(cache) == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_async_round_trip_through_disk(tmp_path):
+    async def run():
+        await DocumentCache(disk_dir=str(tmp_path)).put_async("doc1", 1, "text")
+        cache = DocumentCache(disk_dir=str(tmp_path))
+        return cache, await cache.get_async("doc1", 1), await cache.get_async("doc1", 1), \
+            await cache.get_async("doc1", 2)
+
+    cache, from_disk, from_memory, missing = asyncio.run(run())
+    assert from_disk == from_memory == "text"
+    assert missing is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_async_without_disk_tier_counts_misses():
+    async def run():
+        cache = DocumentCache()
+        await cache.put_async("doc1", 1, "text")
+        return cache, await cache.get_async("doc1", 1), await cache.get_async("doc2", 1)
+
+    cache, hit, miss = asyncio.run(run())
+    assert hit == "text" and miss is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_invalidate_drops_both_tiers(tmp_path):
+    cache = DocumentCache(disk_dir=str(tmp_path))
+    cache.put("doc1", 1, "one")
+    cache.put("doc1", 2, "two")
+    cache.put("doc2", 1, "other")
+
+    cache.invalidate("doc1")
+    assert cache.get("doc1", 1) is None and cache.get("doc1", 2) is None
+    assert DocumentCache(disk_dir=str(tmp_path)).get("doc2", 1) == "other"
+    assert len(os.listdir(tmp_path)) == 1
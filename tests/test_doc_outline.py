@@ -0,0 +1,38 @@
+import asyncio
+
+from api.block_tree import BlockTree
+from api.doc_outline import OutlineCache
+from api.doc_service import fetch_section_markdown
+from api.markdown_render import render_blocks_to_md
+
+
+def test_section_matches_full_render(mock_feishu):
+    mock, client = mock_feishu
+    document = mock.seed_document("docsection", 60)
+    url = "https://example.feishu.cn/docx/docsection"
+    in_flight = {"now": 0, "max": 0}
+    iter_children_pages = client.iter_children_pages
+
+    async def counting(*args, **kwargs):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        try:
+            async for page in iter_children_pages(*args, **kwargs):
+                await asyncio.sleep(0)
+                yield page
+        finally:
+            in_flight["now"] -= 1
+
+    client.iter_children_pages = counting
+    top_level = document.blocks["docsection"]["children"]
+    section = asyncio.run(fetch_section_markdown(client, None, OutlineCache(), url, top_level[0], max_concurrency=1))
+
+    # The first section runs up to the next level-2 heading, b8
+    block_ids = top_level[:top_level.index("b8")]
+    expected = render_blocks_to_md(BlockTree.from_blocks(document.ordered()).preorder(block_ids))
+    assert section["markdown_content"] == expected
+    assert "nested item" in expected and "cell" in expected
+    # The section expands a list and a table, one listing at a time
+    assert in_flight["max"] == 1
+    # One listing of the page block's children for the outline, one per expanded block
+    assert mock.request_counts["docx.blocks.children"] == 3
@@ -0,0 +1,75 @@
+import gzip
+import os
+
+import pytest
+
+from api.doc_store import DocumentStore
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_save_read_round_trip(tmp_path, compress):
+    store = DocumentStore(root=str(tmp_path), compress=compress)
+    path = store.save("doc1", "# Title\n\nbody", revision_id=3)
+
+    assert path == store.path("doc1") and os.path.exists(path)
+    assert store.read("doc1") == "# Title\n\nbody"
+    assert store.is_current("doc1", 3)
+    assert not store.is_current("doc1", 4)
+    assert not store.is_current("doc1", None)
+    assert not store.is_current("doc1", 3, "markdown")
+    if compress:
+        with gzip.open(path, "rb") as f:
+            assert f.read() == b"# Title\n\nbody"
+
+
+def test_index_is_shared_with_a_new_store(tmp_path):
+    DocumentStore(root=str(tmp_path)).save("doc1", "text", revision_id=7, fmt="markdown")
+
+    store = DocumentStore(root=str(tmp_path))
+    assert store.is_current("doc1", 7, "markdown")
+    assert store.read("doc1", "markdown") == "text"
+    assert store.get("doc1", "markdown")["bytes"] == len("text")
+
+
+def test_unchanged_saves_leave_the_file_alone(tmp_path):
+    store = DocumentStore(root=str(tmp_path))
+    store.save("doc1", "text", revision_id=1)
+    mtime = os.stat(store.path("doc1")).st_mtime_ns
+
+    store.save("doc1", "text", revision_id=1)  # same revision
+    store.save("doc1", "text", revision_id=2)  # same content, new revision
+    assert (store.writes, store.skipped) == (1, 2)
+    assert os.stat(store.path("doc1")).st_mtime_ns == mtime
+    assert store.is_current("doc1", 2)
+
+    store.save("doc1", "changed", revision_id=3)
+    assert store.writes == 2 and store.read("doc1") == "changed"
+
+
+def test_writer_commit_and_abort(tmp_path):
+    store = DocumentStore(root=str(tmp_path))
+    pending = store.writer("doc1", 5)
+    pending.write("part one")
+    pending.write("part two")
+    assert pending.commit()
+    assert store.read("doc1") == "part one\n\npart two"
+    assert store.is_current("doc1", 5)
+
+    pending = store.writer("doc1", 6)
+    pending.write("half")
+    pending.abort()
+    assert store.read("doc1") == "part one\n\npart two"
+    assert not store.is_current("doc1", 6)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+
+
+def test_invalidate_keeps_the_file_but_forgets_the_revision(tmp_path):
+    store = DocumentStore(root=str(tmp_path))
+    store.save("doc1", "text", revision_id=1)
+    store.save("doc1", "raw", revision_id=1, fmt="markdown")
+    store.save("doc2", "other", revision_id=1)
+
+    store.invalidate("doc1")
+    assert not store.is_current("doc1", 1) and not store.is_current("doc1", 1, "markdown")
+    assert store.read("doc1") == "text"
+    assert DocumentStore(root=str(tmp_path)).is_current("doc2", 1)
@@ -0,0 +1,131 @@
+import json
+import uuid
+
+import pytest
+
+from api.doc_cache import DocumentCache
+from api.doc_store import DocumentStore
+from api.events import (
+    DocumentEventHandler, EventVerificationError, decrypt_event, encrypt_event, event_signature,
+)
+from api.wiki_cache import WikiNodeCache
+
+KEY = "encrypt-key"
+TOKEN = "verification-token"
+
+
+class Client:
+    """The parts of AsyncFeishuDocAPI the handler touches when invalidating."""
+
+    def __init__(self):
+        self.wiki_cache = WikiNodeCache()
+
+
+def make_handler(tmp_path, verification_token=TOKEN, encrypt_key=KEY):
+    return DocumentEventHandler(Client(), DocumentCache(), DocumentStore(str(tmp_path / "doc")),
+                                verification_token=verification_token, encrypt_key=encrypt_key)
+
+
+def edit_event(file_token="doxcnAbc", event_id=None, token=TOKEN):
+    return {
+        "schema": "2.0",
+        "header": {"event_id": event_id or uuid.uuid4().hex, "event_type": "drive.file.edit_v1", "token": token},
+        "event": {"file_token": file_token, "file_type": "docx"},
+    }
+
+
+def signed(payload, key=KEY):
+    body = json.dumps({"encrypt": encrypt_event(payload, key)}).encode("utf-8")
+    headers = {"x-lark-request-timestamp": "1700000000", "x-lark-request-nonce": "nonce"}
+    headers["x-lark-signature"] = event_signature("1700000000", "nonce", key, body)
+    return body, headers
+
+
+def test_encrypt_decrypt_round_trip():
+    payload = {"type": "url_verification", "challenge": "c", "token": "t", "text": "飞书"}
+    assert decrypt_event(encrypt_event(payload, KEY), KEY) == payload
+
+
+def test_decrypt_with_wrong_key_fails():
+    with pytest.raises(Exception):
+        decrypt_event(encrypt_event({"a": 1}, KEY), "other-key")
+
+
+def test_parse_signed_event(tmp_path):
+    payload = edit_event()
+    assert make_handler(tmp_path).parse(*signed(payload)) == payload
+
+
+def test_parse_rejects_bad_signature(tmp_path):
+    body, headers = signed(edit_event())
+    headers["x-lark-signature"] = "0" * 64
+    with pytest.raises(EventVerificationError):
+        make_handler(tmp_path).parse(body, headers)
+
+
+def test_parse_rejects_tampered_body(tmp_path):
+    body, headers = signed(edit_event())
+    _, other_headers = signed(edit_event())
+    headers["x-lark-signature"] = other_headers["x-lark-signature"]
+    with pytest.raises(EventVerificationError):
+        make_handler(tmp_path).parse(body, headers)
+
+
+def test_parse_rejects_unencrypted_or_unsigned(tmp_path):
+    handler = make_handler(tmp_path)
+    with pytest.raises(EventVerificationError):
+        handler.parse(json.dumps(edit_event()).encode("utf-8"), {})
+    body, _headers = signed(edit_event())
+    with pytest.raises(EventVerificationError):
+        handler.parse(body, {})
+
+
+def test_url_verification_needs_no_signature(tmp_path):
+    handler = make_handler(tmp_path)
+    payload = {"type": "url_verification", "challenge": "abc", "token": TOKEN}
+    body = json.dumps({"encrypt": encrypt_event(payload, KEY)}).encode("utf-8")
+    assert handler.handle(handler.parse(body, {})) == {"challenge": "abc"}
+
+
+def test_parse_checks_verification_token(tmp_path):
+    handler = make_handler(tmp_path, encrypt_key=None)
+    ok = edit_event()
+    assert handler.parse(json.dumps(ok).encode("utf-8"), {}) == ok
+    with pytest.raises(EventVerificationError):
+        handler.parse(json.dumps(edit_event(token="wrong")).encode("utf-8"), {})
+    with pytest.raises(EventVerificationError):
+        handler.parse(json.dumps({"encrypt": encrypt_event(ok, KEY)}).encode("utf-8"), {})
+
+
+def test_unconfigured_handler_rejects_everything(tmp_path):
+    handler = make_handler(tmp_path, verification_token=None, encrypt_key=None)
+    assert not handler.enabled
+    with pytest.raises(EventVerificationError):
+        handler.parse(json.dumps(edit_event(token=None)).encode("utf-8"), {})
+    with pytest.raises(EventVerificationError):
+        handler.parse(json.dumps({"type": "url_verification", "challenge": "c"}).encode("utf-8"), {})
+
+
+def test_duplicate_deliveries_are_dropped(tmp_path):
+    handler = make_handler(tmp_path)
+    invalidated = []
+    handler.invalidate = lambda document_id: invalidated.append(document_id) or False
+
+    event = edit_event("doxcnA", event_id="evt-1")
+    for _ in range(3):
+        assert handler.handle(event) == {}
+    handler.handle(edit_event("doxcnB", event_id="evt-2"))
+    assert invalidated == ["doxcnA", "doxcnB"]
+
+
+def test_edit_event_drops_cached_revision(tmp_path):
+    handler = make_handler(tmp_path)
+    handler.cache.latest_ttl = 60
+    handler.cache.set_latest("doxcnA", 5)
+    handler.cache.put("doxcnA", 5, "# cached")
+    handler.api_client.wiki_cache.put("wikiNode", "doxcnA", "docx")
+
+    assert handler.invalidate("doxcnA") is True
+    assert handler.cache.latest("doxcnA") is None
+    assert handler.cache.get("doxcnA", 5) is None
+    assert handler.api_client.wiki_cache.get("wikiNode") is None
@@ -0,0 +1,59 @@
+from api.markdown_convert import split_markdown
+
+
+def _document(sections: int) -> str:
+    parts = []
+    for n in range(sections):
+        parts.append(f"## Section {n}\n\nIntro {n}.\n\n### Detail {n}\n\n- item\n- item\n\n#### Note\n\ntext {n}\n\n")
+    return "# Title\n\n" + "".join(parts)
+
+
+def test_split_joins_back_to_input():
+    markdown = _document(200)
+    chunks = split_markdown(markdown, max_chars=2000)
+    assert "".join(chunks) == markdown
+    assert all(len(chunk) <= 2000 for chunk in chunks)
+
+
+def test_sections_are_packed_up_to_max_chars():
+    markdown = _document(200)
+    assert split_markdown(markdown) == [markdown]
+    # Every chunk but the last is full enough that the next section didn't fit
+    chunks = split_markdown(markdown, max_chars=2000)
+    assert len(chunks) < len(markdown) // 1000
+
+
+def test_split_only_at_first_and_second_level_headings():
+    markdown = "# A\n\ntext\n\n### B\n\nmore\n\n## C\n\nend\n"
+    chunks = split_markdown(markdown, max_chars=30)
+    assert chunks == ["# A\n\ntext\n\n### B\n\nmore\n\n", "## C\n\nend\n"]
+
+
+def test_heading_inside_fence_is_not_a_split_point():
+    markdown = "# A\n\n```\n# not a heading\n```\n\n## B\n"
+    assert split_markdown(markdown, max_chars=32) == ["# A\n\n```\n# not a heading\n```\n\n", "## B\n"]
+
+
+def test_large_sections_stay_within_max_chars():
+    paragraphs = "".join(f"Paragraph {n} " + "x" * (40 + n % 70) + "\n\n" for n in range(200))
+    markdown = "# A\n\n" + paragraphs + "## B\n\n- item\n  more\n\n" + paragraphs
+    for max_chars in (300, 1000, 4000):
+        chunks = split_markdown(markdown, max_chars=max_chars)
+        assert "".join(chunks) == markdown
+        assert all(len(chunk) <= max_chars for chunk in chunks)
+
+
+def test_block_longer_than_max_chars_is_cut_between_lines():
+    long_list = "".join(f"- item {n} " + "y" * 30 + "\n" for n in range(60))
+    markdown = "# A\n\nintro\n\n" + long_list + "\nAfter\n"
+    chunks = split_markdown(markdown, max_chars=500)
+    assert "".join(chunks) == markdown
+    assert all(len(chunk) <= 500 for chunk in chunks)
+
+
+def test_only_a_single_overlong_line_exceeds_max_chars():
+    line = "z" * 700 + "\n"
+    markdown = "# A\n\nshort\n\n" + line + "\nend\n"
+    chunks = split_markdown(markdown, max_chars=100)
+    assert "".join(chunks) == markdown
+    assert [chunk for chunk in chunks if len(chunk) > 100] == [line]
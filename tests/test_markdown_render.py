@@ -0,0 +1,82 @@
+from api.markdown_render import MarkdownRenderer, iter_preorder, parse_blocks_to_md, render_blocks_to_md
+from bench_render import make_deep_document
+
+
+def run(content):
+    return {"text_run": {"content": content}}
+
+
+def block(block_id, parent_id, block_type, key, content, children=None):
+    result = {"block_id": block_id, "parent_id": parent_id, "block_type": block_type,
+              key: {"elements": [run(content)]}}
+    if children:
+        result["children"] = children
+    return result
+
+
+def cell(block_id, children):
+    return {"block_id": block_id, "parent_id": "t", "block_type": 32, "children": children}
+
+
+ITEMS = [
+    {"block_id": "doc", "parent_id": "", "block_type": 1, "page": {"elements": [run("Doc")]},
+     "children": ["b1", "o1", "o2", "t"]},
+    block("b1", "doc", 12, "bullet", "top", ["b2", "o3"]),
+    block("b2", "b1", 12, "bullet", "child", ["b3"]),
+    block("b3", "b2", 12, "bullet", "grandchild"),
+    block("o3", "b1", 13, "ordered", "numbered under bullet"),
+    block("o1", "doc", 13, "ordered", "first", ["o1a"]),
+    block("o1a", "o1", 13, "ordered", "first.a"),
+    block("o2", "doc", 13, "ordered", "second"),
+    {"block_id": "t", "parent_id": "doc", "block_type": 31, "children": ["c1", "c2", "c3", "c4"],
+     "table": {"cells": ["c1", "c2", "c3", "c4"], "property": {"row_size": 2, "column_size": 2}}},
+    cell("c1", ["c1t"]), block("c1t", "c1", 2, "text", "Name"),
+    cell("c2", ["c2t"]), block("c2t", "c2", 2, "text", "Value"),
+    cell("c3", ["c3t", "c3u"]), block("c3t", "c3", 2, "text", "a|b"), block("c3u", "c3", 2, "text", "line2"),
+    cell("c4", ["c4t"]), block("c4t", "c4", 12, "bullet", "item"),
+]
+
+EXPECTED = """# Doc
+
+- top
+
+  - child
+
+    - grandchild
+
+  1. numbered under bullet
+
+1. first
+
+   1. first.a
+
+2. second
+
+| Name | Value |
+| --- | --- |
+| a\\|b<br>line2 | - item |"""
+
+
+def test_nested_lists_and_table():
+    assert parse_blocks_to_md({"data": {"items": ITEMS}}) == EXPECTED
+
+
+def test_input_order_does_not_matter():
+    assert parse_blocks_to_md({"data": {"items": list(reversed(ITEMS))}}) == EXPECTED
+
+
+def test_feeding_pages_matches_one_pass():
+    ordered = list(iter_preorder(ITEMS))
+    renderer = MarkdownRenderer()
+    segments = []
+    for start in range(0, len(ordered), 3):
+        segments.extend(renderer.feed(ordered[start:start + 3]))
+    segments.extend(renderer.finish())
+    assert "\n\n".join(segments) == render_blocks_to_md(ordered) == EXPECTED
+
+
+def test_deep_nesting_has_no_recursion_limit():
+    markdown = parse_blocks_to_md({"data": {"items": make_deep_document(3000)}})
+    lines = markdown.split("\n\n")
+    assert len(lines) == 3000
+    assert lines[-1] == "  " * 2999 + "- level 2999"
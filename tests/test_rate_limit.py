@@ -0,0 +1,87 @@
+import threading
+
+import httpx
+import pytest
+
+from api.rate_limit import FREQUENCY_LIMIT_CODE, RateLimiter, TokenBucket, endpoint_for
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def throttled(headers=None, status_code=429):
+    return httpx.Response(status_code, json={"code": FREQUENCY_LIMIT_CODE, "msg": "limit"}, headers=headers or {})
+
+
+def test_bucket_spends_burst_then_waits():
+    clock = FakeClock()
+    bucket = TokenBucket(5, clock=clock)
+    assert [bucket.reserve() for _ in range(5)] == [0.0] * 5
+    # Each further reservation waits one more refill interval
+    assert [bucket.reserve() for _ in range(3)] == pytest.approx([0.2, 0.4, 0.6])
+
+
+def test_bucket_refills_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(5, clock=clock)
+    for _ in range(5):
+        bucket.reserve()
+    clock.advance(0.4)
+    assert [bucket.reserve() for _ in range(3)] == pytest.approx([0.0, 0.0, 0.2])
+    clock.advance(60)
+    # Idle time refills at most `capacity` tokens
+    assert [bucket.reserve() for _ in range(6)] == pytest.approx([0.0] * 5 + [0.2])
+
+
+def test_retry_after_pauses_the_endpoint():
+    clock = FakeClock()
+    limiter = RateLimiter({"docx.blocks.list": 5}, backoff_base=0.01, clock=clock)
+    limiter.acquire("docx.blocks.list")
+    delay = limiter.throttle_delay("docx.blocks.list", throttled({"Retry-After": "3"}), attempt=0)
+    assert delay == pytest.approx(3.0)
+    # Every caller of the endpoint now waits out the reset, other endpoints don't
+    assert limiter._bucket("docx.blocks.list").reserve() == pytest.approx(3.0)
+    assert limiter._bucket("docx.blocks.convert").reserve() == 0.0
+    clock.advance(3.0)
+    assert limiter._bucket("docx.blocks.list").reserve() == 0.0
+
+
+def test_ratelimit_reset_header_and_exponential_backoff():
+    limiter = RateLimiter(backoff_base=0.5, backoff_cap=4.0, max_retries=3, clock=FakeClock())
+    response = throttled({"x-ogw-ratelimit-reset": "2"}, status_code=400)
+    assert limiter.throttle_delay("default", response, attempt=0) == pytest.approx(2.0)
+    for attempt in range(3):
+        assert 0 <= limiter.throttle_delay("default", throttled(), attempt) <= min(4.0, 0.5 * 2 ** attempt)
+    # Retries used up, or not a throttling response
+    assert limiter.throttle_delay("default", throttled(), attempt=3) is None
+    assert limiter.throttle_delay("default", httpx.Response(200, json={"code": 0}), attempt=0) is None
+    stats = limiter.stats()["default"]
+    assert stats["server_throttled"] == 5 and stats["retries"] == 4
+
+
+def test_stats_count_every_call_under_concurrency():
+    limiter = RateLimiter({"default": 1e9}, clock=FakeClock())
+
+    def worker():
+        for _ in range(2000):
+            limiter._reserve("default")
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.stats()["default"]["requests"] == 16000
+
+
+def test_endpoint_for_maps_descendant_create():
+    url = "https://open.feishu.cn/open-apis/docx/v1/documents/doc/blocks/doc/descendant?x=1"
+    assert endpoint_for("POST", url) == "docx.blocks.descendant.create"
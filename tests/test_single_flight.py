@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from api.single_flight import AsyncSingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": len(calls)}
+
+    async def run():
+        results = await asyncio.gather(*(flights.do("doc", load) for _ in range(10)))
+        assert flights.in_flight() == 0
+        again = await flights.do("doc", load)
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert calls == [1, 1]
+    assert all(result is results[0] for result in results)
+    assert results[0] == {"value": 1} and again == {"value": 2}
+
+
+def test_exception_reaches_every_waiter_and_clears_the_key():
+    flights = AsyncSingleFlight()
+    attempts = []
+
+    async def fail():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def succeed():
+        return "ok"
+
+    async def run():
+        results = await asyncio.gather(*(flights.do("doc", fail) for _ in range(5)), return_exceptions=True)
+        assert flights.in_flight() == 0
+        return results, await flights.do("doc", succeed)
+
+    results, retried = asyncio.run(run())
+    assert len(attempts) == 1
+    assert all(isinstance(result, ValueError) and str(result) == "boom" for result in results)
+    assert retried == "ok"
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    flights = AsyncSingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(flights.do("doc", load))
+        second = asyncio.ensure_future(flights.do("doc", load))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "done"
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api.token_manager import AsyncTokenManager, RefreshTokenRejected, TokenManager
+from api.token_store import FileTokenStore, SQLiteTokenStore, TokenState, TokenStore
+
+
+def make_store(kind, tmp_path):
+    if kind == "file":
+        return FileTokenStore(str(tmp_path / "refresh_token.txt"))
+    return SQLiteTokenStore(str(tmp_path / "tokens.db"))
+
+
+@pytest.mark.parametrize("kind", ["file", "sqlite"])
+def test_concurrent_refresh_happens_once(kind, tmp_path):
+    make_store(kind, tmp_path).save(TokenState("r0"))
+    calls = []
+
+    def refresh(refresh_token):
+        calls.append(refresh_token)
+        time.sleep(0.05)
+        return f"access-{len(calls)}", 7200, f"r{len(calls)}"
+
+    # One manager and store instance per worker, like separate processes sharing the store
+    managers = [TokenManager(refresh, make_store(kind, tmp_path)) for _ in range(6)]
+    tokens = []
+    threads = [threading.Thread(target=lambda m=m: tokens.append(m.get_token())) for m in managers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["r0"]
+    assert tokens == ["access-1"] * 6
+    state = make_store(kind, tmp_path).load()
+    assert state.refresh_token == "r1" and state.access_token == "access-1"
+
+
+@pytest.mark.parametrize("kind", ["file", "sqlite"])
+def test_refresh_after_invalidate_rotates_token(kind, tmp_path):
+    store = make_store(kind, tmp_path)
+    store.save(TokenState("r0"))
+    results = iter([("a1", 7200, "r1"), ("a2", 7200, "r2")])
+    manager = TokenManager(lambda refresh_token: next(results), store)
+    assert manager.get_token() == "a1"
+    manager.invalidate("a1")
+    assert manager.get_token() == "a2"
+    assert store.load().refresh_token == "r2"
+
+
+@pytest.mark.parametrize("kind", ["file", "sqlite"])
+def test_async_concurrent_refresh_happens_once(kind, tmp_path):
+    make_store(kind, tmp_path).save(TokenState("r0"))
+    calls = []
+
+    async def refresh(refresh_token):
+        calls.append(refresh_token)
+        await asyncio.sleep(0.05)
+        return f"access-{len(calls)}", 7200, f"r{len(calls)}"
+
+    async def run():
+        managers = [AsyncTokenManager(refresh, make_store(kind, tmp_path)) for _ in range(6)]
+        return await asyncio.gather(*(m.get_token() for m in managers))
+
+    assert asyncio.run(run()) == ["access-1"] * 6
+    assert calls == ["r0"]
+    state = make_store(kind, tmp_path).load()
+    assert state.refresh_token == "r1" and state.access_token == "access-1"
+
+
+def test_async_sqlite_refresh_uses_the_locked_connection(tmp_path):
+    # The lock is taken in a worker thread; the store calls must not wait on it
+    store = SQLiteTokenStore(str(tmp_path / "tokens.db"), timeout=2)
+    store.save(TokenState("r0"))
+
+    async def refresh(refresh_token):
+        return "a1", 7200, "r1"
+
+    started = time.monotonic()
+    assert asyncio.run(AsyncTokenManager(refresh, store).get_token()) == "a1"
+    assert time.monotonic() - started < 1
+    assert store.load() == TokenState("r1", "a1", store.load().expires_at)
+
+
+@pytest.mark.parametrize("kind", ["file", "sqlite"])
+def test_rejected_refresh_token_clears_store(kind, tmp_path):
+    store = make_store(kind, tmp_path)
+    store.save(TokenState("dead", "old", 1.0))
+
+    async def refresh(refresh_token):
+        raise RefreshTokenRejected("expired")
+
+    with pytest.raises(RefreshTokenRejected):
+        asyncio.run(AsyncTokenManager(refresh, store).get_token())
+    assert store.load() == TokenState(None)
+
+    def sync_refresh(refresh_token):
+        raise RefreshTokenRejected("expired")
+
+    store.save(TokenState("dead", "old", 1.0))
+    with pytest.raises(RefreshTokenRejected):
+        TokenManager(sync_refresh, store).get_token()
+    assert store.load() == TokenState(None)
+
+
+def test_sqlite_lock_blocks_other_threads(tmp_path):
+    store = SQLiteTokenStore(str(tmp_path / "tokens.db"), timeout=5)
+    store.save(TokenState("r0"))
+    order = []
+
+    def writer():
+        store.save(TokenState("from-thread", "x", 1.0))
+        order.append("thread saved")
+
+    with store.lock():
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(0.2)
+        # The other thread waits for the lock instead of writing inside our transaction
+        assert order == []
+        assert store.load().refresh_token == "r0"
+        store.save(TokenState("holder", "y", 2.0))
+        order.append("holder saved")
+    thread.join()
+
+    assert order == ["holder saved", "thread saved"]
+    assert store.load().refresh_token == "from-thread"
+
+
+def test_token_store_is_abstract():
+    with pytest.raises(TypeError):
+        TokenStore()
@@ -0,0 +1,42 @@
+import json
+
+from api.wiki_cache import WikiNodeCache
+
+
+def test_put_defers_save(tmp_path):
+    path = tmp_path / "wiki.json"
+    cache = WikiNodeCache(persist_path=str(path), save_delay=60)
+
+    cache.put("node1", "doc1", "docx")
+    cache.put("node2", "doc2", "docx")
+    # Nothing is written on the caller's thread
+    assert not path.exists()
+
+    cache.flush()
+    assert set(json.loads(path.read_text())) == {"node1", "node2"}
+    assert WikiNodeCache(persist_path=str(path)).get("node2") == {"obj_token": "doc2", "obj_type": "docx"}
+
+
+def test_unchanged_put_does_not_save(tmp_path):
+    path = tmp_path / "wiki.json"
+    cache = WikiNodeCache(persist_path=str(path), save_delay=60)
+    cache.put("node1", "doc1", "docx")
+    cache.flush()
+    mtime = path.stat().st_mtime_ns
+
+    cache.put("node1", "doc1", "docx")
+    assert not cache._dirty
+    cache.flush()
+    assert path.stat().st_mtime_ns == mtime
+
+
+def test_timer_writes_pending_changes(tmp_path):
+    path = tmp_path / "wiki.json"
+    cache = WikiNodeCache(persist_path=str(path), save_delay=0.05)
+    cache.put("node1", "doc1", "docx")
+    cache._save_timer.join(5)
+    assert json.loads(path.read_text())["node1"]["obj_token"] == "doc1"
+
+    cache.invalidate(obj_token="doc1")
+    cache._save_timer.join(5)
+    assert json.loads(path.read_text()) == {}